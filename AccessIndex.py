@@ -0,0 +1,180 @@
+import os
+from io import BytesIO
+import numpy as np
+import pandas as pd
+from MainDB import MainDB
+
+
+class AccessIndex:
+
+    def __init__(self, journals:list):
+        """
+        Journal x university access matrix stored as bits: one row of packed bits (one bit per journal,
+        in the order of journals) for every university. Universities can be added one at a time.
+        """
+        self.journals = list(journals)
+        self.journalPos = {journal: i for i, journal in enumerate(self.journals)}
+        assert len(self.journalPos) == len(self.journals), "journals must not contain duplicates"
+
+        self.universities = []
+        self.uniPos = {}
+        self.bits = np.zeros((8, -(-len(self.journals) // 8)), dtype=np.uint8)
+
+    @classmethod
+    def fromMainDB(cls, mainDB:MainDB, journals:list=None) -> "AccessIndex":
+        """
+        Builds the index from mainDB.csv, streamed chunk by chunk.
+        journals defaults to every journal in mainDB.csv (sorted), which costs an extra pass over the journal column.
+        returns: AccessIndex
+        """
+        if journals is None:
+            journals = set()
+            for chunk in mainDB.iterChunks(["journal"]):
+                journals.update(chunk["journal"].cat.categories.astype(str))
+            journals = sorted(journals)
+
+        index = cls(journals)
+        for chunk in mainDB.iterChunks(["university", "journal", "access"]):
+            for university, rows in chunk.groupby("university", observed=True):
+                index.addAccess(str(university), rows["journal"].astype(str), rows["access"].values)
+
+        return index
+
+    @classmethod
+    def fromUniversityCSVs(cls, paths:list, journals:list) -> "AccessIndex":
+        """
+        Builds the index from per university csv files such as data/from-GDrive/{uniName}.csv
+        returns: AccessIndex
+        """
+        index = cls(journals)
+        for path in paths:
+            index.addUniversityCSV(path)
+
+        return index
+
+    @classmethod
+    def fromBytes(cls, content:bytes) -> "AccessIndex":
+        """
+        returns: AccessIndex saved by toBytes()
+        """
+        with np.load(BytesIO(content), allow_pickle=False) as npz:
+            index = cls([str(journal) for journal in npz["journals"]])
+            universities = [str(university) for university in npz["universities"]]
+            bits = npz["bits"]
+        index.universities = universities
+        index.uniPos = {university: i for i, university in enumerate(universities)}
+        index.bits = np.concatenate([bits, np.zeros((max(8, len(bits)), bits.shape[1]), dtype=np.uint8)])
+
+        return index
+
+    def toBytes(self) -> bytes:
+        """
+        returns: the index (journals, universities and their rows of bits) as a compressed .npz file
+        """
+        f = BytesIO()
+        np.savez_compressed(f, journals=np.array(self.journals, dtype=str),
+                            universities=np.array(self.universities, dtype=str), bits=self.bits[:len(self.universities)])
+        return f.getvalue()
+
+    def hasJournals(self, journals) -> bool:
+        """
+        returns: True if every journal in journals has a bit in the index, False otherwise
+        """
+        return all(journal in self.journalPos for journal in journals)
+
+    def getUniPos(self, university:str) -> int:
+        """
+        returns: row of university in the bit matrix, adding an empty row if university is new
+        """
+        if university not in self.uniPos:
+            if len(self.universities) == len(self.bits):
+                self.bits = np.concatenate([self.bits, np.zeros_like(self.bits)])
+            self.uniPos[university] = len(self.universities)
+            self.universities.append(university)
+
+        return self.uniPos[university]
+
+    def addAccess(self, university:str, journals, access):
+        """
+        Sets the bits of university for every journal in journals with access == 1.
+        Journals that are not in the index are ignored.
+        """
+        uniPos = self.getUniPos(university)
+        positions = pd.Series(list(journals)).map(self.journalPos)
+        hasAccess = (pd.to_numeric(pd.Series(np.asarray(access)), errors="coerce") == 1).values & positions.notnull().values
+        positions = positions[hasAccess].astype(np.int64).values
+
+        np.bitwise_or.at(self.bits[uniPos], positions >> 3, (0x80 >> (positions & 7)).astype(np.uint8))
+
+    def addUniversity(self, university:str, df:pd.DataFrame):
+        """
+        Adds (or replaces) the access of university from a df with journal and access columns,
+        e.g. a sheet merged to mainDB.csv. Only the row of university is touched.
+        """
+        uniPos = self.getUniPos(university)
+        self.bits[uniPos] = 0
+        self.addAccess(university, df["journal"], df["access"])
+
+    def addUniversityCSV(self, path:str, university:str=None):
+        """
+        Adds (or replaces) the access of university from its csv file; university defaults to the file name
+        """
+        if university is None:
+            university = os.path.splitext(os.path.basename(path))[0]
+        self.addUniversity(university, pd.read_csv(path, usecols=["journal", "access"], dtype={"journal": str}))
+
+    def getAccessRow(self, university:str) -> np.ndarray:
+        """
+        returns: boolean np.ndarray with True for every journal university has access to
+        """
+        return np.unpackbits(self.bits[self.uniPos[university]])[:len(self.journals)].astype(bool)
+
+    def hasAccess(self, university:str, journal:str) -> bool:
+        pos = self.journalPos[journal]
+        return bool(self.bits[self.uniPos[university], pos >> 3] & (0x80 >> (pos & 7)))
+
+    def universitiesWithAccess(self, journal:str) -> "list[str]":
+        """
+        returns: list of the universities that have access to journal
+        """
+        pos = self.journalPos[journal]
+        column = self.bits[:len(self.universities), pos >> 3] & (0x80 >> (pos & 7))
+        return [self.universities[i] for i in np.flatnonzero(column)]
+
+    def journalsWithAccess(self, university:str) -> "list[str]":
+        return [self.journals[i] for i in np.flatnonzero(self.getAccessRow(university))]
+
+    def journalsLacking(self, university:str) -> "list[str]":
+        """
+        returns: list of the journals university does not have access to
+        """
+        return [self.journals[i] for i in np.flatnonzero(~self.getAccessRow(university))]
+
+    def compare(self, universityA:str, universityB:str) -> "dict[str, list]":
+        """
+        Compares the journals two universities have access to with bitwise operations on their rows
+        returns: {"both": [journals], "onlyA": [journals], "onlyB": [journals], "neither": [journals]}
+        """
+        a = self.bits[self.uniPos[universityA]]
+        b = self.bits[self.uniPos[universityB]]
+        comparison = {"both": a & b, "onlyA": a & ~b, "onlyB": ~a & b, "neither": ~(a | b)}
+
+        return {key: [self.journals[i] for i in np.flatnonzero(np.unpackbits(bits)[:len(self.journals)])]
+                for key, bits in comparison.items()}
+
+    def journalsAccessibleByAll(self, universities:list) -> "list[str]":
+        rows = self.bits[[self.uniPos[university] for university in universities]]
+        bits = np.bitwise_and.reduce(rows, axis=0)
+        return [self.journals[i] for i in np.flatnonzero(np.unpackbits(bits)[:len(self.journals)])]
+
+    def journalsAccessibleByAny(self, universities:list) -> "list[str]":
+        rows = self.bits[[self.uniPos[university] for university in universities]]
+        bits = np.bitwise_or.reduce(rows, axis=0)
+        return [self.journals[i] for i in np.flatnonzero(np.unpackbits(bits)[:len(self.journals)])]
+
+    def accessCounts(self) -> pd.Series:
+        """
+        returns: pd.Series with the number of journals each university has access to
+        """
+        counts = np.unpackbits(self.bits[:len(self.universities)], axis=1)[:, :len(self.journals)].sum(axis=1).astype(np.int64)
+        return pd.Series(counts, index=self.universities, name="journalsWithAccess")
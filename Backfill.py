@@ -0,0 +1,183 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import DataChecks as dc
+from Metrics import metrics
+
+UNIVERSITY_CSV_DIR = "data/from-GDrive"
+# csv files in UNIVERSITY_CSV_DIR that are not university sheets
+NOT_UNIVERSITY_CSVS = ("mainDB.csv",)
+
+# journal, issn reference of a worker process, set once by initWorker instead of being sent with every task
+workerReference = None
+
+
+class BackfillReport:
+
+    def __init__(self):
+        """
+        Results of validating many university csv files: the ValidationReport of every file that could be read
+        and the error of every file that could not be read or checked
+        """
+        self.reports = {}   # path: dc.ValidationReport
+        self.errors = {}   # path: exception raised while reading or checking the file
+        self.seconds = 0.0
+
+    def add(self, path:str, report:dc.ValidationReport=None, error:Exception=None):
+        if error is not None:
+            self.errors[path] = error
+        else:
+            self.reports[path] = report
+
+    def getPassed(self) -> "list[str]":
+        return [path for path, report in self.reports.items() if report.passed()]
+
+    def getFailed(self) -> "list[str]":
+        return [path for path, report in self.reports.items() if not report.passed()]
+
+    def getFailureCounts(self) -> "dict[str, int]":
+        """
+        returns: {check (DataChecksException.ref): number of files failing it}
+        """
+        counts = {}
+        for report in self.reports.values():
+            for failure in report.getFailures():
+                counts[failure.ref] = counts.get(failure.ref, 0) + 1
+
+        return counts
+
+    def toRecords(self) -> "list[dict]":
+        """
+        returns: one {"path", "passed", "failures", "error"} dict per file, failures as {"msg", "ref", "detail"} dicts
+        """
+        records = [{"path": path, "passed": report.passed(), "error": None,
+                    "failures": [{"msg": failure.msg, "ref": failure.ref, "detail": failure.detail}
+                                 for failure in report.getFailures()]}
+                   for path, report in self.reports.items()]
+        records += [{"path": path, "passed": False, "error": f"{type(error).__name__}: {error}", "failures": []}
+                    for path, error in self.errors.items()]
+
+        return sorted(records, key=lambda record: record["path"])
+
+    def writeJSON(self, path:str):
+        """
+        Writes toRecords() to path as JSON lines
+        """
+        with open(path, "w") as f:
+            for record in self.toRecords():
+                f.write(json.dumps(record, default=str) + "\n")
+
+    def __str__(self):
+        nFiles = len(self.reports) + len(self.errors)
+        lines = [f"{nFiles} files validated in {self.seconds:.2f} s: {len(self.getPassed())} passed, "
+                 f"{len(self.getFailed())} failed, {len(self.errors)} could not be read or checked"]
+        lines += [f"  {ref}: {count} files" for ref, count in sorted(self.getFailureCounts().items())]
+        lines += [f"  could not read or check {path}: {error}" for path, error in sorted(self.errors.items())]
+
+        return "\n".join(lines)
+
+
+def initWorker(reference:dc.JournalReference):
+    """
+    Process pool initializer: keeps the journal, issn reference for every task run by this worker
+    """
+    global workerReference
+    workerReference = reference
+
+def readUniversityCSV(path:str) -> pd.DataFrame:
+    """
+    Reads a university csv file written by pd.DataFrame.to_csv() with every value as a string,
+    like a sheet read from Google Sheets (empty cells are "" rather than NaN)
+    returns: pd.DataFrame
+    """
+    return pd.read_csv(path, index_col=0, dtype=str, keep_default_na=False).astype("string")
+
+def validateCSV(path:str) -> "tuple(str, dc.ValidationReport, Exception)":
+    """
+    Runs every data check on the university csv file at path against the reference set by initWorker
+    returns: (path, ValidationReport or None, None or the exception raised while reading or checking the file)
+    """
+    try:
+        df = readUniversityCSV(path)
+        return path, dc.validateSheet(df, workerReference, os.path.basename(path)), None
+    except Exception as e:
+        return path, None, e
+
+def listUniversityCSVs(directory:str=UNIVERSITY_CSV_DIR, exclude:list=NOT_UNIVERSITY_CSVS) -> "list[str]":
+    """
+    returns: sorted paths of the .csv files in directory (not in subdirectories), leaving out the file names in exclude
+    """
+    return sorted(os.path.join(directory, entry) for entry in os.listdir(directory)
+                  if entry.endswith(".csv") and entry not in exclude)
+
+def revalidateFiles(paths:list, gtruth_df, workers:int=None, chunksize:int=None) -> BackfillReport:
+    """
+    Validates every university csv file in paths on a pool of workers processes (os.cpu_count() by default).
+    gtruth_df (DataChecks.JournalReference or df with journal and issn columns) is sent to each worker once,
+    as a JournalReference, when it starts; the tasks only carry file paths.
+    Files are handed out chunksize at a time (by default so that every worker gets about 4 chunks).
+    With workers=1 the files are validated in this process.
+    returns: BackfillReport
+    """
+    workers = workers or os.cpu_count() or 1
+    assert type(workers) == int and workers > 0, "workers must be an int and at least 1"
+    if chunksize is None:
+        chunksize = max(1, len(paths) // (workers * 4))
+
+    reference = dc.toJournalReference(gtruth_df)
+    report = BackfillReport()
+    start = time.perf_counter()
+    with metrics.timer("backfill.revalidate", rows=len(paths), workers=workers):
+        if workers == 1:
+            initWorker(reference)
+            for path, sheetReport, error in map(validateCSV, paths):
+                report.add(path, sheetReport, error)
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=initWorker, initargs=(reference,)) as pool:
+                for path, sheetReport, error in pool.map(validateCSV, paths, chunksize=chunksize):
+                    report.add(path, sheetReport, error)
+    report.seconds = time.perf_counter() - start
+
+    return report
+
+def revalidateDirectory(directory:str, gtruth_df, workers:int=None,
+                        exclude:list=NOT_UNIVERSITY_CSVS) -> BackfillReport:
+    """
+    Validates every university csv file in directory (see listUniversityCSVs and revalidateFiles)
+    returns: BackfillReport
+    """
+    return revalidateFiles(listUniversityCSVs(directory, exclude), gtruth_df, workers)
+
+def loadJournals(path:str) -> pd.DataFrame:
+    """
+    Reads the journal, issn reference from a csv file with journal and issn columns
+    returns: pd.DataFrame with journal and issn columns
+    """
+    return pd.read_csv(path, usecols=["journal", "issn"], dtype=str, keep_default_na=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-runs the data checks on every university csv in a directory "
+                                                 "on a pool of processes")
+    parser.add_argument("directory", nargs="?", default=UNIVERSITY_CSV_DIR)
+    parser.add_argument("--journals", help="csv file with the journal and issn columns "
+                                           "(read from the master sheet on Google Drive if not given)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: number of cores)")
+    parser.add_argument("--exclude", nargs="*", default=list(NOT_UNIVERSITY_CSVS), help="csv file names to skip")
+    parser.add_argument("--json", help="also write the result of every file to this file as JSON lines")
+    args = parser.parse_args()
+
+    if args.journals:
+        journals = loadJournals(args.journals)
+    else:
+        import GoogleDriveSheets as gds
+        import testMainDebug as tm
+        journals = tm.getJournalReference(gds.Handler("creds.json", "client_secrets_GDrive-oauth2.json", os.environ.get("TEST_SECRET")))
+
+    report = revalidateDirectory(args.directory, journals, args.workers, args.exclude)
+    print(report)
+    if args.json:
+        report.writeJSON(args.json)
@@ -0,0 +1,142 @@
+import argparse
+import json
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import DataChecks as dc
+import FakeBackends as fb
+import testMainDebug as tm
+from MainDB import MAIN_DB_COLS
+
+MAIN_DB_PATH = "data/from-GDrive/mainDB.csv"
+STAGES = ["list", "fetch", "validate", "merge", "commit"]
+
+
+def buildBackend(nUnis:int, cacheDir:str, latency:float=0.0, defectRate:float=0.1, seed:int=0) -> "tuple(fb.FakeHandler, dict)":
+    """
+    Builds a FakeHandler (caching sheets in cacheDir) holding the master journal list and nUnis synthetic university
+    sheets (split between the cleaned and byHand folders), a fraction defectRate of which carry a seeded defect
+    returns: (handler, {sheetID: defect or None})
+    """
+    rng = np.random.default_rng(seed)
+    journals = fb.makeJournals(seed=seed)
+    handler = fb.FakeHandler(cacheDir, latency=latency)
+    handler.addSheet(tm.ALL_JOURNALS_FILE_ID, "journals", "masterFolder", journals)
+    handler.repo.files[MAIN_DB_PATH] = ("," + ",".join(MAIN_DB_COLS) + "\n").encode("utf-8")
+
+    defects = {}
+    for i in range(nUnis):
+        sheetID = f"sheet{i:05d}"
+        defects[sheetID] = rng.choice(fb.DEFECTS) if rng.random() < defectRate else None
+        folderID = tm.FOLDER_BYHAND_ID if i % 4 == 0 else tm.FOLDER_CLEANED_ID
+        handler.addSheet(sheetID, f"Synthetic University {i:05d}", folderID,
+                         fb.makeUniversitySheet(journals, rng, defects[sheetID]))
+
+    return handler, defects
+
+def measure(results:dict, stage:str, items:int, function):
+    """
+    Runs function, recording its wall-clock time and (when tracemalloc is tracing) peak memory under results[stage]
+    returns: what function returns
+    """
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    value = function()
+    seconds = time.perf_counter() - start
+    results[stage] = {"seconds": seconds, "items": items, "throughput": items / seconds if seconds else float("inf"),
+                      "peakMB": tracemalloc.get_traced_memory()[1] / 1024**2 if tracemalloc.is_tracing() else None}
+
+    return value
+
+def runBenchmark(nUnis:int, latency:float=0.0, workers:int=8, defectRate:float=0.1, seed:int=0,
+                 traceMemory:bool=True) -> dict:
+    """
+    Runs the pipeline stages (list, fetch, validate, merge, commit) of testMainDebug.main()
+    over nUnis synthetic sheets on the fake backends.
+    Tracing memory (traceMemory) slows down every stage, so timings are best compared with it off.
+    returns: {stage: {"seconds", "items", "throughput", "peakMB"}}
+    """
+    with tempfile.TemporaryDirectory(prefix="sheetCache-") as cacheDir:
+        handler, defects = buildBackend(nUnis, cacheDir, latency, defectRate, seed)
+        results, reports, passed = runStages(handler, nUnis, workers, traceMemory)
+
+    caught = sum(1 for sheetID, defect in defects.items() if defect is not None and not reports[sheetID].passed())
+    seeded = sum(1 for defect in defects.values() if defect is not None)
+    assert caught == seeded == nUnis - len(passed), f"{caught} of {seeded} seeded defects caught, {len(passed)} sheets passed"
+
+    return results
+
+def runStages(handler, nUnis:int, workers:int=8, traceMemory:bool=True) -> "tuple(dict, dict, list)":
+    """
+    Times every stage of runBenchmark on the sheets of handler
+    returns: ({stage: {"seconds", "items", "throughput", "peakMB"}}, {sheetID: ValidationReport}, [IDs of the sheets that passed])
+    """
+    repo = handler.getRepo(None)
+    results = {}
+
+    if traceMemory:
+        tracemalloc.start()
+    try:
+        cleaned, raw, versions = measure(results, "list", nUnis, lambda: tm.getAllFileIDs(handler))
+        uniNames = {**cleaned["fromInst"], **cleaned["byHand"]}
+
+        def fetch():
+            journals = dc.JournalReference.fromDataFrame(tm.getAllJournals(handler))
+            sheets = {sheetID: pd.DataFrame(data).astype("string")
+                      for sheetID, data, error in handler.fetchSheetsData(list(uniNames), workers, versions=versions)}
+            return journals, sheets
+        journals, sheets = measure(results, "fetch", nUnis, fetch)
+
+        reports = measure(results, "validate", nUnis,
+                          lambda: {sheetID: dc.validateSheet(df, journals, sheetID) for sheetID, df in sheets.items()})
+        passed = [sheetID for sheetID, report in reports.items() if report.passed()]
+
+        def merge():
+            repoCommit = tm.RepoCommit(repo, "main")
+            for sheetID in passed:
+                tm.addNewUniToRepo(repoCommit, sheets[sheetID], f"data/from-GDrive/{uniNames[sheetID]}.csv")
+            newDfs = [tm.addUniCol(uniNames[sheetID], sheets[sheetID]) for sheetID in passed]
+            return repoCommit, tm.mergeMainDB(repoCommit, MAIN_DB_PATH, newDfs)[0]
+        repoCommit, updatedMainDB = measure(results, "merge", len(passed), merge)
+
+        def commit():
+            repoCommit.add(MAIN_DB_PATH, updatedMainDB)
+            repoCommit.add(tm.MAIN_DB_SNAPSHOT_PATH, tm.buildMainDBSnapshot(updatedMainDB))
+            repoCommit.push("benchmark commit")
+        measure(results, "commit", len(passed), commit)
+    finally:
+        tracemalloc.stop()
+
+    return results, reports, passed
+
+def formatResults(nUnis:int, results:dict) -> str:
+    lines = [f"{nUnis} universities"]
+    for stage in STAGES:
+        r = results[stage]
+        peak = f"{r['peakMB']:>10.1f} MB peak" if r["peakMB"] is not None else ""
+        lines.append(f"  {stage:<9}{r['seconds']:>9.3f} s{r['throughput']:>12.1f} sheets/s{peak}")
+
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Times the pipeline stages on fake Drive/Sheets/GitHub backends")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="numbers of universities")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every fake API call")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent sheet fetches")
+    parser.add_argument("--defect-rate", type=float, default=0.1, help="fraction of sheets seeded with a defect")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true", help="do not trace peak memory (faster, more accurate timings)")
+    parser.add_argument("--json", help="also write the results to this file as JSON lines")
+    args = parser.parse_args()
+
+    for nUnis in args.sizes:
+        results = runBenchmark(nUnis, args.latency, args.workers, args.defect_rate, args.seed, not args.no_memory)
+        print(formatResults(nUnis, results))
+        if args.json:
+            with open(args.json, "a") as f:
+                f.write(json.dumps({"universities": nUnis, "latency": args.latency, "workers": args.workers,
+                                    "stages": results}) + "\n")
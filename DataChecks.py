@@ -1,9 +1,13 @@
+import json
+import re
 import numpy as np
 import pandas as pd
+from Metrics import metrics, lenOfArg
 
 class DataChecksException(Exception):
 
     def __init__(self, msg, sheetID, ref, detail):
+        super().__init__(msg, sheetID, ref, detail)   # keeps the exception picklable (e.g. sent back from worker processes)
         self.msg = msg
         self.sheetID = sheetID
         self.ref = ref
@@ -22,40 +26,57 @@ class DataChecksException(Exception):
         return f"{self.msg} \nSheetID: {self.sheetID} \nRef: {self.ref} \nDetail: {self.detail}"
 
 
+ISSN_WEIGHTS = np.arange(8, 1, -1)   # weights of the first 7 digits
+ISSN_DIGIT_POS = [0, 1, 2, 3, 5, 6, 7]
+ISSN_POS_WEIGHTS = np.array([8, 7, 6, 5, 0, 4, 3, 2], dtype=np.int32)   # weight of each of the first 8 characters (0 for the dash)
+
 def check_issn(issn:str) -> bool:
-    # TODO:
-    # - check that the first 7 digits are numbers and the last digit is either a number or "X"
-    # - check that the last character is valid (matches the calculations based on the first 7 digits)
-    # - check that t
-    isVALID_C = validate_cISSN(issn)
-    pass
+    """
+    Checks that issn is formatted as NNNN-NNNC (N a digit, C a digit or "X")
+    and that C matches the check digit computed from the first 7 digits
+    """
+    if type(issn) != str or len(issn) != 9 or issn[4] != "-":
+        return False
+    digits = issn[:4] + issn[5:-1]
+    if not (digits.isascii() and digits.isdigit()):
+        return False
+    if not (issn[-1] == "X" or (issn[-1].isascii() and issn[-1].isdigit())):
+        return False
+
+    return validate_cISSN(issn)
 
 def check_journal(name:str) -> bool:
-    pass
+    """
+    Checks that the journal name is a non-empty string that is not one of ODD_WORDS
+    """
+    return type(name) == str and name.strip() != "" and name not in ODD_WORDS
 
 def check_access(zero_or_one:int) -> bool:
-    pass
+    """
+    Checks that access is 0 or 1 (also accepts "0" and "1" as read from sheets)
+    """
+    return str(zero_or_one) in ("0", "1")
 
 def check_notes(notes:str) -> bool:
-    pass
+    """
+    Checks that notes is a string (an empty string when there are no notes)
+    """
+    return type(notes) == str
 
 def validate_cISSN(issn:str) -> bool:
     """
     Validates the last character (c) of the ISSN number, based on the first 7 digits
-    returns: boolean: True if c is valid False otherwise
+    returns: boolean: True if c is valid False otherwise (including malformed issn)
     """
     assert type(issn) == str, "issn must be a string"
 
     issn_num = issn[:4] + issn[5:-1]
-    issn_c = issn[-1]
+    issn_c = issn[-1:]
+    if len(issn_num) != 7 or not (issn_num.isascii() and issn_num.isdigit()):
+        return False
 
     # check c validity
-    issn_num_sum = 0
-    inv_index = 8
-    for num in issn_num:
-        num = int(num)
-        issn_num_sum += num*inv_index
-        inv_index -= 1
+    issn_num_sum = sum(int(num)*weight for num, weight in zip(issn_num, ISSN_WEIGHTS))
 
     mod = issn_num_sum%11
     if mod == 0: c = 0
@@ -65,37 +86,207 @@ def validate_cISSN(issn:str) -> bool:
 
     return str(c) == issn_c
 
+@metrics.timed("dataChecks.validateISSNColumn", rows=lenOfArg(0))
+def validateISSNColumn(issns) -> "tuple(np.ndarray, list)":
+    """
+    Batch version of check_issn for a whole issn column (any iterable of values).
+    The column is converted once to a fixed width unicode array (10 code points, so longer values stay
+    too long), then the length, the format and the mod-11 check digit of every row are checked at once
+    with array arithmetic on its code points. Non-string (e.g. None, NaN, numbers) or malformed values are invalid.
+    returns: (boolean mask with True for valid rows, [indices of invalid rows])
+    """
+    issns = pd.Series(issns)
+    index = issns.index
+    values = issns.to_numpy(dtype=object)
+
+    valid = np.zeros(len(values), dtype=bool)
+    if len(values) > 0:
+        chars = values.astype("U10").view(np.int32).reshape(-1, 10)
+        digits = chars[:, :8] - ord("0")   # the dash is ignored by its 0 weight
+        last = chars[:, 8]
+        isXLast = last == ord("X")
+        lastDigit = last - ord("0")
 
-# print(validate_cISSN("0046-225X"))
+        wellFormed = (last != 0) & (chars[:, 9] == 0) & (chars[:, 4] == ord("-"))   # 9 characters, dash
+        wellFormed &= (digits[:, ISSN_DIGIT_POS].view(np.uint32) <= 9).all(axis=1)   # negative values wrap above 9
+        wellFormed &= isXLast | (lastDigit.view(np.uint32) <= 9)
 
+        c = (11 - (digits @ ISSN_POS_WEIGHTS) % 11) % 11   # 10 stands for "X"
+        valid = wellFormed & np.where(isXLast, c == 10, c == lastDigit)
 
+    return valid, list(index[~valid])
+
+@metrics.timed("dataChecks.validateAccessColumn", rows=lenOfArg(0))
+def validateAccessColumn(access) -> "tuple(np.ndarray, list)":
+    """
+    Batch version of check_access for a whole access column (any iterable of values): every row must be
+    0 or 1 (or "0" and "1" as read from sheets), as mainDB.csv is read with access as an int8 column (see MainDB).
+    Missing values (None/NaN or ODD_WORDS) are left to hasNaN and count as valid here.
+    returns: (boolean mask with True for valid rows, [indices of invalid rows])
+    """
+    access = pd.Series(access)
+    valid = access.astype(str).isin(["0", "1"]).values | (access.isnull() | access.isin(ODD_WORDS)).values
+
+    return valid, list(access.index[~valid])
+
+
+COLS = ["journal", "issn", "access", "notes"]
+
+# values that are treated as missing on top of None/NaN
+ODD_WORDS = ["missing", "MISSING", "Missing", "null", "Null", "NULL",
+             "None", "none", "NONE", "N/A", "n/a", "-", '', ' ',
+             "  ", "   ", "x", np.inf]
+
+
+class JournalReference:
+
+    def __init__(self, journals:list, issns:list, version:str=None):
+        """
+        Master journal, issn list prepared once per run for the per sheet checks: journals in master order,
+        a frozenset of the journals, a journal -> issn map (dict and indexed pd.Series), normalized journal
+        names (see normalizeJournalName) and the result of the issn checksum of every journal.
+        version is the version of the master sheet it was built from (see save and load).
+        """
+        self.journals = [str(journal) for journal in journals]
+        self.issns = [str(issn) for issn in issns]
+        assert len(self.journals) == len(self.issns), "journals and issns must have the same length"
+        self.version = version
+
+        self.journalSet = frozenset(self.journals)
+        assert len(self.journalSet) == len(self.journals), "journals must not contain duplicates"
+        self.issnOf = dict(zip(self.journals, self.issns))
+        self.issnSeries = pd.Series(self.issns, index=pd.Index(self.journals), dtype="string")
+        self.normalizedJournals = {}   # normalized name: journal
+        for journal in self.journals:
+            self.normalizedJournals.setdefault(normalizeJournalName(journal), journal)
+        self.validISSN, _ = validateISSNColumn(self.issns)
+
+    @classmethod
+    def fromDataFrame(cls, gtruth_df:pd.DataFrame, version:str=None) -> "JournalReference":
+        """
+        returns: JournalReference built from a df with journal and issn columns (as returned by getAllJournals)
+        """
+        return cls(gtruth_df["journal"], gtruth_df["issn"], version)
+
+    @classmethod
+    def load(cls, path:str) -> "JournalReference":
+        """
+        returns: JournalReference saved to path by save()
+        """
+        with open(path) as f:
+            saved = json.load(f)
+
+        return cls(saved["journals"], saved["issns"], saved.get("version"))
+
+    def save(self, path:str):
+        with open(path, "w") as f:
+            json.dump({"version": self.version, "journals": self.journals, "issns": self.issns}, f)
+
+    def toDataFrame(self) -> pd.DataFrame:
+        return pd.DataFrame({"journal": self.journals, "issn": self.issns})
+
+    def getISSN(self, journal:str) -> str:
+        """
+        returns: issn of journal, None if journal is not in the reference
+        """
+        return self.issnOf.get(journal)
+
+    def findJournal(self, name:str) -> str:
+        """
+        returns: journal of the reference whose normalized name is the normalized name, None if there is none
+        """
+        return self.normalizedJournals.get(normalizeJournalName(name))
+
+    def getInvalidISSNs(self) -> "dict[str, str]":
+        """
+        returns: {journal: issn} for the journals whose issn fails the format or checksum check
+        """
+        return {journal: issn for journal, issn, valid in zip(self.journals, self.issns, self.validISSN) if not valid}
+
+    def __len__(self):
+        return len(self.journals)
+
+
+def normalizeJournalName(name:str) -> str:
+    """
+    Normalizes a journal name for lookups: upper case, "&" read as "AND",
+    punctuation removed and runs of whitespace collapsed to one space
+    returns: str
+    """
+    name = str(name).upper().replace("&", " AND ")
+    name = re.sub(r"[^\w\s]", " ", name)
+
+    return " ".join(name.split())
+
+def toJournalReference(gtruth) -> JournalReference:
+    """
+    returns: gtruth if it is a JournalReference, otherwise a JournalReference built from gtruth (df with journal and issn columns)
+    """
+    return gtruth if isinstance(gtruth, JournalReference) else JournalReference.fromDataFrame(gtruth)
+
+
+class ValidationReport:
+
+    def __init__(self, sheetID):
+        """
+        Collects every failed check for a single sheet as DataChecksException objects
+        """
+        self.sheetID = sheetID
+        self.failures = []
+
+    def addFailure(self, msg, ref, detail):
+        self.failures.append(DataChecksException(msg, self.sheetID, ref, detail))
+
+    def getSheetID(self):
+        return self.sheetID
+
+    def getFailures(self):
+        return self.failures
+
+    def passed(self):
+        return len(self.failures) == 0
+
+    def __str__(self):
+        if self.passed():
+            return f"SheetID: {self.sheetID} passed all DataChecks"
+        return "\n\n".join(str(failure) for failure in self.failures)
+
+
+@metrics.timed("dataChecks.hasAllColumns", rows=lenOfArg(0))
 def hasAllColumns(df:pd.core.frame.DataFrame) -> "tuple(bool, bool, bool)":
     """
     Checks if there are any missing columns in the df
-    returns: (True, [missing cols]) if missing cols present, (False, []) otherwise
-    """
-    COLS = ["journal", "issn", "access", "notes"]
-    df_cols = []
-    hasAllCols = True
-    missingCols = []
-    for col in list(df.columns):
-        col = str(col)
-        col = "".join(col.split())
-        df_cols.append(col)
-    for col in COLS:
-        hasAllCols = col in df_cols
-        if not hasAllCols: missingCols.append(col)
-
-    return hasAllCols, missingCols
+    returns: (True, []) if all cols present, (False, [missing cols]) otherwise
+    """
+    df_cols = {"".join(str(col).split()) for col in df.columns}
+    missingCols = [col for col in COLS if col not in df_cols]
+
+    return len(missingCols) == 0, missingCols
 
+def noDuplicateColumns(df:pd.core.frame.DataFrame) -> "tuple(bool, list)":
+    """
+    Checks if any column name is repeated in the df (e.g. "issn" and "issn " once whitespace is removed)
+    returns: (True, []) if every column name is unique, (False, [duplicated cols]) otherwise
+    """
+    duplicatedCols = list(df.columns[df.columns.duplicated()].unique())
+
+    return len(duplicatedCols) == 0, duplicatedCols
+
+@metrics.timed("dataChecks.noDuplicates", rows=lenOfArg(0))
 def noDuplicates(df):
     """
     Checks if there are any duplicated rows in the df
     """
-    noDuplicates = list(df.duplicated().unique()) == [False]
+    return not df.duplicated().any()
 
-    return noDuplicates
+def oddWordsMask(df:pd.core.frame.DataFrame) -> pd.core.frame.DataFrame:
+    """
+    Marks every cell of the df that is None/NaN or one of ODD_WORDS in a single pass
+    returns: boolean df with the same shape as df
+    """
+    return df.isnull() | df.isin(ODD_WORDS)
 
+@metrics.timed("dataChecks.hasNaN", rows=lenOfArg(0))
 def hasNaN(df:pd.core.frame.DataFrame, includeNotes=False) -> "tuple(bool, list)":
     """
     Checks if there are any missing values in each column of the df
@@ -104,54 +295,113 @@ def hasNaN(df:pd.core.frame.DataFrame, includeNotes=False) -> "tuple(bool, list)
     if not includeNotes:
         df = df.drop("notes", inplace=False, axis=1)
 
-    df.fillna(value=np.nan, inplace=True) # for replacing None values (.replace does not work with None)
-    oddWords = ["missing", "MISSING", "Missing", "null", "Null", "NULL",
-                "None", "none", "NONE", "N/A", "n/a", "-", '', ' ',
-                "  ", "   ", "x", np.inf]
-    for word in oddWords:
-        df.replace(word, np.nan, inplace=True)
-
-    isnullCols = {}
-    hasNaNCols = []
-    hasNaN = False
-    for col in df.columns:
-        isnullCols[col] = df[col].isnull().unique()
-        if (True in isnullCols[col]):
-            hasNaN = True
-            hasNaNCols.append(col)
+    colHasNaN = oddWordsMask(df).any()
+    hasNaNCols = list(colHasNaN.index[colHasNaN.values])
 
-    return hasNaN, hasNaNCols
+    return len(hasNaNCols) > 0, hasNaNCols
 
-def allJournalsCounted(df:pd.core.frame.DataFrame, allJournals:list) -> "tuple(bool, list)":
+@metrics.timed("dataChecks.allJournalsCounted", rows=lenOfArg(0))
+def allJournalsCounted(df:pd.core.frame.DataFrame, allJournals) -> "tuple(bool, list)":
     """
-    Checks if all journals are recorded for a university df
+    Checks if all journals are recorded for a university df.
+    allJournals is a JournalReference or a list of journals; with a JournalReference a sheet that
+    has every journal is checked in O(sheet), the reference is only walked to list missing journals.
     returns: (True, []) if all journals are present, (False, [uncountedJournals]) otherwise
     """
-    df_journals = list(df["journal"])
-    uncountedJournals = []
-    allAreCounted = True
-    for journal in allJournals:
-        if journal not in df_journals:
-            allAreCounted = False
-            uncountedJournals.append(journal)
+    df_journals = set(df["journal"])
+    if isinstance(allJournals, JournalReference):
+        if len(allJournals.journalSet.intersection(df_journals)) == len(allJournals):
+            return True, []
+        allJournals = allJournals.journals
+    uncountedJournals = [journal for journal in allJournals if journal not in df_journals]
 
-    return allAreCounted, uncountedJournals
+    return len(uncountedJournals) == 0, uncountedJournals
 
-def journalsMatchISSN(gtruth_df:pd.core.frame.DataFrame, observed_df:pd.core.frame.DataFrame) -> "tuple(bool, list)":
+@metrics.timed("dataChecks.journalsMatchISSN", rows=lenOfArg(1))
+def journalsMatchISSN(gtruth, observed_df:pd.core.frame.DataFrame) -> "tuple(bool, list)":
     """
-    Compares the journal, ISSN pairing in gtruth_df with observed_df to check if they match.
-    Both parameters require pd.DataFrames with two columns (journal, issn).
+    Compares the journal, ISSN pairing in gtruth (a JournalReference, or a pd.DataFrame with journal and issn columns)
+    with observed_df (pd.DataFrame with journal and issn columns) to check if they match.
+    Journals missing from, or repeated in, observed_df count as mismatched.
+    The observed rows are looked up in the reference's journal -> issn map, so a matching sheet costs O(sheet).
     returns: (True, []) if no mismatch found, (False, [mismatchedJournals]) otherwise
     """
-    gTruthDf = gtruth_df.set_index("journal", inplace=False).astype("string")
-    observedDf = observed_df.set_index("journal", inplace=False).astype("string")
-    mismatchedJournals = []
-    noMismatch = True
-    for j in list(gTruthDf.index):
-        if str(gTruthDf.loc[j]) != str(observedDf.loc[j]):
-            noMismatch = False
-            mismatchedJournals.append(j)
+    reference = toJournalReference(gtruth)
+    observed = observed_df.drop_duplicates("journal", keep=False)
+    expectedISSN = reference.issnSeries.reindex(observed["journal"].values)
+    matched = (observed["issn"].astype("string").values == expectedISSN.values).fillna(False).astype(bool)
+    matchedJournals = observed["journal"].values[matched]
+    if len(matchedJournals) == len(reference):
+        return True, []
 
-    return noMismatch, mismatchedJournals
+    matchedJournals = set(matchedJournals)
+    mismatchedJournals = [journal for journal in reference.journals if journal not in matchedJournals]
 
+    return len(mismatchedJournals) == 0, mismatchedJournals
 
+def stripColumnNames(df:pd.core.frame.DataFrame) -> pd.core.frame.DataFrame:
+    """
+    Removes the whitespace in the column names of df, as hasAllColumns ignores it (e.g. "issn " is read as "issn")
+    returns: df with renamed columns (df itself if no name has whitespace)
+    """
+    columns = ["".join(str(col).split()) for col in df.columns]
+    if columns == list(df.columns):
+        return df
+
+    return df.set_axis(columns, axis=1)
+
+@metrics.timed("dataChecks.validateSheet", rows=lenOfArg(0),
+               fields=lambda report, args, kwargs: {"sheetID": report.getSheetID(), "failures": len(report.getFailures())})
+def validateSheet(df:pd.core.frame.DataFrame, gtruth, sheetID:str="") -> ValidationReport:
+    """
+    Runs every data check on a university df against the journal, issn ground truth in gtruth,
+    a JournalReference (built once per run) or a pd.DataFrame with journal and issn columns.
+    Unlike calling the checks one by one, every failure is recorded instead of stopping at the first.
+    Checks that need columns missing from df, or repeated in it, are skipped (those columns are reported).
+    Whitespace in column names is ignored (see stripColumnNames).
+    returns: ValidationReport with one DataChecksException per failed check
+    """
+    report = ValidationReport(sheetID)
+    reference = toJournalReference(gtruth)
+    df = stripColumnNames(df)
+
+    if not noDuplicates(df):
+        report.addFailure("DataFrame contains duplicates.", "noDuplicates", "")
+
+    hasAllCols, missingCols = hasAllColumns(df)
+    if not hasAllCols:
+        report.addFailure("DataFrame does not contain all the columns", "hasAllCols", "Missing columns: " + str(missingCols))
+    uniqueCols, duplicatedCols = noDuplicateColumns(df)
+    if not uniqueCols:
+        report.addFailure("DataFrame contains duplicated columns", "noDuplicateColumns",
+                          "Duplicated columns: " + str(duplicatedCols))
+    if not (hasAllCols and uniqueCols):
+        return report
+
+    hasNaNValues, nanCols = hasNaN(df)
+    if hasNaNValues:
+        report.addFailure("DataFrame contains NaN values", "hasNaN", "NaN values found in columns: " + str(nanCols))
+
+    allCounted, uncountedJournals = allJournalsCounted(df, reference)
+    if not allCounted:
+        report.addFailure("Not all journals are present in DataFrame", "allJournalsCounted",
+                          "uncounted journals: " + str(uncountedJournals))
+
+    validISSN, invalidRows = validateISSNColumn(df["issn"])
+    if not validISSN.all():
+        badISSNs = list(df["issn"].iloc[~validISSN])
+        report.addFailure("Invalid ISSN found in DataFrame", "validateISSNColumn",
+                          "invalid issn at rows " + str(invalidRows) + ": " + str(badISSNs))
+
+    validAccess, invalidAccessRows = validateAccessColumn(df["access"])
+    if not validAccess.all():
+        badAccess = list(df["access"].iloc[~validAccess])
+        report.addFailure("Invalid access value found in DataFrame", "validateAccessColumn",
+                          "access must be 0 or 1, found at rows " + str(invalidAccessRows) + ": " + str(badAccess))
+
+    noMismatch, mismatchedJournals = journalsMatchISSN(reference, df[["journal", "issn"]])
+    if not noMismatch:
+        report.addFailure("Journal and ISSN mismatch found in DataFrame", "journalsMatchISSN",
+                          "mismatched journals: " + str(mismatchedJournals))
+
+    return report
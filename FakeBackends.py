@@ -0,0 +1,445 @@
+import base64
+import datetime
+import hashlib
+import re
+import threading
+import time
+import numpy as np
+import GoogleDriveSheets as gds
+from RepoCommit import gitBlobSHA
+from github import GithubException, UnknownObjectException
+
+SPREADSHEET_MIMETYPE = "application/vnd.google-apps.spreadsheet"
+# defects that can be seeded in synthetic university sheets, each caught by one data check
+DEFECTS = ["duplicate", "missingColumn", "nan", "missingJournal", "issnMismatch", "badChecksum", "badAccess"]
+
+
+class FakeDrive:
+
+    def __init__(self, latency:float=0.0):
+        """
+        Stand-in for the Google Drive v3 service returned by Handler.getDriveService()
+        (files().list, files().get and batch requests). Every request sleeps for latency seconds.
+        """
+        self.latency = latency
+        self.fileMetadata = {}   # fileID: metadata dict
+        self.changeLog = []   # change dicts in order, a page token is a position in it
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def addFile(self, fileID:str, name:str, parent:str, mimeType:str=SPREADSHEET_MIMETYPE, modifiedTime:str=None):
+        if modifiedTime is None:
+            modifiedTime = datetime.datetime.utcnow().isoformat() + "Z"
+        self.fileMetadata[fileID] = {"id": fileID, "name": name, "mimeType": mimeType,
+                              "parents": [parent], "modifiedTime": modifiedTime}
+        self.logChange(fileID)
+
+    def modifyFile(self, fileID:str, modifiedTime:str=None, **metadata):
+        """
+        Updates the metadata of fileID (e.g. name or parents) and its modifiedTime, as an edit on Drive would
+        """
+        if modifiedTime is None:
+            modifiedTime = datetime.datetime.utcnow().isoformat() + "Z"
+        self.fileMetadata[fileID].update(metadata, modifiedTime=modifiedTime)
+        self.logChange(fileID)
+
+    def removeFile(self, fileID:str):
+        del self.fileMetadata[fileID]
+        self.logChange(fileID)
+
+    def logChange(self, fileID:str):
+        file = self.fileMetadata.get(fileID)
+        change = {"fileId": fileID, "removed": file is None}
+        if file is not None:
+            change["file"] = dict(file, trashed=False)
+        self.changeLog.append(change)
+
+    def call(self):
+        with self.lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def files(self):
+        return FakeDriveFiles(self)
+
+    def changes(self):
+        return FakeDriveChanges(self)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeDriveBatch(self, callback)
+
+
+class FakeDriveRequest:
+
+    def __init__(self, drive:FakeDrive, getResponse):
+        self.drive = drive
+        self.getResponse = getResponse
+
+    def execute(self):
+        self.drive.call()
+        return self.getResponse()
+
+
+class FakeDriveFiles:
+
+    def __init__(self, drive:FakeDrive):
+        self.drive = drive
+
+    def list(self, q:str="", pageSize:int=100, fields:str=None, pageToken:str=None):
+        def getResponse():
+            parents = set(re.findall(r"'([^']+)' in parents", q))
+            matches = sorted((file for file in self.drive.fileMetadata.values() if parents & set(file["parents"])),
+                             key=lambda file: file["id"])
+            start = int(pageToken or 0)
+            response = {"files": [dict(file) for file in matches[start:start+pageSize]]}
+            if start + pageSize < len(matches):
+                response["nextPageToken"] = str(start + pageSize)
+            return response
+
+        return FakeDriveRequest(self.drive, getResponse)
+
+    def get(self, fileId:str, fields:str=None):
+        return FakeDriveRequest(self.drive, lambda: dict(self.drive.fileMetadata[fileId]))
+
+
+class FakeDriveChanges:
+
+    def __init__(self, drive:FakeDrive):
+        self.drive = drive
+
+    def getStartPageToken(self):
+        return FakeDriveRequest(self.drive, lambda: {"startPageToken": str(len(self.drive.changeLog))})
+
+    def list(self, pageToken:str, pageSize:int=100, fields:str=None, includeRemoved:bool=True, spaces:str="drive"):
+        def getResponse():
+            start = int(pageToken)
+            changes = [change for change in self.drive.changeLog[start:start+pageSize]
+                       if includeRemoved or not change["removed"]]
+            if start + pageSize < len(self.drive.changeLog):
+                return {"changes": changes, "nextPageToken": str(start + pageSize)}
+            return {"changes": changes, "newStartPageToken": str(len(self.drive.changeLog))}
+
+        return FakeDriveRequest(self.drive, getResponse)
+
+
+class FakeDriveBatch:
+
+    def __init__(self, drive:FakeDrive, callback):
+        self.drive = drive
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request:FakeDriveRequest):
+        self.requests.append(request)
+
+    def execute(self):
+        self.drive.call()   # one round trip for the whole batch
+        for requestID, request in enumerate(self.requests):
+            try:
+                response = request.getResponse()
+            except Exception as e:
+                self.callback(str(requestID), None, e)
+            else:
+                self.callback(str(requestID), response, None)
+
+
+class FakeWorksheet:
+
+    def __init__(self, rows:"list[list]"=None):
+        self.rows = [list(row) for row in rows or []]
+
+    def get_all_values(self):
+        return [list(row) for row in self.rows]
+
+    def get_all_records(self):
+        return [dict(zip(self.rows[0], row)) for row in self.rows[1:]] if self.rows else []
+
+    def insert_row(self, values:list, index:int=1):
+        self.rows.insert(index - 1, list(values))
+
+    def append_rows(self, values:"list[list]", value_input_option:str="RAW"):
+        self.rows.extend(list(row) for row in values)
+
+
+class FakeHandler(gds.Handler):
+
+    def __init__(self, cacheDir:str, drive:FakeDrive=None, repo:"FakeRepo"=None, latency:float=0.0,
+                 cacheMaxBytes:int=256*1024**2):
+        """
+        GoogleDriveSheets.Handler whose Google Sheets, Google Drive and GitHub calls go to in-process stand-ins.
+        Sheets are added with addSheet; every sheet read sleeps for latency seconds.
+        Sheets read through getSheetsDataCached are cached in cacheDir, which the caller cleans up.
+        """
+        super().__init__(None, None, None, cacheDir, cacheMaxBytes)
+        self.driveService = drive if drive is not None else FakeDrive(latency)
+        self.repo = repo if repo is not None else FakeRepo(latency=latency)
+        self.latency = latency
+        self.sheets = {}   # sheetID: FakeWorksheet
+        self.sheetReads = 0
+        self.lock = threading.Lock()
+
+    def addSheet(self, sheetID:str, name:str, parent:str, records:"list[dict]"):
+        header = list(records[0].keys()) if records else []
+        self.sheets[sheetID] = FakeWorksheet([header] + [[record[col] for col in header] for record in records])
+        self.driveService.addFile(sheetID, name, parent)
+
+    def getSheetsDriveClient(self):
+        return None
+
+    def getDriveService(self):
+        return self.driveService
+
+    def getSheetObject(self, sheetID):
+        return self.sheets[sheetID]
+
+    def getSheetsData(self, client, file:str, by:str="id", sheetNum:int=0) -> "list[dict]":
+        with self.lock:
+            self.sheetReads += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self.sheets[file].get_all_records()
+
+    def batchGetValues(self, client, sheetID:str, ranges:list, majorDimension:str="COLUMNS") -> "list[list[list]]":
+        with self.lock:
+            self.sheetReads += 1
+        if self.latency:
+            time.sleep(self.latency)
+        rows = self.sheets[sheetID].get_all_values()
+        values = rows if majorDimension == "ROWS" else [list(column) for column in zip(*rows)]
+        return [values for _ in ranges]   # every range reads the whole sheet
+
+    def getRepo(self, repoDir):
+        return self.repo
+
+
+class FakeContentFile:
+
+    def __init__(self, path:str, content:bytes):
+        self.path = path
+        self.decoded_content = content
+        self.sha = gitBlobSHA(content)
+
+
+class FakeCommit:
+
+    def __init__(self, sha:str, message:str, tree:"FakeGitTree"=None, parents:list=()):
+        self.sha = sha
+        self.message = message
+        self.tree = tree
+        self.parents = list(parents)
+
+
+class FakeGitTreeElement:
+
+    def __init__(self, path:str, sha:str, type:str="blob", mode:str="100644"):
+        self.path = path
+        self.sha = sha
+        self.type = type
+        self.mode = mode
+
+
+class FakeGitTree:
+
+    def __init__(self, sha:str, entries:"dict[str, str]"):
+        self.sha = sha
+        self.tree = [FakeGitTreeElement(path, blobSHA) for path, blobSHA in sorted(entries.items())]
+
+
+class FakeGitBlob:
+
+    def __init__(self, sha:str, content:str=None, encoding:str="base64"):
+        self.sha = sha
+        self.content = content
+        self.encoding = encoding
+
+
+class FakeGitRef:
+
+    def __init__(self, repo:"FakeRepo", ref:str, sha:str):
+        self.repo = repo
+        self.ref = ref
+        self.object = FakeGitBlob(sha)   # only object.sha is used
+
+    def edit(self, sha:str, force:bool=False):
+        """
+        Moves the branch to commit sha; fails unless it is a fast forward of the branch's head (or force)
+        """
+        self.repo.call()
+        commit = self.repo.gitCommits[sha]
+        if not force and self.repo.commits[-1].sha not in [parent.sha for parent in commit.parents]:
+            raise GithubException(422, {"message": "Update is not a fast forward"}, None)
+        self.repo.commits.append(commit)
+        self.repo.files = {path: self.repo.blobs[blobSHA] for path, blobSHA in self.repo.trees[commit.tree.sha].items()}
+        self.object = FakeGitBlob(sha)
+
+
+class FakeRepo:
+
+    def __init__(self, files:"dict[str, bytes]"=None, latency:float=0.0):
+        """
+        Stand-in for a PyGithub Repository holding one branch in memory, with the contents API
+        (get_contents, create_file, update_file) and the Git Data API (refs, commits, trees, blobs).
+        Every call sleeps for latency seconds; bytesUploaded counts the content sent by writes.
+        """
+        self.files = dict(files or {})   # path: bytes on the branch's head
+        self.latency = latency
+        self.commits = []   # the branch's history, head last
+        self.gitCommits = {}   # sha: FakeCommit, including commits not on the branch
+        self.trees = {}   # sha: {path: blob sha}
+        self.blobs = {}   # sha: bytes
+        self.calls = 0
+        self.bytesUploaded = 0
+
+    def call(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def storeBlob(self, content:bytes) -> str:
+        sha = gitBlobSHA(content)
+        self.blobs[sha] = content
+        return sha
+
+    def storeTree(self, entries:"dict[str, str]") -> FakeGitTree:
+        sha = hashlib.sha1(repr(sorted(entries.items())).encode("utf-8")).hexdigest()
+        self.trees[sha] = dict(entries)
+        return FakeGitTree(sha, entries)
+
+    def storeCommit(self, message:str, tree:FakeGitTree, parents:list) -> FakeCommit:
+        sha = hashlib.sha1(f"{tree.sha}{[parent.sha for parent in parents]}{len(self.gitCommits)}{message}".encode("utf-8")).hexdigest()
+        commit = FakeCommit(sha, message, tree, parents)
+        self.gitCommits[sha] = commit
+        return commit
+
+    def commit(self, message:str) -> FakeCommit:
+        """
+        Commits the current files on top of the branch's head
+        """
+        tree = self.storeTree({path: self.storeBlob(content) for path, content in self.files.items()})
+        commit = self.storeCommit(message, tree, self.commits[-1:])
+        self.commits.append(commit)
+        return commit
+
+    def get_contents(self, path:str, ref:str=None) -> FakeContentFile:
+        self.call()
+        if path not in self.files:
+            raise UnknownObjectException(404, {"message": "Not Found"}, None)
+        return FakeContentFile(path, self.files[path])
+
+    def create_file(self, path:str, message:str, content, branch:str=None) -> dict:
+        self.call()
+        if path in self.files:
+            raise GithubException(422, {"message": "Invalid request. \"sha\" wasn't supplied."}, None)
+        return self.writeFile(path, message, content)
+
+    def update_file(self, path:str, message:str, content, sha:str, branch:str=None) -> dict:
+        self.call()
+        if path not in self.files or gitBlobSHA(self.files[path]) != sha:
+            raise GithubException(409, {"message": f"{path} does not match {sha}"}, None)
+        return self.writeFile(path, message, content)
+
+    def writeFile(self, path:str, message:str, content) -> dict:
+        content = content if type(content) == bytes else content.encode("utf-8")
+        self.files[path] = content
+        self.bytesUploaded += len(content)
+        return {"content": FakeContentFile(path, content), "commit": self.commit(message)}
+
+    def get_git_ref(self, ref:str) -> FakeGitRef:
+        self.call()
+        if not self.commits:
+            self.commit("initial commit")
+        return FakeGitRef(self, ref, self.commits[-1].sha)
+
+    def get_git_commit(self, sha:str) -> FakeCommit:
+        self.call()
+        return self.gitCommits[sha]
+
+    def get_git_tree(self, sha:str, recursive:bool=False) -> FakeGitTree:
+        self.call()
+        return FakeGitTree(sha, self.trees[sha])
+
+    def get_git_blob(self, sha:str) -> FakeGitBlob:
+        self.call()
+        return FakeGitBlob(sha, base64.b64encode(self.blobs[sha]).decode("ascii"), "base64")
+
+    def create_git_blob(self, content:str, encoding:str) -> FakeGitBlob:
+        self.call()
+        self.bytesUploaded += len(content.encode("utf-8"))
+        return FakeGitBlob(self.storeBlob(base64.b64decode(content) if encoding == "base64" else content.encode("utf-8")))
+
+    def create_git_tree(self, tree:list, base_tree:FakeGitTree=None) -> FakeGitTree:
+        """
+        tree is a list of github.InputGitTreeElement; elements with sha None delete their path
+        """
+        self.call()
+        entries = dict(self.trees[base_tree.sha]) if base_tree is not None else {}
+        for element in tree:
+            identity = element._identity
+            if "content" in identity:
+                self.bytesUploaded += len(identity["content"].encode("utf-8"))
+                entries[identity["path"]] = self.storeBlob(identity["content"].encode("utf-8"))
+            elif identity["sha"] is None:
+                entries.pop(identity["path"], None)
+            else:
+                assert identity["sha"] in self.blobs, f"unknown blob {identity['sha']}"
+                entries[identity["path"]] = identity["sha"]
+        return self.storeTree(entries)
+
+    def create_git_commit(self, message:str, tree:FakeGitTree, parents:list) -> FakeCommit:
+        self.call()
+        return self.storeCommit(message, tree, parents)
+
+
+def issnCheckDigit(digits:str) -> str:
+    """
+    returns: the ISSN check digit ("0"-"9" or "X") of the first 7 digits of an ISSN
+    """
+    c = (11 - sum(int(d)*w for d, w in zip(digits, range(8, 1, -1))) % 11) % 11
+    return "X" if c == 10 else str(c)
+
+def makeJournals(n:int=1372, seed:int=0) -> "list[dict]":
+    """
+    Generates n synthetic journals with unique names and valid, unique ISSNs
+    returns: list of {"journal", "issn"} dicts
+    """
+    rng = np.random.default_rng(seed)
+    numbers = rng.choice(10**7, size=n, replace=False)
+    journals = []
+    for i, number in enumerate(numbers):
+        digits = f"{number:07d}"
+        journals.append({"journal": f"JOURNAL OF SYNTHETIC STUDIES {i:05d}",
+                         "issn": f"{digits[:4]}-{digits[4:]}{issnCheckDigit(digits)}"})
+
+    return journals
+
+def makeUniversitySheet(journals:"list[dict]", rng:np.random.Generator, defect:str=None) -> "list[dict]":
+    """
+    Generates the records of a cleaned university sheet (journal, issn, access, notes) for every journal,
+    with random access, optionally seeded with one of DEFECTS
+    returns: list of dicts as returned by gspread get_all_records()
+    """
+    assert defect is None or defect in DEFECTS, f"defect must be one of {DEFECTS}"
+
+    access = rng.integers(0, 2, size=len(journals))
+    records = [{"journal": j["journal"], "issn": j["issn"], "access": int(a), "notes": ""}
+               for j, a in zip(journals, access)]
+    row = int(rng.integers(len(records)))
+
+    if defect == "duplicate":
+        records.append(dict(records[row]))
+    elif defect == "missingColumn":
+        records = [{col: value for col, value in record.items() if col != "access"} for record in records]
+    elif defect == "nan":
+        records[row]["access"] = "N/A"
+    elif defect == "missingJournal":
+        del records[row]
+    elif defect == "issnMismatch":
+        records[row]["issn"] = records[(row + 1) % len(records)]["issn"]
+    elif defect == "badChecksum":
+        issn = records[row]["issn"]
+        records[row]["issn"] = issn[:-1] + ("0" if issn[-1] != "0" else "1")
+    elif defect == "badAccess":
+        records[row]["access"] = "Yes"
+
+    return records
@@ -1,12 +1,34 @@
 import pickle
 import os
-from google_auth_oauthlib.flow import Flow, InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload, MediaIoBaseDownload
-from google.auth.transport.requests import Request
+import threading
+# googleapiclient, google.auth and google_auth_oauthlib are imported in Create_Service when first needed
+
+# services already created, keyed on (client_secret_file, api_name, api_version, scopes)
+SERVICES = {}
+SERVICES_LOCK = threading.Lock()
 
 
 def Create_Service(client_secret_file, api_name, api_version, *scopes):
+    """
+    Creates the googleapiclient service for api_name/api_version, refreshing (or asking for) the oauth2 token if needed.
+    The service is built from the discovery document shipped with googleapiclient (no network request) and
+    memoized: later calls with the same arguments return the same service.
+    """
+    key = (client_secret_file, api_name, api_version, tuple(scope for scope in scopes[0]))
+    with SERVICES_LOCK:
+        if key not in SERVICES:
+            service = createService(client_secret_file, api_name, api_version, *scopes)
+            if service is None:
+                return None
+            SERVICES[key] = service
+        return SERVICES[key]
+
+
+def createService(client_secret_file, api_name, api_version, *scopes):
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from googleapiclient.discovery import build
+    from google.auth.transport.requests import Request
+
     print(client_secret_file, api_name, api_version, scopes, sep='-')
     CLIENT_SECRET_FILE = client_secret_file
     API_SERVICE_NAME = api_name
@@ -34,7 +56,7 @@ def Create_Service(client_secret_file, api_name, api_version, *scopes):
             pickle.dump(cred, token)
 
     try:
-        service = build(API_SERVICE_NAME, API_VERSION, credentials=cred)
+        service = build(API_SERVICE_NAME, API_VERSION, credentials=cred, static_discovery=True, cache_discovery=False)
         print(API_SERVICE_NAME, 'service created successfully')
         return service
     except Exception as e:
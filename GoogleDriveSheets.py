@@ -1,41 +1,110 @@
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-from Google import Create_Service
-from github import Github
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING
+from Metrics import metrics, lenOfResult, sizeOfRecords, sizeOfValueRanges
+# gspread, oauth2client, googleapiclient, github and SheetCache (numpy) are imported when first used,
+# so runs with nothing to do do not pay for them
+if TYPE_CHECKING:
+    import gspread
+    import numpy as np
 # from typing import List
 
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+FOLDER_MIMETYPE = "application/vnd.google-apps.folder"
+# only the file metadata used by the pipeline is requested from Google Drive
+LIST_FIELDS = "nextPageToken, files(id, name, mimeType, parents, modifiedTime)"
+LIST_PAGE_SIZE = 1000
+CHANGES_FIELDS = "nextPageToken, newStartPageToken, changes(fileId, removed, file(id, name, mimeType, parents, modifiedTime, trashed))"
+MAX_PARENTS_PER_QUERY = 50   # keeps combined queries well under the Drive query length limit
+# A1 range of a whole sheet; ranges without a sheet name refer to the first sheet of the spreadsheet
+SHEET_RANGE = "A:ZZ"
+# keep-alive connections kept open per host by the Sheets and GitHub sessions (at least the number of fetching threads)
+POOL_SIZE = 16
+
 class Handler:
 
-    def __init__(self, sheetsDriveCredsJson, driveCredsJson, gitToken):
+    def __init__(self, sheetsDriveCredsJson, driveCredsJson, gitToken, cacheDir=".sheetCache", cacheMaxBytes=256*1024**2,
+                 poolSize=POOL_SIZE):
         """
-        Authenticates client API keys for Google Drive and Google Sheets APIs
-        and authenticates oauth2 key for Google Drive
+        Keeps the credentials for the Google Drive, Google Sheets and GitHub APIs. Each client is
+        authenticated the first time it is used (see getSheetsDriveClient, getDriveService and getGitService)
+        and reused afterwards.
+        The Sheets and GitHub clients keep up to poolSize keep-alive connections open, and spreadsheets
+        opened by ID are reused for the rest of the run.
+        Sheets read through getSheetsDataCached are cached in cacheDir (at most cacheMaxBytes).
         """
         # .json files with credentials
         self.sheetsDriveCredsJson = sheetsDriveCredsJson
         self.driveCredsJson = driveCredsJson
         self.gitToken = gitToken
-        # Google Drive and Google Sheets API key authentication
-        self.sheetsDriveClient = self.authenticateDriveSheetsAPIKeys(self.sheetsDriveCredsJson)
-        # Google Drive oauth2 authentication
-        self.driveService = self.authenticateOauth2GDrive(self.driveCredsJson)
-        # github object
-        self.gitService = Github(self.gitToken)
+        self.cacheDir = cacheDir
+        self.cacheMaxBytes = cacheMaxBytes
+        # Google Drive and Google Sheets API key client, Google Drive oauth2 service, github object
+        # and local cache of sheets contents keyed on Drive file versions, all created on first use
+        self.sheetsDriveClient = None
+        self.driveService = None
+        self.gitService = None
+        self.sheetCache = None
+        self.clientLock = threading.Lock()   # clients can first be used from the fetching threads
+        self.poolSize = poolSize
+        self.spreadsheets = {}   # sheetID: gspread.Spreadsheet opened during this run
+        self.spreadsheetsLock = threading.Lock()
 
     def getSheetsDriveClient(self):
+        if self.sheetsDriveClient is None:
+            with self.clientLock:
+                if self.sheetsDriveClient is None:
+                    self.sheetsDriveClient = self.authenticateDriveSheetsAPIKeys(self.sheetsDriveCredsJson)
         return self.sheetsDriveClient
 
     def getDriveService(self):
+        if self.driveService is None:
+            with self.clientLock:
+                if self.driveService is None:
+                    self.driveService = self.authenticateOauth2GDrive(self.driveCredsJson)
         return self.driveService
-    
+
+    def getGitService(self):
+        if self.gitService is None:
+            with self.clientLock:
+                if self.gitService is None:
+                    from github import Github
+                    self.gitService = Github(self.gitToken, pool_size=self.poolSize)
+        return self.gitService
+
+    def getSheetCache(self):
+        if self.sheetCache is None:
+            with self.clientLock:
+                if self.sheetCache is None:
+                    from SheetCache import SheetCache
+                    self.sheetCache = SheetCache(self.cacheDir, self.cacheMaxBytes)
+        return self.sheetCache
+
+    @metrics.timed("sheets.getSheetObject", fields=lambda result, args, kwargs: {"sheetID": args[1]})
     def getSheetObject(self, sheetID):
         """
         Returns the first sheet object (not the data on it) using sheetID
         """
-        sheetsFile = self.getSheetsDriveClient().open_by_key(sheetID)
+        sheetsFile = self.openSpreadsheet(self.getSheetsDriveClient(), sheetID)
         sheet = sheetsFile.get_worksheet(0)
         return sheet
 
+    def openSpreadsheet(self, client:"gspread.Client", sheetID:str) -> "gspread.Spreadsheet":
+        """
+        Opens the spreadsheet sheetID, reusing the Spreadsheet object if it was already opened during this run
+        returns: gspread.Spreadsheet
+        """
+        with self.spreadsheetsLock:
+            sheetsFile = self.spreadsheets.get(sheetID)
+        if sheetsFile is None:
+            sheetsFile = client.open_by_key(sheetID)
+            with self.spreadsheetsLock:
+                sheetsFile = self.spreadsheets.setdefault(sheetID, sheetsFile)
+
+        return sheetsFile
+
     def authenticateDriveSheetsAPIKeys(self, jsonFilename:str) -> "gspread.Client":
         """
         Authorises API keys for Google Drive and Google Sheets APIs
@@ -44,6 +113,8 @@ class Handler:
         """
         assert type(jsonFilename) == str, "jsonFilename must be a str"
         assert jsonFilename.endswith(".json"), f"{jsonFilename} is not a .json file"
+        import gspread
+        from oauth2client.service_account import ServiceAccountCredentials
 
         SCOPES = ["https://spreadsheets.google.com/feeds",
                 "https://www.googleapis.com/auth/spreadsheets",
@@ -51,10 +122,15 @@ class Handler:
                 "https://www.googleapis.com/auth/drive"]
         creds = ServiceAccountCredentials.from_json_keyfile_name(jsonFilename, SCOPES)
         client = gspread.authorize(creds)
+        # gspread >= 5 keeps its requests.Session on client.http_client
+        mountConnectionPool(getattr(client, "http_client", client).session, self.poolSize)
 
         return client
 
-    def getSheetsData(self, client:gspread.Client, file:str, by:str="id", sheetNum:int=0) -> "list[dict]":
+    @metrics.timed("sheets.getSheetsData", rows=lenOfResult,
+                   nbytes=lambda result, args, kwargs: sizeOfRecords(result),
+                   fields=lambda result, args, kwargs: {"sheetID": args[2] if len(args) > 2 else kwargs["file"]})
+    def getSheetsData(self, client:"gspread.Client", file:str, by:str="id", sheetNum:int=0) -> "list[dict]":
         """
         Gets data from sheetNum of file using an authenticated Google Cloud Platform client object
         returns: list of each row in the spreadsheet as a dict with each col as key
@@ -66,7 +142,7 @@ class Handler:
 
         # open file
         if by == "id":
-            sheets = client.open_by_key(file)
+            sheets = self.openSpreadsheet(client, file)
         elif by == "name":
             sheets = client.open(file)
         elif by == "url":
@@ -78,6 +154,133 @@ class Handler:
 
         return data
 
+    @metrics.timed("sheets.batchGetValues", rows=lambda result, args, kwargs: sum(len(values) for values in result),
+                   nbytes=lambda result, args, kwargs: sizeOfValueRanges(result),
+                   fields=lambda result, args, kwargs: {"sheetID": args[2] if len(args) > 2 else kwargs["sheetID"]})
+    def batchGetValues(self, client:"gspread.Client", sheetID:str, ranges:list, majorDimension:str="COLUMNS") -> "list[list[list]]":
+        """
+        Reads every range in ranges (A1 notation) of spreadsheet sheetID with a single values:batchGet request,
+        without opening the spreadsheet or its worksheets. Values are unformatted (numbers come back as int/float).
+        returns: list with the values of each range, as a list of columns (or of rows if majorDimension is "ROWS")
+        """
+        assert majorDimension in ["ROWS", "COLUMNS"], "majorDimension must be one of ROWS or COLUMNS"
+        from gspread.urls import SPREADSHEET_VALUES_BATCH_URL
+
+        params = {"ranges": list(ranges), "majorDimension": majorDimension, "valueRenderOption": "UNFORMATTED_VALUE"}
+        # gspread >= 5 sends requests through client.http_client
+        response = getattr(client, "http_client", client).request("get", SPREADSHEET_VALUES_BATCH_URL % sheetID, params=params)
+
+        return [valueRange.get("values", []) for valueRange in response.json()["valueRanges"]]
+
+    def getSheetColumns(self, client:"gspread.Client", sheetID:str, sheetRange:str=SHEET_RANGE) -> "dict[str, list]":
+        """
+        Gets the data of the first sheet of sheetID (its first row being the header) with one request
+        returns: {col: [values]} in the sheet's column order, e.g. {"Serial No": [0, 1], "Name": ["Abby", "Jason"]}
+        """
+        return valuesToColumns(self.batchGetValues(client, sheetID, [sheetRange])[0])
+
+    @metrics.timed("drive.getFileVersions", rows=lenOfResult)
+    def getFileVersions(self, fileIDs:list) -> "dict[str, str]":
+        """
+        Gets the version of every file in fileIDs from Google Drive in batched requests (100 files each).
+        The version is the file's md5Checksum, or its modifiedTime for Google Sheets (which have no checksum).
+        returns: {fileID: version}, files whose metadata could not be read are left out
+        """
+        service = self.getDriveService()
+        versions = {}
+
+        def storeVersion(requestID, response, exception):
+            if exception is None:
+                versions[response["id"]] = response.get("md5Checksum") or response["modifiedTime"]
+
+        for start in range(0, len(fileIDs), 100):
+            batch = service.new_batch_http_request(callback=storeVersion)
+            for fileID in fileIDs[start:start+100]:
+                batch.add(service.files().get(fileId=fileID, fields="id, modifiedTime, md5Checksum"))
+            batch.execute()
+
+        return versions
+
+    @metrics.timed("handler.getSheetsDataCached",
+                   rows=lambda result, args, kwargs: len(next(iter(result.values()), [])),
+                   fields=lambda result, args, kwargs: {"sheetID": args[1] if len(args) > 1 else kwargs["sheetID"]})
+    def getSheetsDataCached(self, sheetID:str, version:str=None, maxRetries:int=5, backoff:float=1.0) -> "dict[str, np.ndarray]":
+        """
+        Gets the data of the first sheet of sheetID from the local cache if the cached copy
+        matches version, and from Google Sheets (then caching it) otherwise.
+        version is looked up on Google Drive when not given; the cache is skipped if it is "" or cannot be found.
+        returns: {col: np.ndarray} of the sheet's columns (can be passed straight to pd.DataFrame)
+        """
+        from SheetCache import toColumnArray
+
+        if version is None:
+            version = self.getFileVersions([sheetID]).get(sheetID)
+        if not version:
+            columns = self.getSheetColumnsWithBackoff(sheetID, maxRetries, backoff)
+            return {col: toColumnArray(values) for col, values in columns.items()}
+
+        columns = self.getSheetCache().get(sheetID, version)
+        if columns is None:
+            columns = self.getSheetColumnsWithBackoff(sheetID, maxRetries, backoff)
+            columns = self.getSheetCache().put(sheetID, version, columns)
+
+        return columns
+
+    def getSheetColumnsWithBackoff(self, sheetID:str, maxRetries:int=5, backoff:float=1.0) -> "dict[str, list]":
+        """
+        Same as getSheetColumns(client, sheetID) but retried as in callWithBackoff
+        returns: {col: [values]} in the sheet's column order
+        """
+        return self.callWithBackoff(lambda: self.getSheetColumns(self.getSheetsDriveClient(), sheetID), maxRetries, backoff)
+
+    def callWithBackoff(self, request, maxRetries:int=5, backoff:float=1.0):
+        """
+        Calls request() and retries it with exponential backoff (plus jitter) when the Sheets API answers
+        with a rate limit (429) or a transient server error (5xx).
+        A Retry-After header sent with the error is respected.
+        returns: what request returns
+        """
+        import gspread
+
+        for attempt in range(maxRetries + 1):
+            try:
+                return request()
+            except gspread.exceptions.APIError as e:
+                status = e.response.status_code
+                if status not in RETRY_STATUS_CODES or attempt == maxRetries:
+                    raise
+                retryAfter = e.response.headers.get("Retry-After")
+                if retryAfter is not None and retryAfter.isdigit():
+                    delay = int(retryAfter)
+                else:
+                    delay = backoff * 2**attempt + random.uniform(0, backoff)
+                time.sleep(delay)
+
+    def fetchSheetsData(self, sheetIDs:list, maxWorkers:int=4, maxRetries:int=5, backoff:float=1.0, versions:dict=None):
+        """
+        Fetches the first sheet of every file in sheetIDs concurrently with at most maxWorkers
+        requests in flight, so the caller can process each sheet as soon as it arrives.
+        Sheets whose version (looked up on Google Drive unless given in versions) is cached are not fetched.
+        returns: generator of (sheetID, data, error) tuples in order of completion,
+        where data is as returned by getSheetsDataCached and error is the exception raised (None on success)
+        """
+        assert type(maxWorkers) == int and maxWorkers > 0, "maxWorkers must be an int and at least 1"
+
+        versions = dict(versions or {})
+        unknownVersions = [sheetID for sheetID in sheetIDs if sheetID not in versions]
+        if unknownVersions:
+            versions.update(self.getFileVersions(unknownVersions))
+
+        with ThreadPoolExecutor(max_workers=maxWorkers) as pool:
+            futures = {pool.submit(self.getSheetsDataCached, sheetID, versions.get(sheetID, ""), maxRetries, backoff): sheetID
+                       for sheetID in sheetIDs}
+            for future in as_completed(futures):
+                sheetID = futures[future]
+                try:
+                    yield sheetID, future.result(), None
+                except Exception as e:
+                    yield sheetID, None, e
+
     def authenticateOauth2GDrive(self, client_secretJson:str):
         """
         Authenticates Google Drive API using oauth2 key from user's .json credential file
@@ -86,33 +289,120 @@ class Handler:
         CLIENT_SECRET_FILE = client_secretJson
         API_NAME, API_VERSION = "drive", "v3"
         SCOPES = ["https://www.googleapis.com/auth/drive"]
+        from Google import Create_Service
         service = Create_Service(CLIENT_SECRET_FILE, API_NAME, API_VERSION, SCOPES)
 
         return service
 
+    @metrics.timed("drive.listFiles", rows=lenOfResult)
+    def listFiles(self, query:str, service) -> "list[dict]":
+        """
+        Lists the metadata (id, name, mimeType, parents, modifiedTime) of every file matching the
+        Google Drive query, requesting LIST_PAGE_SIZE files per page
+        returns: list of dict values for each file
+        """
+        files = []
+        nextPageToken = None
+        while True:
+            response = service.files().list(q=query, pageSize=LIST_PAGE_SIZE, fields=LIST_FIELDS,
+                                            pageToken=nextPageToken).execute()
+            files.extend(response.get('files', []))
+            nextPageToken = response.get('nextPageToken')
+            if not nextPageToken:
+                return files
+
+    @metrics.timed("drive.getStartPageToken")
+    def getStartPageToken(self, service=None) -> str:
+        """
+        returns: Google Drive changes page token for changes made from now on
+        """
+        if service is None:
+            service = self.getDriveService()
+        return service.changes().getStartPageToken().execute()["startPageToken"]
+
+    @metrics.timed("drive.listChanges", rows=lambda result, args, kwargs: len(result[0]))
+    def listChanges(self, pageToken:str, service=None) -> "tuple(list, str)":
+        """
+        Lists every change to the files visible to the Drive service since pageToken
+        (requesting LIST_PAGE_SIZE changes per page)
+        returns: ([change dicts with fileId, removed and file (id, name, mimeType, parents, modifiedTime, trashed)],
+                  page token to list the changes made after these)
+        """
+        if service is None:
+            service = self.getDriveService()
+
+        changes = []
+        while True:
+            response = service.changes().list(pageToken=pageToken, pageSize=LIST_PAGE_SIZE, fields=CHANGES_FIELDS,
+                                              includeRemoved=True, spaces="drive").execute()
+            changes.extend(response.get("changes", []))
+            if "newStartPageToken" in response:
+                return changes, response["newStartPageToken"]
+            pageToken = response["nextPageToken"]
+
     def getFileListInFolder(self, folderID:str, service) -> "list[dict]":
         """
-        Uses the Google Drive folder ID to get the list of all file metadata (kind, id, name, mimeType)
+        Uses the Google Drive folder ID to get the list of all file metadata (id, name, mimeType, parents, modifiedTime)
         returns: list of dict values for each file in folder
         """
-        folder_id = folderID
-        query = f"parents = '{folder_id}'"
-        response = service.files().list(q=query).execute()
-        files = response.get('files')
-        nextPageToken = response.get('nextPageToken')
+        return self.listFiles(f"'{folderID}' in parents", service)
 
-        while nextPageToken:
-            response = service.files().list(q=query, pageToken=nextPageToken).execute()
-            files.extend(response.get('files'))
-            nextPageToken = response.get('nextPageToken')
+    def getFilesInFolders(self, folderIDs:list, service=None, recursiveFolderIDs:list=()) -> "dict[str, list[dict]]":
+        """
+        Gets the metadata of all files in every folder of folderIDs with combined
+        "'A' in parents or 'B' in parents ..." queries instead of one listing per folder.
+        Subfolders of folders in recursiveFolderIDs are traversed as well (one combined query per level)
+        and their files are grouped under the folder in recursiveFolderIDs they are in.
+        returns: {folderID: [file metadata dicts]} for every folder in folderIDs
+        """
+        if service is None:
+            service = self.getDriveService()
 
-        return files
+        filesByFolder = {folderID: [] for folderID in folderIDs}
+        rootFolderOf = {folderID: folderID for folderID in folderIDs}   # folder: folder in folderIDs it is in
+        foldersToList = list(folderIDs)
 
-    def getRepo(self, repoDir):
-        return self.gitService.get_repo(repoDir)
+        while foldersToList:
+            subfolders = []
+            for start in range(0, len(foldersToList), MAX_PARENTS_PER_QUERY):
+                parents = foldersToList[start:start+MAX_PARENTS_PER_QUERY]
+                query = " or ".join(f"'{parent}' in parents" for parent in parents)
+                for file in self.listFiles(query, service):
+                    rootFolder = next(rootFolderOf[parent] for parent in file["parents"] if parent in rootFolderOf)
+                    if file["mimeType"] == FOLDER_MIMETYPE and rootFolder in recursiveFolderIDs:
+                        if file["id"] not in rootFolderOf:
+                            rootFolderOf[file["id"]] = rootFolder
+                            subfolders.append(file["id"])
+                    else:
+                        filesByFolder[rootFolder].append(file)
+            foldersToList = subfolders
+
+        return filesByFolder
 
+    @metrics.timed("github.getRepo")
+    def getRepo(self, repoDir):
+        return self.getGitService().get_repo(repoDir)
 
 
+def valuesToColumns(columns:"list[list]") -> "dict[str, list]":
+    """
+    Converts the values of a sheet read by columns (as returned by batchGetValues) to {header: values}.
+    The API leaves out empty cells at the end of a column, so shorter columns are padded with "".
+    Columns without a header are left out.
+    returns: {col: [values]} in the sheet's column order
+    """
+    nRows = max((len(column) for column in columns), default=1) - 1
 
+    return {str(column[0]): list(column[1:]) + [""] * (nRows - len(column) + 1)
+            for column in columns if column and column[0] != ""}
 
+def mountConnectionPool(session, poolSize:int):
+    """
+    Mounts an HTTPAdapter keeping up to poolSize keep-alive connections per host on the requests.Session
+    session, so concurrent calls reuse connections (and TLS sessions) instead of opening new ones
+    """
+    from requests.adapters import HTTPAdapter
 
+    adapter = HTTPAdapter(pool_connections=poolSize, pool_maxsize=poolSize)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
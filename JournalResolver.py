@@ -0,0 +1,248 @@
+import argparse
+import os
+import re
+import numpy as np
+import pandas as pd
+import DataChecks as dc
+from Metrics import metrics
+
+# how a raw row was matched to a journal of the master list
+BY_NAME = "name"   # same normalized name
+BY_ISSN = "issn"   # same issn (with a valid check digit)
+BY_TRIGRAM = "trigram"   # most similar name (trigram Dice coefficient)
+DUPLICATE = "duplicate"   # matched a journal already matched by a row with a higher confidence (row not used)
+
+MIN_CONFIDENCE = 0.7   # lowest trigram similarity accepted as a match
+ISSN_CONFIDENCE = 0.8   # confidence of an issn match whose name shares no trigram with the journal
+
+# normalized raw column headers read as each column of a cleaned sheet, in order of preference
+RAW_COLUMN_ALIASES = {"journal": ["JOURNAL", "JOURNAL TITLE", "JOURNAL NAME", "TITLE", "PUBLICATION TITLE", "PUBLICATION"],
+                      "issn": ["ISSN", "PRINT ISSN", "P ISSN", "EISSN", "E ISSN", "ONLINE ISSN"],
+                      "access": ["ACCESS", "HAS ACCESS", "SUBSCRIBED", "SUBSCRIPTION", "AVAILABLE"],
+                      "notes": ["NOTES", "NOTE", "COMMENTS", "COMMENT"]}
+# raw access values (upper case) read as 1 or 0, any other value is left missing
+ACCESS_VALUES = {"1": "1", "0": "0", "1.0": "1", "0.0": "0", "YES": "1", "NO": "0", "Y": "1", "N": "0",
+                 "TRUE": "1", "FALSE": "0"}
+MATCH_COLS = ["row", "rawJournal", "rawISSN", "journal", "confidence", "method"]
+
+
+class JournalResolver:
+
+    def __init__(self, reference:dc.JournalReference, minConfidence:float=MIN_CONFIDENCE):
+        """
+        Maps journal names (and issns) written any which way in raw institutional files to the journals of the
+        master list. Built once per run from a JournalReference: normalized names (see dc.normalizeJournalName),
+        an issn -> journal map of the issns with a valid check digit, and an inverted trigram index
+        (trigram -> positions of the journals whose normalized name contains it) so the most similar name
+        is found by counting shared trigrams instead of comparing the name with every journal.
+        """
+        assert 0 < minConfidence <= 1, "minConfidence must be in (0, 1]"
+        self.reference = reference
+        self.journals = reference.journals
+        self.minConfidence = minConfidence
+
+        self.issnJournal = {}   # issn: journal, only issns of exactly one journal
+        repeatedISSNs = set()
+        for journal, issn, valid in zip(reference.journals, reference.issns, reference.validISSN):
+            if valid:
+                if issn in self.issnJournal:
+                    repeatedISSNs.add(issn)
+                self.issnJournal[issn] = journal
+        for issn in repeatedISSNs:
+            del self.issnJournal[issn]
+
+        self.trigramIDs = {}   # trigram: row of postings
+        postings = []
+        self.trigramCounts = np.zeros(len(self.journals), dtype=np.int64)   # distinct trigrams of every journal
+        for pos, journal in enumerate(self.journals):
+            trigrams = getTrigrams(dc.normalizeJournalName(journal))
+            self.trigramCounts[pos] = len(trigrams)
+            for trigram in trigrams:
+                if trigram not in self.trigramIDs:
+                    self.trigramIDs[trigram] = len(postings)
+                    postings.append([])
+                postings[self.trigramIDs[trigram]].append(pos)
+        self.postings = [np.array(positions, dtype=np.int64) for positions in postings]
+        self.journalPos = {journal: pos for pos, journal in enumerate(self.journals)}
+
+    def similarities(self, name:str) -> np.ndarray:
+        """
+        returns: trigram Dice coefficient (2 * shared trigrams / total trigrams) of name with every journal, in master order
+        """
+        trigrams = getTrigrams(dc.normalizeJournalName(name))
+        ids = [self.trigramIDs[trigram] for trigram in trigrams if trigram in self.trigramIDs]
+        if not ids:
+            return np.zeros(len(self.journals))
+        shared = np.bincount(np.concatenate([self.postings[i] for i in ids]), minlength=len(self.journals))
+
+        return 2 * shared / (self.trigramCounts + len(trigrams))
+
+    def resolve(self, name:str, issn:str=None) -> "tuple(str, float, str)":
+        """
+        Finds the journal of the master list a raw row stands for: by normalized name, then by issn,
+        then by the most similar name if its similarity reaches minConfidence
+        returns: (journal or None, confidence between 0 and 1, method: BY_NAME, BY_ISSN, BY_TRIGRAM or None)
+        """
+        name = "" if pd.isna(name) else str(name)
+        journal = self.reference.findJournal(name) if name.strip() else None
+        if journal is not None:
+            return journal, 1.0, BY_NAME
+
+        journal = self.issnJournal.get(normalizeISSN(issn))
+        if journal is not None:
+            similarity = self.similarities(name)[self.journalPos[journal]] if name.strip() else 0.0
+            return journal, ISSN_CONFIDENCE + (1 - ISSN_CONFIDENCE) * float(similarity), BY_ISSN
+
+        if not name.strip():
+            return None, 0.0, None
+        similarities = self.similarities(name)
+        best = int(np.argmax(similarities))
+        confidence = float(similarities[best])
+        if confidence < self.minConfidence:
+            return None, confidence, None
+
+        return self.journals[best], confidence, BY_TRIGRAM
+
+    def resolveRows(self, journals, issns=None) -> pd.DataFrame:
+        """
+        Resolves every raw (journal, issn) pair; repeated pairs are resolved once.
+        When several rows resolve to the same journal only the one with the highest confidence keeps it,
+        the others get the DUPLICATE method.
+        returns: pd.DataFrame with MATCH_COLS, one row per raw row (row is its position)
+        """
+        journals = list(journals)
+        issns = list(issns) if issns is not None else [None] * len(journals)
+        assert len(journals) == len(issns), "journals and issns must have the same length"
+
+        resolved = {}   # (raw journal, raw issn): resolve() result
+        with metrics.timer("resolver.resolveRows", rows=len(journals)) as event:
+            rows = []
+            for row, (name, issn) in enumerate(zip(journals, issns)):
+                key = (None if pd.isna(name) else str(name), normalizeISSN(issn))
+                if key not in resolved:
+                    resolved[key] = self.resolve(name, issn)
+                rows.append((row, name, issn, *resolved[key]))
+            matches = pd.DataFrame(rows, columns=MATCH_COLS)
+
+            ranked = matches[matches["journal"].notnull()].sort_values(["confidence", "row"], ascending=[False, True])
+            duplicated = ranked.index[ranked["journal"].duplicated()]
+            matches.loc[duplicated, "method"] = DUPLICATE
+            event["unmatched"] = int(matches["journal"].isnull().sum())
+
+        return matches
+
+    def cleanSheet(self, rawDf:pd.DataFrame) -> "tuple(pd.DataFrame, pd.DataFrame)":
+        """
+        Turns a raw institutional file into a cleaned sheet: one row per journal of the master list, in master order,
+        with the master issn and the access and notes of the raw row matched to it (see resolveRows).
+        Raw columns are found by their header (see findRawColumns); access values such as "Yes" or "TRUE"
+        are read as 1 or 0. Journals no raw row matched, and unreadable access values, are left missing
+        so the sheet fails dc.validateSheet (hasNaN) until someone fills them in.
+        returns: (cleaned df with the dc.COLS columns, matches df as returned by resolveRows)
+        """
+        rawCols = findRawColumns(rawDf.columns)
+        assert rawCols["journal"] is not None, f"no journal column found in {list(rawDf.columns)}"
+
+        matches = self.resolveRows(rawDf[rawCols["journal"]], rawDf[rawCols["issn"]] if rawCols["issn"] is not None else None)
+        used = matches[matches["journal"].notnull() & (matches["method"] != DUPLICATE)]
+        rawRowOf = pd.Series(used["row"].values, index=used["journal"].values).reindex(self.journals)
+        hasRow = rawRowOf.notnull().values
+        rawRows = rawRowOf[hasRow].astype(np.int64).values
+
+        cleaned = pd.DataFrame({"journal": self.journals, "issn": self.reference.issns,
+                                "access": pd.NA, "notes": ""}, dtype="string")
+        if rawCols["access"] is not None:
+            access = rawDf[rawCols["access"]].iloc[rawRows].astype(str).str.strip().str.upper().map(ACCESS_VALUES)
+            cleaned.loc[hasRow, "access"] = access.values
+        if rawCols["notes"] is not None:
+            notes = rawDf[rawCols["notes"]].iloc[rawRows].fillna("").astype(str)
+            cleaned.loc[hasRow, "notes"] = notes.values
+
+        return cleaned, matches
+
+
+def getTrigrams(normalizedName:str) -> "set[str]":
+    """
+    returns: set of the trigrams of every word of normalizedName, each word padded with two spaces
+    in front and one behind (so short words and word starts count more, as in PostgreSQL's pg_trgm)
+    """
+    trigrams = set()
+    for word in normalizedName.split():
+        padded = f"  {word} "
+        trigrams.update(padded[i:i+3] for i in range(len(padded) - 2))
+
+    return trigrams
+
+def normalizeISSN(issn) -> str:
+    """
+    returns: issn as NNNN-NNNC (dashes, spaces and case fixed), None if it does not have 8 digits (last one may be X)
+    """
+    if issn is None or pd.isna(issn):
+        return None
+    chars = re.sub(r"[^0-9X]", "", str(issn).upper())
+    if len(chars) != 8:
+        return None
+
+    return chars[:4] + "-" + chars[4:]
+
+def findRawColumns(columns) -> "dict[str, str]":
+    """
+    Finds the raw column to read each column of a cleaned sheet from, by their normalized header:
+    an exact alias from RAW_COLUMN_ALIASES first, then a header containing one
+    returns: {col of dc.COLS: raw column or None}
+    """
+    headers = {dc.normalizeJournalName(col): col for col in reversed(list(columns))}
+    rawCols = {}
+    for col, aliases in RAW_COLUMN_ALIASES.items():
+        rawCols[col] = next((headers[alias] for alias in aliases if alias in headers), None)
+        if rawCols[col] is None:
+            rawCols[col] = next((raw for alias in aliases for header, raw in headers.items()
+                                 if alias in header.split() or f" {alias} " in f" {header} "), None)
+
+    return rawCols
+
+def readRawFile(path:str) -> pd.DataFrame:
+    """
+    Reads a raw institutional file (.csv, or .xlsx/.xls if an excel engine is installed) with every value as a string
+    returns: pd.DataFrame
+    """
+    if path.lower().endswith((".xlsx", ".xls")):
+        return pd.read_excel(path, dtype=str)
+
+    return pd.read_csv(path, dtype=str, keep_default_na=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Matches the journals of raw institutional files to the master list "
+                                                 "and writes cleaned sheets ready for the data checks")
+    parser.add_argument("files", nargs="*", help=".csv or .xlsx raw files (the raw folder on Google Drive if none given)")
+    parser.add_argument("--journals", help="csv file with the journal and issn columns "
+                                           "(read from the master sheet on Google Drive if not given)")
+    parser.add_argument("--out", default="resolved", help="directory the cleaned sheets and their matches are written to")
+    parser.add_argument("--min-confidence", type=float, default=MIN_CONFIDENCE)
+    args = parser.parse_args()
+
+    import testMainDebug as tm
+    handler = None
+    if args.journals:
+        import Backfill
+        reference = dc.JournalReference.fromDataFrame(Backfill.loadJournals(args.journals))
+    else:
+        handler = tm.newHandler()
+        reference = tm.getJournalReference(handler)
+    resolver = JournalResolver(reference, args.min_confidence)
+
+    if args.files:
+        rawFiles = ((os.path.splitext(os.path.basename(path))[0], readRawFile(path)) for path in args.files)
+    else:
+        handler = handler or tm.newHandler()
+        rawFiles = tm.fetchRawSheets(handler)
+
+    os.makedirs(args.out, exist_ok=True)
+    for name, rawDf in rawFiles:
+        cleaned, matches = resolver.cleanSheet(rawDf)
+        cleaned.to_csv(os.path.join(args.out, f"{name}.csv"), index=False)
+        matches.to_csv(os.path.join(args.out, f"{name}.matches.csv"), index=False)
+        counts = matches["method"].fillna("unmatched").value_counts().to_dict()
+        print(f"{name}: {len(matches)} raw rows {counts}, {int(cleaned['access'].notnull().sum())} of {len(resolver.journals)} journals filled")
+        print(dc.validateSheet(cleaned, reference, name), end="\n\n")
@@ -0,0 +1,294 @@
+from io import BytesIO
+import json
+import os
+import struct
+import sys
+import numpy as np
+import pandas as pd
+
+MAIN_DB_COLS = ["university", "journal", "issn", "access", "notes"]
+# repeated names are stored once per chunk as categories, access as a single byte
+MAIN_DB_DTYPES = {"university": "category", "journal": "category", "issn": "category",
+                  "access": "int8", "notes": "string"}
+
+
+class MainDB:
+
+    def __init__(self, path:str="data/from-GDrive/mainDB.csv", chunksize:int=100000):
+        """
+        Read-only access to mainDB.csv that streams the file in chunks of chunksize rows,
+        so memory use depends on the chunk size and not on the size of the file.
+        """
+        assert type(chunksize) == int and chunksize > 0, "chunksize must be an int and at least 1"
+
+        self.path = path
+        self.content = None
+        self.chunksize = chunksize
+
+    @classmethod
+    def fromBytes(cls, content:bytes, chunksize:int=100000) -> "MainDB":
+        """
+        returns: MainDB reading from the contents of a mainDB.csv (e.g. ContentFile.decoded_content)
+        """
+        mainDB = cls(None, chunksize)
+        mainDB.content = content if type(content) == bytes else content.encode("utf-8")
+        return mainDB
+
+    def openSource(self):
+        if self.content is not None:
+            return BytesIO(self.content)
+        return self.path
+
+    def iterChunks(self, columns:list=None):
+        """
+        Reads mainDB.csv chunk by chunk, parsing only the columns given (all of MAIN_DB_COLS by default)
+        returns: generator of pd.DataFrame chunks typed with MAIN_DB_DTYPES
+        """
+        columns = list(columns or MAIN_DB_COLS)
+        assert set(columns) <= set(MAIN_DB_COLS), f"columns must be in {MAIN_DB_COLS}"
+
+        dtypes = {col: MAIN_DB_DTYPES[col] for col in columns}
+        reader = pd.read_csv(self.openSource(), usecols=columns, dtype=dtypes, chunksize=self.chunksize)
+        for chunk in reader:
+            yield chunk[columns]
+
+    def read(self, columns:list=None) -> pd.DataFrame:
+        """
+        Reads the whole of mainDB.csv (only the columns given), for small DBs or callers that need every row
+        returns: pd.DataFrame typed with MAIN_DB_DTYPES
+        """
+        columns = list(columns or MAIN_DB_COLS)
+        chunks = list(self.iterChunks(columns))
+        if not chunks:
+            return pd.DataFrame({col: pd.Series(dtype=MAIN_DB_DTYPES[col]) for col in columns})
+
+        df = pd.concat(chunks, ignore_index=True)   # categories differing between chunks fall back to object
+        return df.astype({col: MAIN_DB_DTYPES[col] for col in columns})
+
+    def countAccess(self, by:str) -> pd.DataFrame:
+        """
+        Counts, for every value of the by column, the rows listed and the rows with access
+        returns: pd.DataFrame indexed by the by column with int columns "listed" and "withAccess"
+        """
+        counts = pd.DataFrame({"listed": [], "withAccess": []}, dtype="int64")
+        for chunk in self.iterChunks([by, "access"]):
+            grouped = chunk.groupby(by, observed=True)["access"]
+            chunkCounts = pd.DataFrame({"listed": grouped.size(), "withAccess": grouped.sum()})
+            chunkCounts.index = chunkCounts.index.astype(str)
+            counts = counts.add(chunkCounts, fill_value=0)
+
+        counts = counts.astype("int64")
+        counts.index.name = by
+        return counts
+
+    def accessRateByUniversity(self) -> pd.Series:
+        """
+        returns: pd.Series with the fraction of listed journals each university has access to
+        """
+        counts = self.countAccess("university")
+        return (counts["withAccess"] / counts["listed"]).rename("accessRate")
+
+    def coverageByISSN(self) -> pd.Series:
+        """
+        returns: pd.Series with the fraction of universities that have access to each ISSN
+        """
+        counts = self.countAccess("issn")
+        return (counts["withAccess"] / counts["listed"]).rename("coverage")
+
+    def universitiesWithAccess(self, journal:str) -> "list[str]":
+        """
+        returns: list of the universities that have access to journal
+        """
+        universities = []
+        for chunk in self.iterChunks(["university", "journal", "access"]):
+            rows = chunk[(chunk["journal"] == journal).values & (chunk["access"] == 1).values]
+            universities.extend(rows["university"].astype(str))
+
+        return list(dict.fromkeys(universities))
+
+    def getUniversities(self) -> "list[str]":
+        """
+        returns: list of every university in mainDB.csv, in the order they were added
+        """
+        universities = {}
+        for chunk in self.iterChunks(["university"]):
+            universities.update(dict.fromkeys(chunk["university"].astype(str)))
+
+        return list(universities)
+
+
+SNAPSHOT_MAGIC = b"MAINDB01"
+SNAPSHOT_ALIGNMENT = 64   # every array starts at a multiple of this many bytes
+SNAPSHOT_DICT_COLS = ["university", "journal", "issn"]
+
+
+def alignTo(n:int, alignment:int=SNAPSHOT_ALIGNMENT) -> int:
+    return -(-n // alignment) * alignment
+
+def buildSnapshot(mainDB:MainDB) -> bytes:
+    """
+    Builds a binary snapshot of mainDB (streamed chunk by chunk) with the university, journal and issn
+    columns dictionary encoded as int32 codes (-1 for missing values) and access as a bitmap.
+    Layout: SNAPSHOT_MAGIC, uint64 header length, JSON header (rows, dictionaries and the dtype, shape and
+    offset of each array relative to the data section), then the data section with every array aligned
+    to SNAPSHOT_ALIGNMENT bytes so it can be memory-mapped as is by MainDBSnapshot.
+    returns: bytes of the snapshot
+    """
+    dictionaries = {col: {} for col in SNAPSHOT_DICT_COLS}
+    codeChunks = {col: [] for col in SNAPSHOT_DICT_COLS}
+    accessChunks = []
+
+    for chunk in mainDB.iterChunks(SNAPSHOT_DICT_COLS + ["access"]):
+        for col in SNAPSHOT_DICT_COLS:
+            values = chunk[col].cat.categories.astype(str)
+            valueCodes = np.array([dictionaries[col].setdefault(value, len(dictionaries[col])) for value in values] + [-1],
+                                  dtype=np.int32)
+            codeChunks[col].append(valueCodes[chunk[col].cat.codes.values])   # code -1 (missing) maps to the last item
+        accessChunks.append(chunk["access"].values == 1)
+
+    rows = sum(len(access) for access in accessChunks)
+    arrays = {col: np.concatenate(codeChunks[col]) if rows else np.zeros(0, dtype=np.int32) for col in SNAPSHOT_DICT_COLS}
+    arrays["access"] = np.packbits(np.concatenate(accessChunks)) if rows else np.zeros(0, dtype=np.uint8)
+
+    header = {"rows": rows, "dictionaries": {col: list(dictionaries[col]) for col in SNAPSHOT_DICT_COLS}, "arrays": {}}
+    offset = 0
+    for name, array in arrays.items():
+        header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset = alignTo(offset + array.nbytes)
+
+    headerBytes = json.dumps(header).encode("utf-8")
+    dataStart = alignTo(len(SNAPSHOT_MAGIC) + 8 + len(headerBytes))
+    snapshot = bytearray(dataStart + offset)
+    snapshot[:len(SNAPSHOT_MAGIC)] = SNAPSHOT_MAGIC
+    snapshot[len(SNAPSHOT_MAGIC):len(SNAPSHOT_MAGIC)+8] = struct.pack("<Q", len(headerBytes))
+    snapshot[len(SNAPSHOT_MAGIC)+8:len(SNAPSHOT_MAGIC)+8+len(headerBytes)] = headerBytes
+    for name, array in arrays.items():
+        start = dataStart + header["arrays"][name]["offset"]
+        snapshot[start:start+array.nbytes] = array.tobytes()
+
+    return bytes(snapshot)
+
+
+class MainDBSnapshot:
+
+    def __init__(self, path:str="data/from-GDrive/mainDB.snapshot"):
+        """
+        Zero-copy reader of a snapshot written by buildSnapshot: the arrays are memory-mapped
+        from the file, so opening it costs only reading the header.
+        """
+        with open(path, "rb") as f:
+            headerStart = f.read(len(SNAPSHOT_MAGIC) + 8)
+            self.header, dataStart = parseSnapshotHeader(headerStart, f.read)
+
+        self.rows = self.header["rows"]
+        self.dictionaries = self.header["dictionaries"]
+        self.arrays = {}
+        for name, spec in self.header["arrays"].items():
+            if spec["shape"][0] == 0:
+                self.arrays[name] = np.zeros(spec["shape"], dtype=spec["dtype"])
+            else:
+                self.arrays[name] = np.memmap(path, dtype=spec["dtype"], mode="r",
+                                              offset=dataStart + spec["offset"], shape=tuple(spec["shape"]))
+
+    @classmethod
+    def fromBytes(cls, snapshot:bytes) -> "MainDBSnapshot":
+        """
+        returns: MainDBSnapshot viewing (without copying) the arrays of a snapshot already in memory
+        """
+        reader = cls.__new__(cls)
+        position = len(SNAPSHOT_MAGIC) + 8
+
+        def readHeader(n):
+            return snapshot[position:position+n]
+
+        reader.header, dataStart = parseSnapshotHeader(snapshot[:position], readHeader)
+        reader.rows = reader.header["rows"]
+        reader.dictionaries = reader.header["dictionaries"]
+        reader.arrays = {name: np.frombuffer(snapshot, dtype=spec["dtype"], count=int(np.prod(spec["shape"])),
+                                             offset=dataStart + spec["offset"])
+                         for name, spec in reader.header["arrays"].items()}
+        return reader
+
+    def getCodes(self, col:str) -> np.ndarray:
+        """
+        returns: np.ndarray of the int32 dictionary codes of col (-1 for missing values)
+        """
+        return self.arrays[col]
+
+    def getColumn(self, col:str) -> pd.Categorical:
+        """
+        returns: pd.Categorical of col decoded with its dictionary
+        """
+        return pd.Categorical.from_codes(self.arrays[col], self.dictionaries[col])
+
+    def getAccess(self) -> np.ndarray:
+        """
+        returns: boolean np.ndarray with True for rows with access
+        """
+        return np.unpackbits(self.arrays["access"])[:self.rows].astype(bool)
+
+    def toDataFrame(self) -> pd.DataFrame:
+        """
+        returns: pd.DataFrame with the university, journal, issn and access columns typed as in MAIN_DB_DTYPES
+        """
+        df = pd.DataFrame({col: self.getColumn(col) for col in SNAPSHOT_DICT_COLS})
+        df["access"] = self.getAccess().astype(np.int8)
+        return df
+
+
+def parseSnapshotHeader(headerStart:bytes, read) -> "tuple(dict, int)":
+    """
+    Parses the header of a snapshot from its first len(SNAPSHOT_MAGIC) + 8 bytes,
+    calling read(n) to get the n bytes of JSON that follow
+    returns: (header dict, offset of the data section)
+    """
+    if headerStart[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+        raise ValueError("not a mainDB snapshot (bad magic bytes)")
+    headerLen = struct.unpack("<Q", headerStart[len(SNAPSHOT_MAGIC):])[0]
+    header = json.loads(bytes(read(headerLen)).decode("utf-8"))
+
+    return header, alignTo(len(SNAPSHOT_MAGIC) + 8 + headerLen)
+
+def snapshotMatchesCSV(mainDB:MainDB, snapshot:MainDBSnapshot) -> "tuple(bool, list)":
+    """
+    Compares a snapshot with the mainDB.csv it should have been built from, chunk by chunk
+    returns: (True, []) if they hold the same data, (False, [problems]) otherwise
+    """
+    problems = []
+    access = snapshot.getAccess()
+    start = 0
+    for chunk in mainDB.iterChunks(SNAPSHOT_DICT_COLS + ["access"]):
+        end = start + len(chunk)
+        if end > snapshot.rows:
+            problems.append(f"csv has more rows than the snapshot ({snapshot.rows})")
+            return False, problems
+        for col in SNAPSHOT_DICT_COLS:
+            expected = chunk[col].astype(object).where(chunk[col].notnull(), None).values
+            decoded = np.asarray(snapshot.getColumn(col)[start:end].astype(object))
+            decoded = np.where(pd.isnull(decoded), None, decoded)
+            mismatched = np.flatnonzero(expected != decoded)
+            if len(mismatched) > 0:
+                problems.append(f"{col} differs at rows {(mismatched[:10] + start).tolist()}")
+        mismatched = np.flatnonzero((chunk["access"].values == 1) != access[start:end])
+        if len(mismatched) > 0:
+            problems.append(f"access differs at rows {(mismatched[:10] + start).tolist()}")
+        start = end
+
+    if start != snapshot.rows:
+        problems.append(f"csv has {start} rows but the snapshot has {snapshot.rows}")
+
+    return len(problems) == 0, problems
+
+
+if __name__ == "__main__":
+    # python MainDB.py [mainDB.csv] [mainDB.snapshot]: rebuilds the snapshot if missing, then checks it against the csv
+    csvPath = sys.argv[1] if len(sys.argv) > 1 else "data/from-GDrive/mainDB.csv"
+    snapshotPath = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(csvPath)[0] + ".snapshot"
+    if not os.path.exists(snapshotPath):
+        with open(snapshotPath, "wb") as f:
+            f.write(buildSnapshot(MainDB(csvPath)))
+        print(f"Snapshot written to {snapshotPath}")
+
+    isConsistent, problems = snapshotMatchesCSV(MainDB(csvPath), MainDBSnapshot(snapshotPath))
+    print("Snapshot matches csv" if isConsistent else "Snapshot does not match csv:\n" + "\n".join(problems))
+    sys.exit(0 if isConsistent else 1)
@@ -0,0 +1,125 @@
+import datetime
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+
+class RunMetrics:
+
+    def __init__(self):
+        """
+        Collects timing events (name, latency, rows, bytes and any extra fields) for one pipeline run.
+        Safe to use from the fetching threads.
+        """
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.runID = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%S.%fZ")
+        self.events = []
+
+    def record(self, name:str, seconds:float=0.0, **fields):
+        """
+        Records one event; fields such as rows, bytes or sheetID are kept as given
+        """
+        event = {"run": self.runID, "event": name, "seconds": seconds, **fields}
+        with self.lock:
+            self.events.append(event)
+
+    @contextmanager
+    def timer(self, name:str, **fields):
+        """
+        Times the body of a with statement and records it as an event. The yielded dict can be
+        filled with more fields (e.g. rows or bytes) inside the body. Exceptions are recorded and re-raised.
+        """
+        start = time.perf_counter()
+        try:
+            yield fields
+        except Exception as e:
+            fields["error"] = type(e).__name__
+            raise
+        finally:
+            self.record(name, time.perf_counter() - start, **fields)
+
+    def timed(self, name:str, rows=None, nbytes=None, fields=None):
+        """
+        Decorator recording every call of the decorated function as an event called name.
+        rows, nbytes and fields are optional callables (result, args, kwargs) -> value computed after each
+        successful call; fields must return a dict of extra fields. If one of them fails, its value is left out.
+        """
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.timer(name) as eventFields:
+                    result = function(*args, **kwargs)
+                    try:
+                        if rows is not None:
+                            eventFields["rows"] = rows(result, args, kwargs)
+                        if nbytes is not None:
+                            eventFields["bytes"] = nbytes(result, args, kwargs)
+                        if fields is not None:
+                            eventFields.update(fields(result, args, kwargs))
+                    except Exception:
+                        pass   # instrumentation never fails the call
+                return result
+            return wrapper
+        return decorator
+
+    def summary(self) -> "dict[str, dict]":
+        """
+        returns: {event name: {"calls", "errors", "seconds", "maxSeconds", "rows", "bytes"}} over all recorded events
+        """
+        totals = {}
+        with self.lock:
+            events = list(self.events)
+        for event in events:
+            total = totals.setdefault(event["event"], {"calls": 0, "errors": 0, "seconds": 0.0, "maxSeconds": 0.0,
+                                                       "rows": 0, "bytes": 0})
+            total["calls"] += 1
+            total["errors"] += "error" in event
+            total["seconds"] += event["seconds"]
+            total["maxSeconds"] = max(total["maxSeconds"], event["seconds"])
+            total["rows"] += event.get("rows", 0) or 0
+            total["bytes"] += event.get("bytes", 0) or 0
+
+        return totals
+
+    def writeReport(self, path:str):
+        """
+        Appends every event of the run, then one "summary" line per event name, to path as JSON lines
+        """
+        with self.lock:
+            events = list(self.events)
+        with open(path, "a") as f:
+            for event in events:
+                f.write(json.dumps(event, default=str) + "\n")
+            for name, total in self.summary().items():
+                f.write(json.dumps({"run": self.runID, "event": "summary", "name": name, **total}) + "\n")
+
+
+def lenOfResult(result, args, kwargs) -> int:
+    return len(result)
+
+def lenOfArg(i:int):
+    """
+    returns: callable for RunMetrics.timed giving the len() of the i-th positional argument
+    """
+    return lambda result, args, kwargs: len(args[i])
+
+def sizeOfRecords(records:"list[dict]") -> int:
+    """
+    returns: approximate number of bytes of the values in records (as returned by get_all_records)
+    """
+    return sum(len(str(value)) for record in records for value in record.values())
+
+def sizeOfValueRanges(valueRanges:"list[list[list]]") -> int:
+    """
+    returns: approximate number of bytes of the values in valueRanges (as returned by Handler.batchGetValues)
+    """
+    return sum(len(str(value)) for values in valueRanges for line in values for value in line)
+
+
+# shared by every module of the pipeline
+metrics = RunMetrics()
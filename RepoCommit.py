@@ -0,0 +1,116 @@
+import base64
+import hashlib
+from Metrics import metrics
+
+BLOB_MODE = "100644"
+
+
+class RepoCommit:
+
+    def __init__(self, repo, branch:str="main"):
+        """
+        Stages file writes to a PyGithub Repository and pushes all of them as a single commit on branch
+        through the Git Data API (blobs, tree, commit, ref) instead of one contents API commit per file.
+        Files whose content is already in the branch are not uploaded again.
+        """
+        self.repo = repo
+        self.branch = branch
+        with metrics.timer("github.getHead", branch=branch):
+            self.ref = repo.get_git_ref(f"heads/{branch}")
+            self.parent = repo.get_git_commit(self.ref.object.sha)
+            tree = repo.get_git_tree(self.parent.tree.sha, recursive=True)
+        self.blobSHAs = {element.path: element.sha for element in tree.tree if element.type == "blob"}   # path: blob SHA on branch
+        self.staged = {}   # path: bytes, None to delete the path
+
+    def exists(self, path:str) -> bool:
+        """
+        returns: True if path is a file on the branch or staged by add() (and not staged for removal), False otherwise
+        """
+        if path in self.staged:
+            return self.staged[path] is not None
+
+        return path in self.blobSHAs
+
+    def read(self, path:str) -> bytes:
+        """
+        Reads path as it is on the branch (staged content if path was staged), through the blobs API
+        so files larger than the contents API limit (1 MB) can be read
+        returns: bytes
+        """
+        if path in self.staged:
+            assert self.staged[path] is not None, f"{path} is staged for deletion"
+            return self.staged[path]
+
+        with metrics.timer("github.get_git_blob", path=path) as event:
+            blob = self.repo.get_git_blob(self.blobSHAs[path])
+            content = base64.b64decode(blob.content) if blob.encoding == "base64" else blob.content.encode("utf-8")
+            event["bytes"] = len(content)
+
+        return content
+
+    def add(self, path:str, content):
+        """
+        Stages content (str or bytes) to be written to path by the next push()
+        """
+        self.staged[path] = content if type(content) == bytes else content.encode("utf-8")
+
+    def remove(self, path:str):
+        """
+        Stages the deletion of path by the next push() (nothing happens if path is not on the branch)
+        """
+        self.staged[path] = None
+
+    def getChanged(self) -> "dict[str, bytes]":
+        """
+        returns: {path: content} of the staged files whose content differs from the branch (None for files to delete)
+        """
+        return {path: content for path, content in self.staged.items()
+                if (path in self.blobSHAs if content is None else self.blobSHAs.get(path) != gitBlobSHA(content))}
+
+    def push(self, message:str) -> str:
+        """
+        Uploads a blob for every changed staged file (utf-8 text as is, other files base64 encoded),
+        creates one tree on top of the branch's tree (without the removed files) and one commit, then moves the branch to it.
+        Fails (GithubException) without changing the branch if the branch moved since this RepoCommit was created.
+        returns: SHA of the commit, or of the branch's head if no staged file changed
+        """
+        from github import InputGitTreeElement
+
+        changed = self.getChanged()
+        if not changed:
+            self.staged = {}
+            return self.parent.sha
+
+        with metrics.timer("github.commit", files=len(changed), bytes=sum(len(content or b"") for content in changed.values())):
+            elements = []
+            for path, content in changed.items():
+                if content is None:
+                    elements.append(InputGitTreeElement(path, BLOB_MODE, "blob", sha=None))
+                    continue
+                with metrics.timer("github.create_git_blob", path=path, bytes=len(content)):
+                    try:
+                        blob = self.repo.create_git_blob(content.decode("utf-8"), "utf-8")
+                    except UnicodeDecodeError:
+                        blob = self.repo.create_git_blob(base64.b64encode(content).decode("ascii"), "base64")
+                elements.append(InputGitTreeElement(path, BLOB_MODE, "blob", sha=blob.sha))
+
+            tree = self.repo.create_git_tree(elements, self.parent.tree)
+            commit = self.repo.create_git_commit(message, tree, [self.parent])
+            self.ref.edit(commit.sha)
+
+        for path, content in changed.items():
+            if content is None:
+                del self.blobSHAs[path]
+            else:
+                self.blobSHAs[path] = gitBlobSHA(content)
+        self.parent = commit
+        self.staged = {}
+
+        return commit.sha
+
+
+def gitBlobSHA(content:bytes) -> str:
+    """
+    returns: the SHA git gives a blob with this content
+    """
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
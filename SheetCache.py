@@ -0,0 +1,126 @@
+import hashlib
+import os
+import threading
+import numpy as np
+from Metrics import metrics
+
+
+class SheetCache:
+
+    def __init__(self, cacheDir:str=".sheetCache", maxBytes:int=256*1024**2):
+        """
+        On-disk cache of Google Sheets contents. Every entry is one compressed .npz file
+        holding one array per sheet column, keyed by the Drive file ID and a version string
+        (md5Checksum or modifiedTime), so an entry is only served while the file is unchanged.
+        The least recently used entries are evicted once the cache grows past maxBytes.
+        """
+        assert type(maxBytes) == int and maxBytes > 0, "maxBytes must be an int and at least 1"
+
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()   # the cache is shared by the fetching threads
+        os.makedirs(self.cacheDir, exist_ok=True)
+
+    def getEntryPath(self, fileID:str, version:str) -> str:
+        versionKey = hashlib.sha1(str(version).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.cacheDir, f"{fileID}.{versionKey}.npz")
+
+    @metrics.timed("sheetCache.get", fields=lambda result, args, kwargs: {"hit": result is not None})
+    def get(self, fileID:str, version:str) -> "dict[str, np.ndarray]":
+        """
+        Looks up the cached contents of fileID at version
+        returns: {col: np.ndarray} in the sheet's column order, None if not cached
+        """
+        path = self.getEntryPath(fileID, version)
+        try:
+            with np.load(path, allow_pickle=False) as npz:
+                colNames = list(npz["__columns__"])
+                columns = {name: npz[f"col{i}"] for i, name in enumerate(colNames)}
+            os.utime(path)   # marks the entry as recently used for eviction
+        except (OSError, KeyError, ValueError):
+            with self.lock:
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.hits += 1
+        return columns
+
+    @metrics.timed("sheetCache.put")
+    def put(self, fileID:str, version:str, columns:"dict[str, list]") -> "dict[str, np.ndarray]":
+        """
+        Stores the contents of fileID at version, replacing any older version of the same file
+        returns: {col: np.ndarray} as it would be returned by get(fileID, version)
+        """
+        arrays = {name: toColumnArray(values) for name, values in columns.items()}
+        path = self.getEntryPath(fileID, version)
+
+        npzArrays = {f"col{i}": array for i, array in enumerate(arrays.values())}
+        npzArrays["__columns__"] = np.array(list(arrays.keys()), dtype=str)
+
+        tmpPath = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmpPath, "wb") as f:
+            np.savez_compressed(f, **npzArrays)
+
+        with self.lock:
+            for entry in os.listdir(self.cacheDir):
+                if entry.startswith(fileID + ".") and entry.endswith(".npz"):
+                    os.remove(os.path.join(self.cacheDir, entry))
+            os.replace(tmpPath, path)
+
+            self.evictLocked()
+        return arrays
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache is at most maxBytes
+        """
+        with self.lock:
+            self.evictLocked()
+
+    def evictLocked(self):
+        entries = []
+        for entry in os.listdir(self.cacheDir):
+            if entry.endswith(".npz"):
+                stat = os.stat(os.path.join(self.cacheDir, entry))
+                entries.append((stat.st_mtime, stat.st_size, entry))
+
+        totalBytes = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if totalBytes <= self.maxBytes:
+                break
+            try:
+                os.remove(os.path.join(self.cacheDir, entry))
+            except FileNotFoundError:
+                pass
+            totalBytes -= size
+            self.evictions += 1
+
+    def getStats(self) -> dict:
+        """
+        returns: {"hits", "misses", "evictions", "entries", "bytes"} for this cache
+        """
+        sizes = [os.path.getsize(os.path.join(self.cacheDir, entry))
+                 for entry in os.listdir(self.cacheDir) if entry.endswith(".npz")]
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "entries": len(sizes), "bytes": sum(sizes)}
+
+
+def toColumnArray(values:list) -> np.ndarray:
+    """
+    Converts one column of sheet values to a typed np.ndarray that can be saved without pickling.
+    Columns of only ints, floats or bools keep their type; any other column is stored as str.
+    returns: np.ndarray
+    """
+    types = {type(value) for value in values}
+    if types == {bool}:
+        return np.array(values, dtype=bool)
+    if types == {int}:
+        return np.array(values, dtype=np.int64)
+    if types and types <= {int, float}:
+        return np.array(values, dtype=np.float64)
+
+    return np.array([str(value) for value in values], dtype=str)
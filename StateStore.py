@@ -0,0 +1,149 @@
+import datetime
+import hashlib
+import sqlite3
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    import pandas as pd
+
+# outcomes recorded for a sheet
+FAILED = "failed"   # did not pass DataChecks or could not be added to the repo
+MERGED = "merged"   # merged to mainDB.csv
+
+COLUMNS = ["sheetID", "name", "contentHash", "outcome", "commitSHA", "version", "syncedToDrive", "updatedAt"]
+
+
+class StateStore:
+
+    def __init__(self, dbPath:str="sheetState.db"):
+        """
+        Persistent record of every sheet the pipeline has processed (ID, name, content hash,
+        validation outcome, commit SHA and Drive version), stored in SQLite.
+        All records are kept in a dict keyed by sheet ID so lookups are O(1).
+        """
+        self.dbPath = dbPath
+        self.conn = sqlite3.connect(dbPath)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS sheets (
+                                 sheetID TEXT PRIMARY KEY, name TEXT, contentHash TEXT, outcome TEXT,
+                                 commitSHA TEXT, version TEXT, syncedToDrive INTEGER, updatedAt TEXT)""")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+        cursor = self.conn.execute(f"SELECT {', '.join(COLUMNS)} FROM sheets")
+        self.sheets = {row[0]: dict(zip(COLUMNS, row)) for row in cursor}
+
+    def get(self, sheetID:str) -> dict:
+        """
+        returns: the record of sheetID as a dict with COLUMNS as keys, None if never recorded
+        """
+        return self.sheets.get(sheetID)
+
+    def isProcessed(self, sheetID:str) -> bool:
+        """
+        returns: True if sheetID was already merged to mainDB.csv on a previous run, False otherwise
+        """
+        record = self.sheets.get(sheetID)
+        return record is not None and record["outcome"] == MERGED
+
+    def isResubmitted(self, sheetID:str, version:str) -> bool:
+        """
+        returns: True if sheetID was merged at a known Drive version other than version, False otherwise
+        """
+        record = self.sheets.get(sheetID)
+        return (record is not None and record["outcome"] == MERGED and record["version"] is not None
+                and version is not None and record["version"] != version)
+
+    def record(self, sheetID:str, name:str, outcome:str, contentHash:str=None, commitSHA:str=None,
+               version:str=None, syncedToDrive:bool=False):
+        """
+        Inserts or replaces the record of sheetID
+        """
+        assert outcome in [FAILED, MERGED], f"outcome must be one of {FAILED} or {MERGED}"
+
+        self.writeRecords([newRecord(sheetID, name, outcome, contentHash, commitSHA, version, syncedToDrive)])
+
+    def writeRecords(self, records:"list[dict]"):
+        """
+        Inserts or replaces every record in records in a single transaction
+        """
+        self.conn.executemany(f"INSERT OR REPLACE INTO sheets ({', '.join(COLUMNS)}) VALUES ({', '.join('?'*len(COLUMNS))})",
+                              [[record[col] for col in COLUMNS] for record in records])
+        self.conn.commit()
+        for record in records:
+            self.sheets[record["sheetID"]] = record
+
+    def seedFromTrackingSheet(self, sheets):
+        """
+        Records the sheets listed in the SheetsUpdatedToRepo sheet on Google Drive ({sheetID: uniName},
+        or a list of sheet IDs without names) as merged and synced, for sheets not already in the store
+        (e.g. on the first run, or when the store was lost). Merged sheets recorded without a name get theirs.
+        """
+        if not isinstance(sheets, dict):
+            sheets = dict.fromkeys(sheets, "")
+        records = [newRecord(sheetID, name, MERGED, syncedToDrive=True)
+                   for sheetID, name in sheets.items() if not self.isProcessed(sheetID)]
+        records += [dict(self.sheets[sheetID], name=name) for sheetID, name in sheets.items()
+                    if name and self.isProcessed(sheetID) and not self.sheets[sheetID]["name"]]
+        if records:
+            self.writeRecords(records)
+
+    def getMergedByName(self, name:str) -> "list[str]":
+        """
+        returns: IDs of the merged sheets recorded under name (the university name)
+        """
+        return [sheetID for sheetID, record in self.sheets.items() if record["outcome"] == MERGED and record["name"] == name]
+
+    def setVersions(self, versions:"dict[str, str]"):
+        """
+        Sets the Drive version (and updatedAt) of every recorded sheet in versions (sheetID: version) in a single transaction
+        """
+        versions = {sheetID: version for sheetID, version in versions.items() if sheetID in self.sheets}
+        updatedAt = datetime.datetime.utcnow().isoformat() + "Z"
+        self.conn.executemany("UPDATE sheets SET version = ?, updatedAt = ? WHERE sheetID = ?",
+                              [(version, updatedAt, sheetID) for sheetID, version in versions.items()])
+        self.conn.commit()
+        for sheetID, version in versions.items():
+            self.sheets[sheetID].update(version=version, updatedAt=updatedAt)
+
+    def getMeta(self, key:str) -> str:
+        """
+        returns: the value stored under key by setMeta (e.g. the version of the tracking sheet last seeded from), None if not set
+        """
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def setMeta(self, key:str, value:str):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+        self.conn.commit()
+
+    def getUnsynced(self) -> "list[dict]":
+        """
+        returns: records of merged sheets that are not yet in the SheetsUpdatedToRepo sheet on Google Drive
+        """
+        return [record for record in self.sheets.values() if record["outcome"] == MERGED and not record["syncedToDrive"]]
+
+    def markSynced(self, sheetIDs:list):
+        self.conn.executemany("UPDATE sheets SET syncedToDrive = 1 WHERE sheetID = ?", [(sheetID,) for sheetID in sheetIDs])
+        self.conn.commit()
+        for sheetID in sheetIDs:
+            self.sheets[sheetID]["syncedToDrive"] = 1
+
+    def close(self):
+        self.conn.close()
+
+
+def newRecord(sheetID:str, name:str, outcome:str, contentHash:str=None, commitSHA:str=None,
+              version:str=None, syncedToDrive:bool=False) -> dict:
+    return {"sheetID": sheetID, "name": name, "contentHash": contentHash, "outcome": outcome,
+            "commitSHA": commitSHA, "version": version, "syncedToDrive": int(syncedToDrive),
+            "updatedAt": datetime.datetime.utcnow().isoformat() + "Z"}
+
+
+def hashDataFrame(df:"pd.DataFrame") -> str:
+    """
+    Hashes the contents of df (column names and values, not the index)
+    returns: hex digest str
+    """
+    import pandas as pd
+
+    h = hashlib.sha1(",".join(str(col) for col in df.columns).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return h.hexdigest()
@@ -0,0 +1,133 @@
+import argparse
+import datetime
+import json
+import os
+import time
+import StateStore as ss
+import testMainDebug as tm
+from Metrics import metrics
+
+# StateStore meta keys
+PAGE_TOKEN_KEY = "changesPageToken"   # Drive changes page token the next run lists changes from
+RETRY_SHEETS_KEY = "retrySheets"   # {sheetID: [uniName, version]} of sheets that could not be read or committed, as JSON
+SPREADSHEET_MIMETYPE = "application/vnd.google-apps.spreadsheet"
+# folders whose sheets are merged to mainDB.csv
+WATCHED_FOLDERS = {tm.FOLDER_CLEANED_ID, tm.FOLDER_BYHAND_ID}
+# seconds between two runs in watch mode
+WATCH_INTERVAL = int(os.environ.get("WATCH_INTERVAL", 300))
+
+
+def getChangedSheets(changes:list, store:ss.StateStore) -> "tuple(dict, dict)":
+    """
+    Picks from a list of Drive changes (as returned by Handler.listChanges) the sheets in WATCHED_FOLDERS
+    that were added or modified and are not merged to mainDB.csv yet, or were merged at another version
+    (resubmitted, see StateStore.isResubmitted). Only the last change of each file counts.
+    returns: ({sheetID: uniName}, {sheetID: version})
+    """
+    lastChanges = {change["fileId"]: change for change in changes}
+
+    changedSheets = {}
+    versions = {}
+    for fileID, change in lastChanges.items():
+        file = change.get("file")
+        if change.get("removed") or file is None or file.get("trashed"):
+            continue
+        if file["mimeType"] != SPREADSHEET_MIMETYPE or not WATCHED_FOLDERS.intersection(file.get("parents", [])):
+            continue
+        if not store.isProcessed(fileID) or store.get(fileID)["version"] != file["modifiedTime"]:
+            changedSheets[fileID] = file["name"]
+            versions[fileID] = file["modifiedTime"]
+
+    return changedSheets, versions
+
+def getUnsettledSheets(store:ss.StateStore, pendingSheets:dict, versions:dict, runStart:str) -> dict:
+    """
+    returns: {sheetID: [uniName, version]} of the pending sheets that got no record in store since runStart
+    (they could not be read or committed, or are resubmissions that did not pass, so no outcome was decided for them)
+    """
+    unsettled = {}
+    for sheetID, uniName in pendingSheets.items():
+        record = store.get(sheetID)
+        if record is None or record["updatedAt"] < runStart:
+            unsettled[sheetID] = [uniName, versions.get(sheetID)]
+
+    return unsettled
+
+def runOnce(handler) -> list:
+    """
+    Processes the sheets added or modified since the Drive changes page token kept in the StateStore,
+    plus the sheets left unsettled by the previous run, then moves the token forward.
+    Without a saved token (first run, or lost state) every folder is listed like testMainDebug.main() does,
+    starting the changes feed from before the listing so no change is missed.
+    returns: list of the sheet IDs merged
+    """
+    runStart = datetime.datetime.utcnow().isoformat() + "Z"
+    store = ss.StateStore(tm.STATE_DB_PATH)
+    try:
+        tm.seedStateStore(handler, store)
+        failureLog = {}
+
+        pageToken = store.getMeta(PAGE_TOKEN_KEY)
+        with metrics.timer("stage.changes", fullScan=pageToken is None) as event:
+            if pageToken is None:
+                newPageToken = handler.getStartPageToken()
+                CLEANED_SHEETS_IDs, FILES_IN_RAW_IDs, versions = tm.getAllFileIDs(handler)
+                pendingSheets = tm.getPendingSheets(store, CLEANED_SHEETS_IDs, versions)
+            else:
+                changes, newPageToken = handler.listChanges(pageToken)
+                pendingSheets, versions = getChangedSheets(changes, store)
+                event["changes"] = len(changes)
+
+            # every unsettled sheet is retried, resubmissions of merged sheets included; a newer change wins
+            retrySheets = json.loads(store.getMeta(RETRY_SHEETS_KEY) or "{}")
+            for sheetID, retry in retrySheets.items():
+                uniName, version = retry if isinstance(retry, list) else (retry, None)   # older runs kept names only
+                if sheetID not in pendingSheets:
+                    pendingSheets[sheetID] = uniName
+                    if version is not None:
+                        versions[sheetID] = version
+            event["rows"] = len(pendingSheets)
+
+        merged = tm.processPendingSheets(handler, store, pendingSheets, versions, failureLog)
+    except Exception:
+        store.close()
+        raise
+
+    store.setMeta(RETRY_SHEETS_KEY, json.dumps(getUnsettledSheets(store, pendingSheets, versions, runStart)))
+    store.setMeta(PAGE_TOKEN_KEY, newPageToken)
+    tm.finishRun(handler, store, failureLog)
+
+    return merged
+
+def watch(handler, interval:float=WATCH_INTERVAL, runs:int=None):
+    """
+    Calls runOnce every interval seconds, runs times (forever if runs is None).
+    Each run gets its own run ID in the run metrics report. A run that raises (e.g. a Drive or GitHub
+    outage) is logged; when watching forever the next run starts after the interval (the page token only
+    moves on runs that finish), otherwise the error is raised so a scheduled run (--once) fails.
+    """
+    run = 0
+    while runs is None or run < runs:
+        if run > 0:
+            time.sleep(interval)
+        metrics.reset()
+        try:
+            runOnce(handler)
+        except Exception as e:
+            metrics.record("failure", sheetID="run", detail=[type(e).__name__, str(e)])
+            metrics.writeReport(tm.RUN_REPORT_PATH)
+            if runs is not None:
+                raise
+            print(f"Run {metrics.runID} failed. Will retry in {interval} s.")
+            print("Error:", e, end='\n')
+        run += 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merges new and modified cleaned sheets to mainDB.csv, "
+                                                 "following the Google Drive changes feed instead of listing every folder")
+    parser.add_argument("--once", action="store_true", help="run once and exit (e.g. on a schedule)")
+    parser.add_argument("--interval", type=float, default=WATCH_INTERVAL, help="seconds between runs")
+    args = parser.parse_args()
+
+    watch(tm.newHandler(), args.interval, 1 if args.once else None)
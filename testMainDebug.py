@@ -1,223 +1,601 @@
 import GoogleDriveSheets as gds
-import DataChecks as dc
-from io import BytesIO
-import pandas as pd
-import numpy as np
+import StateStore as ss
+from Metrics import metrics
+from RepoCommit import RepoCommit
+from io import StringIO
+import datetime
+from typing import TYPE_CHECKING
 import os
+# pandas, DataChecks, MainDB and github are only imported once there are sheets to process
+if TYPE_CHECKING:
+    import pandas as pd
+
+# max number of Google Sheets fetched at the same time
+FETCH_WORKERS = int(os.environ.get("FETCH_WORKERS", 4))
+# local record of processed sheets, kept between runs
+STATE_DB_PATH = os.environ.get("STATE_DB_PATH", "sheetState.db")
+# master journal list prepared for the data checks, reused while the master sheet is unchanged
+JOURNAL_REFERENCE_PATH = os.environ.get("JOURNAL_REFERENCE_PATH", "journalReference.json")
+# machine-readable timings, counts and sizes of every run (JSON lines, appended)
+RUN_REPORT_PATH = os.environ.get("RUN_REPORT_PATH", "runMetrics.jsonl")
+SHEETS_IN_REPO_FILE_ID = "1jsxtnEHbKTkoPgtcsawsu6oZ7wNOgzqO5dGvtbx2pM4"
+ALL_JOURNALS_FILE_ID = "1W-A354T_93Nra8rKL_MY5tmwMDlfaLAdLKTwNUJv2EA"
+FOLDER_RAW_ID = "17JUv2o-fKmFsgg2m65HNO-TMDUdn5Q2U"
+FOLDER_CLEANED_ID = "191OoRTm1ip05Zuk7My-eMa-t9B2IeJbD"
+FOLDER_BYHAND_ID = "1hbsLRm_1x6adC1OZgULKw16O-li9hRBq"
+REPO_DIR = "sahasukanta/testRepo"
+MAIN_DB_PATH = "data/from-GDrive/mainDB.csv"
+MAIN_DB_SNAPSHOT_PATH = "data/from-GDrive/mainDB.snapshot"
+# one JSON line per university whose rows in mainDB.csv were changed by a resubmitted sheet
+MAIN_DB_CHANGELOG_PATH = "data/from-GDrive/mainDB.changes.jsonl"
+# journal x university access bitmap (see AccessIndex), updated with every merged sheet
+ACCESS_INDEX_PATH = "data/from-GDrive/accessIndex.npz"
+# columns compared when a resubmitted sheet is diffed against the university's rows in mainDB.csv
+ROW_COLS = ["journal", "issn", "access", "notes"]
 
 
 def getAllFileIDs(handler):
     """
-    Gets all file IDs from the Google Drive folders (raw, clean, byHand)
-    returns: cleaned{"byHand":{{id:name}, {id:name}, ...}, "fromInst":{{id:name}, {id:name}, ...}}, raw[ids]
+    Gets all file IDs from the Google Drive folders (raw, clean, byHand) with a single combined listing
+    (files in subfolders of the raw folder are included)
+    returns: cleaned{"byHand":{{id:name}, {id:name}, ...}, "fromInst":{{id:name}, {id:name}, ...}}, raw[ids], versions{id:modifiedTime}
     """
-    FOLDER_RAW_ID = "17JUv2o-fKmFsgg2m65HNO-TMDUdn5Q2U"
-    FOLDER_CLEANED_ID = "191OoRTm1ip05Zuk7My-eMa-t9B2IeJbD"
-    FOLDER_BYHAND_ID = "1hbsLRm_1x6adC1OZgULKw16O-li9hRBq"
-
     CLEANED_SHEETS_IDs = {"byHand":{}, "fromInst":{}}
     FILES_IN_RAW_IDs = []
+    FILE_VERSIONS = {}
 
-    filesInCleaned = handler.getFileListInFolder(FOLDER_CLEANED_ID, handler.getDriveService())
-    for file in filesInCleaned:
-        if file["mimeType"] == "application/vnd.google-apps.spreadsheet":
-            fileID = file["id"]
-            fileName = file["name"]
-            CLEANED_SHEETS_IDs["fromInst"][fileID] = fileName
+    filesByFolder = handler.getFilesInFolders([FOLDER_CLEANED_ID, FOLDER_BYHAND_ID, FOLDER_RAW_ID],
+                                              handler.getDriveService(), recursiveFolderIDs=[FOLDER_RAW_ID])
 
-    filesInByHand = handler.getFileListInFolder(FOLDER_BYHAND_ID, handler.getDriveService())
-    for file in filesInByHand:
-        if file["mimeType"] == "application/vnd.google-apps.spreadsheet":
-            fileID = file["id"]
-            fileName = file["name"]
-            CLEANED_SHEETS_IDs["byHand"][fileID] = fileName
+    for folderID, key in [(FOLDER_CLEANED_ID, "fromInst"), (FOLDER_BYHAND_ID, "byHand")]:
+        for file in filesByFolder[folderID]:
+            if file["mimeType"] == "application/vnd.google-apps.spreadsheet":
+                fileID = file["id"]
+                fileName = file["name"]
+                CLEANED_SHEETS_IDs[key][fileID] = fileName
+                FILE_VERSIONS[fileID] = file["modifiedTime"]
 
-    filesInRaw = handler.getFileListInFolder(FOLDER_RAW_ID, handler.getDriveService())
-    for file in filesInRaw:
-        FILES_IN_RAW_IDs.append([file["id"]])
-        # print(file)
-        # fileMimeType = file["mimeType"]
-        # while fileMimeType == "application/vnd.google-apps.folder":
-        #     childFilesinFile = handler.getFileListInFolder(file["id"], handler.getDriveService())
-        #     FILES_IN_RAW_ID[file["id"]].add
+    for file in filesByFolder[FOLDER_RAW_ID]:
+        FILES_IN_RAW_IDs.append(file["id"])
+        FILE_VERSIONS[file["id"]] = file["modifiedTime"]
 
-    return CLEANED_SHEETS_IDs, FILES_IN_RAW_IDs
+    return CLEANED_SHEETS_IDs, FILES_IN_RAW_IDs, FILE_VERSIONS
 
-def addNewUniToRepo(repo, df, filePath):
+def addNewUniToRepo(repoCommit, df, filePath, overwrite=False):
     """
-    Adds processed sheets data from Google Drive to the repo as uniName.csv file
+    Stages processed sheets data from Google Drive as uniName.csv file, to be committed with mainDB.csv
+    returns: False (nothing staged) if filePath already exists in the repo and overwrite is False, True otherwise
     """
-    dfCSV_str = df.to_csv()
-    repo.create_file(filePath, "commiting new uni data from sheets in drive", dfCSV_str)
+    if repoCommit.exists(filePath) and not overwrite:
+        return False
+    with metrics.timer("pipeline.uniToCSV", path=filePath, rows=len(df)):
+        repoCommit.add(filePath, df.to_csv())
+
+    return True
 
-def getAllJournals(handler) -> pd.DataFrame:
+def getAllJournals(handler, version=None) -> "pd.DataFrame":
     """
     Returns a df with all journal names and their issn
     """
-    journals = handler.getSheetsData(handler.getSheetsDriveClient(), "1W-A354T_93Nra8rKL_MY5tmwMDlfaLAdLKTwNUJv2EA")
+    import pandas as pd
+
+    journals = handler.getSheetsDataCached(ALL_JOURNALS_FILE_ID, version)
     j_df = pd.DataFrame(journals)[["journal", "issn"]]
 
     return j_df
 
+def getJournalReference(handler, path=JOURNAL_REFERENCE_PATH):
+    """
+    Loads the DataChecks.JournalReference saved at path if it was built from the current version of the
+    master journal sheet, otherwise builds it from getAllJournals and saves it to path
+    returns: DataChecks.JournalReference
+    """
+    import DataChecks as dc
+
+    version = handler.getFileVersions([ALL_JOURNALS_FILE_ID]).get(ALL_JOURNALS_FILE_ID)
+    if version is not None and os.path.exists(path):
+        try:
+            reference = dc.JournalReference.load(path)
+        except (OSError, ValueError, KeyError, AssertionError) as e:
+            print(f"Saved journal reference {path} could not be read, rebuilding it. Error: {e}")
+        else:
+            if reference.version == version:
+                return reference
+
+    reference = dc.JournalReference.fromDataFrame(getAllJournals(handler, version or ""), version)
+    invalidISSNs = reference.getInvalidISSNs()
+    if invalidISSNs:
+        print(f"Warning: {len(invalidISSNs)} journals of the master list have an invalid issn: {invalidISSNs}")
+    if version is not None:
+        reference.save(path)
+
+    return reference
+
 def addUniCol(uniName, df):
     """
     Adds the "university" column to the processed sheet df with uniName
     returns: df with uniName col
     """
-    uniCol = [uniName]*1372
-    df["university"] = uniCol
+    df["university"] = uniName
     df = df[["university", "journal", "issn", "access", "notes"]]
 
     return df
 
-def mergeMainDB(repo, mainDBPath, newDf):
+def nextCSVIndex(csvContent:str) -> int:
     """
-    Merges the new df with the old mainDB.csv from GitHub repo. Note: This does NOT push the merged
-    data to the repo. This only puts the two old DB with the new university data into a new df
-    returns:
-    - oldDB: mainDB.csv pygithub.ContentFile
-    - updatedMainDB: pd.DataFrame with the merged data
+    Finds the index the next row appended to a csv written by pd.DataFrame.to_csv() should get,
+    reading only the last line (falls back to parsing the index column if the last line is not a plain row)
+    returns: int
     """
-    oldDB = repo.get_contents(mainDBPath)
-    oldDBContent = oldDB.decoded_content  # dtype=bytes
-    oldDBContent = pd.read_csv(BytesIO(oldDBContent))  # dtype=pd.df
-    oldDBContent = oldDBContent.astype("string")
-    oldDBContent = oldDBContent[["university", "journal", "issn", "access", "notes"]]
-    updatedMainDB = pd.concat([newDf, oldDBContent], ignore_index=True)
+    lastLine = csvContent.rstrip("\n").rsplit("\n", 1)[-1]
+    try:
+        return int(lastLine.split(",", 1)[0]) + 1
+    except ValueError:
+        import pandas as pd
+        return len(pd.read_csv(StringIO(csvContent), usecols=[0]))
+
+def appendRowsToCSV(csvContent:str, newDfs:"list[pd.DataFrame]") -> str:
+    """
+    Appends the rows of every df in newDfs to csvContent (a mainDB.csv as text) without parsing the old rows
+    returns: str with the updated csv
+    """
+    import pandas as pd
+    from MainDB import MAIN_DB_COLS
+
+    newRows = pd.concat(newDfs, ignore_index=True)[MAIN_DB_COLS]
+    newRows.index += nextCSVIndex(csvContent)
+    if not csvContent.endswith("\n"):
+        csvContent += "\n"
 
-    return oldDB, updatedMainDB
+    return csvContent + newRows.to_csv(header=False)
 
-def updateMainDBGit(repo, oldDB, updatedMainDB, updatedMainDBPath):
+def hashRows(df) -> "pd.Series":
     """
-    This updates the old mainDB.csv with the new df from mergeMainDB(repo, mainDBPath, newDf)
+    returns: pd.Series with a hash of the ROW_COLS values (as str) of every row of df, with df's index
     """
-    updatedMainDB = updatedMainDB.to_csv()
-    # repo.delete_file(oldDB.path, "commit message", oldDB.sha)
-    # repo.create_file(updatedMainDBPath, "test commit", updatedMainDB)
-    repo.update_file(oldDB.path, "updated mainDB.csv", updatedMainDB, oldDB.sha, branch="main")
+    import pandas as pd
 
-def getListOfUpdatedSheets(handler):
+    return pd.util.hash_pandas_object(df[ROW_COLS].astype(str), index=False).set_axis(df.index)
+
+def upsertRowsInCSV(csvContent:str, uniDfs:dict) -> "tuple(str, list)":
     """
-    Gets the Google Sheets file from SheetsUpdatedToRepo from the drive
-    returns: a list of sheets IDs that were already updated to repo
+    Replaces the rows of every university in uniDfs ({uniName: df with university col}) in csvContent
+    (a mainDB.csv as text) by diffing them on their journal: rows whose (journal, issn, access, notes) hash changed
+    are updated in place (keeping their index), new journals are appended and journals no longer in the sheet
+    (or repeated for the university) are removed. Every other row is left untouched, so a university
+    always has a single block of rows however many times its sheet is submitted. A df whose university col
+    holds another name (a renamed sheet) also renames every row of the university.
+    returns: (str with the updated csv, [change dicts with the updated, added and removed journals of each university])
+    """
+    import pandas as pd
+
+    db = pd.read_csv(StringIO(csvContent), index_col=0, dtype=str, keep_default_na=False)
+    nextIndex = max((int(i) for i in db.index), default=-1) + 1
+    changes = []
+    dropRows = []
+    newRows = []
+
+    for uniName, df in uniDfs.items():
+        old = db[db["university"] == uniName]
+        repeated = old["journal"].duplicated()
+        old = old[~repeated.values]
+        new = df.drop_duplicates("journal").astype(str)
+        oldHashes = pd.Series(hashRows(old).values, index=old["journal"].values)
+        newHashes = pd.Series(hashRows(new).values, index=new["journal"].values)
+        oldRowOf = pd.Series(old.index, index=old["journal"].values)
+
+        common = newHashes.index.intersection(oldHashes.index)
+        updatedJournals = list(common[(newHashes[common].values != oldHashes[common].values)])
+        addedJournals = list(newHashes.index.difference(oldHashes.index, sort=False))
+        removedJournals = list(oldHashes.index.difference(newHashes.index, sort=False))
+
+        newName = str(df["university"].iloc[0]) if len(df) else uniName
+        change = {"university": newName, "updated": {}, "added": addedJournals, "removed": removedJournals,
+                  "repeatedRowsRemoved": int(repeated.sum())}
+        if newName != uniName:
+            change["renamedFrom"] = uniName
+        newByJournal = new.set_index("journal", drop=False)
+        for journal in updatedJournals:
+            row = oldRowOf[journal]
+            newValues = newByJournal.loc[journal, ROW_COLS]
+            change["updated"][journal] = {col: [db.at[row, col], newValues[col]] for col in ROW_COLS
+                                          if db.at[row, col] != newValues[col]}
+            db.loc[row, ROW_COLS] = newValues.values
+        dropRows += list(oldRowOf[removedJournals].values) + list(db[db["university"] == uniName].index[repeated.values])
+        if newName != uniName:
+            db.loc[db["university"] == uniName, "university"] = newName
+        if addedJournals:
+            added = newByJournal.loc[addedJournals, ["university"] + ROW_COLS]
+            newRows.append(added.set_axis([str(i) for i in range(nextIndex, nextIndex + len(added))]))
+            nextIndex += len(added)
+
+        if updatedJournals or addedJournals or removedJournals or change["repeatedRowsRemoved"] or newName != uniName:
+            changes.append(change)
+
+    if not changes:
+        return csvContent, []
+
+    db = pd.concat([db.drop(dropRows)] + newRows)
+    db.index.name = None
+
+    return db.to_csv(), changes
+
+def mergeMainDB(repoCommit, mainDBPath, newDfs, resubmittedDfs=None):
+    """
+    Merges every df in newDfs with the old mainDB.csv from GitHub repo by appending their rows, and
+    upserts the rows of every university in resubmittedDfs ({uniName: df}, see upsertRowsInCSV).
+    Note: This does NOT push the merged data to the repo. All new university data of a run
+    should be merged in one call so that mainDB.csv is downloaded and updated only once.
+    returns: (str with the merged csv, [change dicts of the resubmitted universities])
+    """
+    updatedMainDB = repoCommit.read(mainDBPath).decode("utf-8")  # dtype=str
+    changes = []
+    if resubmittedDfs:
+        with metrics.timer("pipeline.upsertRowsInCSV", rows=sum(len(df) for df in resubmittedDfs.values())) as event:
+            updatedMainDB, changes = upsertRowsInCSV(updatedMainDB, resubmittedDfs)
+            event["changedRows"] = sum(len(change["updated"]) + len(change["added"]) + len(change["removed"])
+                                       for change in changes)
+    if newDfs:
+        with metrics.timer("pipeline.appendRowsToCSV", rows=sum(len(df) for df in newDfs)):
+            updatedMainDB = appendRowsToCSV(updatedMainDB, newDfs)
+
+    return updatedMainDB, changes
+
+def addChangesToLog(repoCommit, changes, commitTime, logPath=MAIN_DB_CHANGELOG_PATH):
+    """
+    Stages the change log of mainDB.csv with one JSON line per change dict in changes appended
     """
-    SHEETS_IN_REPO_FILE_ID = "1jsxtnEHbKTkoPgtcsawsu6oZ7wNOgzqO5dGvtbx2pM4"
-    sheet = handler.getSheetsData(handler.getSheetsDriveClient(), SHEETS_IN_REPO_FILE_ID)
-    sheetsUpdatedToRepo_df = pd.DataFrame(sheet)
-    updatedSheetIDs = list(sheetsUpdatedToRepo_df["sheetID"])
+    import json
 
-    return updatedSheetIDs
+    lines = "".join(json.dumps({"time": commitTime, **change}) + "\n" for change in changes)
+    oldLog = repoCommit.read(logPath).decode("utf-8") if repoCommit.exists(logPath) else ""
+    repoCommit.add(logPath, oldLog + lines)
 
-def updateSheetOnDrive(handler, sheetID, ALL_CLEANED_SHEETS):
-    SHEETS_IN_REPO_FILE_ID = "1jsxtnEHbKTkoPgtcsawsu6oZ7wNOgzqO5dGvtbx2pM4"
-    sheet = handler.getSheetObject(SHEETS_IN_REPO_FILE_ID)
-    index = len(sheet.get_all_values()) + 1
-    sheet.insert_row([sheetID, ALL_CLEANED_SHEETS[sheetID]], index)
+def buildMainDBSnapshot(updatedMainDB):
+    """
+    Builds the binary snapshot (see MainDB.buildSnapshot) of the updated mainDB.csv, written next to it in the repo
+    returns: bytes
+    """
+    from MainDB import MainDB, buildSnapshot
 
+    with metrics.timer("pipeline.buildSnapshot"):
+        return buildSnapshot(MainDB.fromBytes(updatedMainDB))
 
-def main():
+def updateAccessIndex(repoCommit, updatedMainDB, uniDfs, indexPath=ACCESS_INDEX_PATH, rebuild=False):
+    """
+    Updates the access index in the repo with the rows of every university in uniDfs ({uniName: df with journal
+    and access cols}), only touching their rows. The index is rebuilt from updatedMainDB (the merged mainDB.csv)
+    when rebuild is True (e.g. a university was renamed), the repo has none yet or a sheet has journals the index does not know.
+    returns: bytes of the updated index (see AccessIndex.toBytes)
+    """
+    from AccessIndex import AccessIndex
+    from MainDB import MainDB
 
-    print(os.getcwd())
-    # authenticating Drive, Sheets and GitHub API keys
-    sheetsDriveJson = "creds.json"
-    driveServiceJson = "client_secrets_GDrive-oauth2.json"
-    gitToken = os.environ.get("TEST_SECRET")
-    handler = gds.Handler(sheetsDriveJson, driveServiceJson, gitToken)
+    with metrics.timer("pipeline.updateAccessIndex", rows=len(uniDfs)) as event:
+        index = AccessIndex.fromBytes(repoCommit.read(indexPath)) if repoCommit.exists(indexPath) else None
+        event["rebuilt"] = rebuild or index is None or not all(index.hasJournals(df["journal"]) for df in uniDfs.values())
+        if event["rebuilt"]:
+            index = AccessIndex.fromMainDB(MainDB.fromBytes(updatedMainDB))
+        else:
+            for uniName, df in uniDfs.items():
+                index.addUniversity(uniName, df)
 
-    # google drive sheets (IDs only)
-    ALL_JOURNAL_ISSN = getAllJournals(handler)   # pd.DataFrame
-    CLEANED_SHEETS_IDs, FILES_IN_RAW_IDs = getAllFileIDs(handler)
-    ALL_CLEANED_SHEETS = {**CLEANED_SHEETS_IDs["byHand"], **CLEANED_SHEETS_IDs["fromInst"]}
+        return index.toBytes()
 
-    # gitHub repo
-    repoDir = "sahasukanta/testRepo"
-    repo = handler.getRepo(repoDir)
+def getUpdatedSheets(handler):
+    """
+    Gets the Google Sheets file from SheetsUpdatedToRepo from the drive, whose rows are
+    [sheetID, university name] as appended by updateSheetsOnDrive
+    returns: {sheetID: uniName} of the sheets that were already updated to repo ("" if the name is missing)
+    """
+    sheet = handler.getSheetColumns(handler.getSheetsDriveClient(), SHEETS_IN_REPO_FILE_ID)
+    nameCol = "name" if "name" in sheet else next((col for col in sheet if col != "sheetID"), None)
+    names = sheet[nameCol] if nameCol is not None else [""] * len(sheet["sheetID"])
 
-    updatedSheetIDs = getListOfUpdatedSheets(handler)
-    failureLog = {}
+    return {str(sheetID): str(name) for sheetID, name in zip(sheet["sheetID"], names)}
+
+def getListOfUpdatedSheets(handler):
+    """
+    Gets the Google Sheets file from SheetsUpdatedToRepo from the drive
+    returns: a list of sheets IDs that were already updated to repo
+    """
+    return list(getUpdatedSheets(handler))
 
+def seedStateStore(handler, store):
+    """
+    Seeds store (sheet IDs and university names) from the SheetsUpdatedToRepo sheet, skipping the Sheets read
+    when the sheet's Drive version is the one seeded from on a previous run. A store seeded before names were
+    recorded (merged sheets without a name) is re-seeded once to fill them in; names still missing from the
+    tracking sheet after that are not read again until its version changes.
+    """
+    version = handler.getFileVersions([SHEETS_IN_REPO_FILE_ID]).get(SHEETS_IN_REPO_FILE_ID)
+    missingNames = not store.getMeta("trackingSheetNamesSeeded") and store.getMergedByName("")
+    if version is None or version != store.getMeta("trackingSheetVersion") or missingNames:
+        store.seedFromTrackingSheet(getUpdatedSheets(handler))
+        store.setMeta("trackingSheetNamesSeeded", "1")
+        if version is not None:
+            store.setMeta("trackingSheetVersion", version)
+
+def updateSheetsOnDrive(handler, store):
+    """
+    Adds every merged sheet in store that is not yet in the SheetsUpdatedToRepo sheet on the drive
+    with a single append (one write per run)
+    returns: list of the sheet IDs added
+    """
+    unsynced = store.getUnsynced()
+    if unsynced:
+        sheet = handler.getSheetObject(SHEETS_IN_REPO_FILE_ID)
+        with metrics.timer("sheets.append_rows", rows=len(unsynced)):
+            sheet.append_rows([[record["sheetID"], record["name"]] for record in unsynced])
+        store.markSynced([record["sheetID"] for record in unsynced])
+
+    return [record["sheetID"] for record in unsynced]
+
+
+def getPendingSheets(store, CLEANED_SHEETS_IDs, versions=None):
+    """
+    Picks the cleaned sheets that were not merged to mainDB.csv on previous runs, and the merged sheets
+    resubmitted since (their Drive version in versions changed). Merged sheets recorded without a version
+    (e.g. seeded from SheetsUpdatedToRepo) take their current version, so later edits count as resubmissions.
+    returns: {sheetID: uniName}
+    """
+    versions = versions or {}
     allCleanedSheetIDs = list(CLEANED_SHEETS_IDs["fromInst"].keys()) + list(CLEANED_SHEETS_IDs["byHand"].keys())
+    store.setVersions({sheetID: versions[sheetID] for sheetID in allCleanedSheetIDs
+                       if store.isProcessed(sheetID) and store.get(sheetID)["version"] is None and sheetID in versions})
+    pendingSheets = {}   # sheetID: uniName
     for sheetID in allCleanedSheetIDs:
 
-        if sheetID not in updatedSheetIDs:   # this will filter out the sheets that were already processed on previous runs
+        # this will filter out the sheets that were already processed on previous runs and not modified since
+        if not store.isProcessed(sheetID) or store.isResubmitted(sheetID, versions.get(sheetID)):
 
-            if sheetID in list(CLEANED_SHEETS_IDs["byHand"].keys()):
-                uniName = CLEANED_SHEETS_IDs["byHand"][sheetID]
+            if sheetID in CLEANED_SHEETS_IDs["byHand"]:
+                pendingSheets[sheetID] = CLEANED_SHEETS_IDs["byHand"][sheetID]
             else:
-                uniName = CLEANED_SHEETS_IDs["fromInst"][sheetID]
-
-            # getting data from sheet as df
-            sheet = handler.getSheetsData(handler.getSheetsDriveClient(), sheetID)
-            df = pd.DataFrame(sheet).astype("string")
-            
-            # data checks
-            try:
-                noDuplicates = dc.noDuplicates(df)
-                if not noDuplicates: raise dc.DataChecksException("DataFrame contains duplicates.", sheetID, "noDuplicates", "")
-
-                hasAllCols, detail = dc.hasAllColumns(df)
-                if not hasAllCols:
-                    detail = "Missing columns: " + str(detail)
-                    raise dc.DataChecksException(f"DataFrame does not contain all the columns", sheetID, "hasAllCols", detail)
-
-                hasNaN, detail = dc.hasNaN(df)
-                if hasNaN:
-                    detail = "NaN values found in columns: " + str(detail)
-                    raise dc.DataChecksException(f"DataFrame contains NaN values", sheetID, "hasNaN", detail)
-
-                allJournalsCounted, detail = dc.allJournalsCounted(df, list(ALL_JOURNAL_ISSN["journal"]))
-                if allJournalsCounted == False:
-                    detail = "uncounted journals: " + str(detail)
-                    raise dc.DataChecksException(f"Not all journals are present in DataFrame",  sheetID, "allJournalsCounted", detail)
-
-                observed_df_journals_ISSN = df.drop(["access", "notes"], axis=1, inplace=False)
-                journalsMatchISSN, detail = dc.journalsMatchISSN(ALL_JOURNAL_ISSN, observed_df_journals_ISSN)
-                if journalsMatchISSN == False:
-                    detail = "mismatched journals: " + str(detail)
-                    raise dc.DataChecksException(f"Journal and ISSN mismatch found in DataFrame", sheetID, "journalsMatchISSN", detail)
-
-            except Exception as e:
-                print(f"\nSheet for {uniName} did not pass DataChecks. Sheet avoided.")
-                print("Error:", e, end='\n')
-                failureLog[sheetID] = [uniName, e]
+                pendingSheets[sheetID] = CLEANED_SHEETS_IDs["fromInst"][sheetID]
 
-            else:
-                # adding sheet as .csv to repo
-                try:
-                    addNewUniToRepo(repo, df, f"data/from-GDrive/{uniName}.csv")
-                except Exception as e:
-                    print(f"Google sheet for {uniName} could not be added. It may already exist in repo.")
-                    print("Error:", e, end='\n')
-                    failureLog[sheetID] = [uniName, e]
-
-                else:
-                    print(f"\nNew Google Sheet for {uniName} successfully added to Repo. Will be merged to mainDB.csv now...")
-                    # merging data to mainDB.csv
-                    try:
-                        df = addUniCol(uniName, df)
-                        oldDB, updatedMainDB = mergeMainDB(repo, "data/from-GDrive/mainDB.csv", df)
-                        updateMainDBGit(repo, oldDB, updatedMainDB, "data/from-GDrive/mainDB.csv")
-                        print(f"Data from {uniName} successfully merged and updated to mainDB.csv!")
-                    except Exception as e:
-                        errorMsg = f"Sheet {uniName} could not be updated to mainDB.csv. But was added seperately as {uniName}.csv."
-                        print(errorMsg)
-                        print("Error:", e, end='\n')
-                        failureLog[sheetID] = [uniName, e, errorMsg]
-
-                    else:
-                        # updating SheetsUpdatedToRepo file in GDrive
-                        try:
-                            updateSheetOnDrive(handler, sheetID, ALL_CLEANED_SHEETS)
-                            print(f"Sheet ID and name for {uniName} updated to SheetsUpdatedToRepo sheet on the Drive\n")
-                        except Exception as e:
-                            errorMsg = f"Data from {uniName} updated to mainDB.csv but this could not be updated to SheetsUpdatedToRepo sheet in Google Drive."
-                            print(errorMsg)
-                            print("Error:", e, end='\n')
-                            failureLog[sheetID] = [uniName, e, errorMsg]
+    return pendingSheets
+
+def fetchSheets(handler, pendingSheets, versions, failureLog):
+    """
+    Pipeline stage: gets the data of all pending sheets concurrently, in order of arrival
+    returns: generator of (sheetID, uniName, df) for every sheet that could be read
+    """
+    import pandas as pd
+
+    for sheetID, sheet, error in handler.fetchSheetsData(list(pendingSheets), maxWorkers=FETCH_WORKERS, versions=versions):
+        uniName = pendingSheets[sheetID]
+        if error is not None:
+            print(f"\nSheet for {uniName} could not be read from Google Sheets. Sheet avoided.")
+            print("Error:", error, end='\n')
+            failureLog[sheetID] = [uniName, error]
+            continue
+
+        df = pd.DataFrame(sheet).astype("string")
+        metrics.record("pipeline.sheetRows", sheetID=sheetID, rows=len(df))
+        yield sheetID, uniName, df
+
+def fetchRawSheets(handler, rawFileIDs=None, versions=None):
+    """
+    Gets the data of the Google Sheets in the raw folder (all of FILES_IN_RAW_IDs, listed with getAllFileIDs
+    if not given) concurrently, for JournalResolver to clean. Files that are not Google Sheets cannot be read and are skipped.
+    returns: generator of (fileID, df) for every file that could be read
+    """
+    import pandas as pd
+
+    if rawFileIDs is None:
+        _, rawFileIDs, versions = getAllFileIDs(handler)
+    for fileID, sheet, error in handler.fetchSheetsData(list(rawFileIDs), maxWorkers=FETCH_WORKERS, versions=versions):
+        if error is not None:
+            print(f"\nRaw file {fileID} could not be read from Google Sheets. File avoided.")
+            print("Error:", error, end='\n')
+            continue
+
+        yield fileID, pd.DataFrame(sheet).astype("string")
+
+def checkSheets(sheets, reference, store, versions, failureLog):
+    """
+    Pipeline stage: runs the data checks on every sheet from fetchSheets, recording the failed ones in store.
+    A sheet whose checks raise is failed like one that does not pass them, without stopping the run.
+    A resubmitted sheet whose content and name did not change only gets its new version recorded, and a resubmitted
+    sheet that fails keeps its merged record (its rows in mainDB.csv stay as they are).
+    returns: generator of (sheetID, uniName, df with whitespace removed from column names, contentHash) for every sheet that passed
+    """
+    import DataChecks as dc
+
+    for sheetID, uniName, df in sheets:
+        contentHash = ss.hashDataFrame(df)
+        merged = store.isProcessed(sheetID)
+        if merged and store.get(sheetID)["contentHash"] == contentHash and store.get(sheetID)["name"] in ("", uniName):
+            store.setVersions({sheetID: versions.get(sheetID)})
+            continue
+
+        try:
+            report = dc.validateSheet(df, reference, sheetID)
+        except Exception as e:
+            report = e
+        if isinstance(report, Exception) or not report.passed():
+            print(f"\nSheet for {uniName} did not pass DataChecks. Sheet avoided.")
+            print("Error:", report, end='\n')
+            failureLog[sheetID] = [uniName, report]
+            if not merged:
+                store.record(sheetID, uniName, ss.FAILED, contentHash)
+        else:
+            yield sheetID, uniName, dc.stripColumnNames(df), contentHash
+
+def stageSheets(checkedSheets, repoCommit, store, failureLog):
+    """
+    Pipeline stage: stages the .csv of every sheet from checkSheets in repoCommit. A sheet merged on a previous run
+    (resubmitted) overwrites the .csv of its university, and its rows are upserted in mainDB.csv under the name it
+    was merged as. A resubmitted sheet renamed on Drive moves its .csv and its rows to the new name. A sheet fails
+    if another sheet was merged under its university name, if it is new (or renamed) and the .csv of its university
+    already exists, or if another sheet of this run was staged under the same name.
+    returns: generator of (sheetID, uniName, df with university col, contentHash, mergedName) for every staged sheet,
+    mergedName being the name the sheet was merged as on a previous run (None for new sheets)
+    """
+    stagedNames = set()
+    for sheetID, uniName, df, contentHash in checkedSheets:
+        filePath = f"data/from-GDrive/{uniName}.csv"
+        resubmitted = store.isProcessed(sheetID)
+        mergedName = (store.get(sheetID)["name"] or uniName) if resubmitted else None
+        renamed = resubmitted and mergedName != uniName
+        otherSheetIDs = [otherID for otherID in store.getMergedByName(uniName) if otherID != sheetID]
+        if uniName in stagedNames:
+            conflict = f"another sheet of this run is staged as {filePath}"
+        elif otherSheetIDs:
+            conflict = f"{filePath} already exists (merged from {', '.join(otherSheetIDs)})"
+        elif not addNewUniToRepo(repoCommit, df, filePath, overwrite=resubmitted and not renamed):
+            conflict = f"{filePath} already exists"
+        else:
+            conflict = None
+
+        if conflict is not None:
+            print(f"Google sheet for {uniName} could not be added. It already exists in repo.")
+            failureLog[sheetID] = [uniName, conflict]
+            if not resubmitted:
+                store.record(sheetID, uniName, ss.FAILED, contentHash)
+        else:
+            if renamed:
+                repoCommit.remove(f"data/from-GDrive/{mergedName}.csv")
+                print(f"\nGoogle Sheet for {mergedName} was renamed to {uniName}. Its .csv and rows will be renamed.")
+            stagedNames.add(uniName)
+            print(f"\n{'Updated' if resubmitted else 'New'} Google Sheet for {uniName} staged. "
+                  f"Will be committed with mainDB.csv after all sheets are checked...")
+            yield sheetID, uniName, addUniCol(uniName, df), contentHash, mergedName
+
+def commitSheets(stagedSheets, repoCommit, store, versions, failureLog):
+    """
+    Pipeline stage: merges every sheet from stageSheets to mainDB.csv (appending new universities, upserting
+    resubmitted ones) and commits it with their .csv files and the mainDB.csv change log in a single commit
+    returns: list of the sheet IDs merged
+    """
+    sheetsToMerge = {sheetID: (uniName, df, contentHash, mergedName)
+                     for sheetID, uniName, df, contentHash, mergedName in stagedSheets}
+    if not sheetsToMerge:
+        return []
+
+    uniNames = [uniName for uniName, _, _, _ in sheetsToMerge.values()]
+    newDfs = [df for _, df, _, mergedName in sheetsToMerge.values() if mergedName is None]
+    resubmittedDfs = {mergedName: df for _, df, _, mergedName in sheetsToMerge.values() if mergedName is not None}
+    renamed = any(mergedName not in (None, uniName) for uniName, _, _, mergedName in sheetsToMerge.values())
+    try:
+        updatedMainDB, changes = mergeMainDB(repoCommit, MAIN_DB_PATH, newDfs, resubmittedDfs)
+        repoCommit.add(MAIN_DB_PATH, updatedMainDB)
+        if changes:
+            sheetIDOf = {uniName: sheetID for sheetID, (uniName, _, _, _) in sheetsToMerge.items()}
+            addChangesToLog(repoCommit, [{"sheetID": sheetIDOf[change["university"]], **change} for change in changes],
+                            datetime.datetime.utcnow().isoformat() + "Z")
+        try:
+            repoCommit.add(MAIN_DB_SNAPSHOT_PATH, buildMainDBSnapshot(updatedMainDB))
+        except Exception as e:
+            # the old snapshot would no longer match mainDB.csv, it is deleted in the same commit
+            repoCommit.remove(MAIN_DB_SNAPSHOT_PATH)
+            errorMsg = "mainDB.csv will be updated but mainDB.snapshot could not be built. It is removed from the repo."
+            print(errorMsg)
+            print("Error:", e, end='\n')
+            failureLog["mainDB.snapshot"] = [e, errorMsg]
+        try:
+            uniDfs = {uniName: df for uniName, df, _, _ in sheetsToMerge.values()}
+            repoCommit.add(ACCESS_INDEX_PATH, updateAccessIndex(repoCommit, updatedMainDB, uniDfs, rebuild=renamed))
+        except Exception as e:
+            # an index that no longer matches mainDB.csv is deleted in the same commit, it is rebuilt on the next merge
+            repoCommit.remove(ACCESS_INDEX_PATH)
+            errorMsg = "mainDB.csv will be updated but accessIndex.npz could not be updated. It is removed from the repo."
+            print(errorMsg)
+            print("Error:", e, end='\n')
+            failureLog["accessIndex.npz"] = [e, errorMsg]
+        commitSHA = repoCommit.push(f"added {', '.join(uniNames)} and updated mainDB.csv" if not resubmittedDfs else
+                                    f"added or updated {', '.join(uniNames)} and updated mainDB.csv")
+        print(f"Data from {uniNames} successfully added and merged to mainDB.csv in commit {commitSHA}!")
+    except Exception as e:
+        errorMsg = f"Sheets {uniNames} could not be committed to the repo. Will retry on the next run."
+        print(errorMsg)
+        print("Error:", e, end='\n')
+        for sheetID, (uniName, _, _, _) in sheetsToMerge.items():
+            failureLog[sheetID] = [uniName, e, errorMsg]
+        return []
+
+    for sheetID, (uniName, _, contentHash, mergedName) in sheetsToMerge.items():
+        # a resubmitted sheet already in SheetsUpdatedToRepo is not appended to it again,
+        # unless it was renamed (the row appended with the new name is the one read by getUpdatedSheets)
+        synced = mergedName in (None, uniName) and store.isProcessed(sheetID) and bool(store.get(sheetID)["syncedToDrive"])
+        store.record(sheetID, uniName, ss.MERGED, contentHash, commitSHA, versions.get(sheetID), synced)
+
+    return list(sheetsToMerge)
+
+def processPendingSheets(handler, store, pendingSheets, versions, failureLog):
+    """
+    Pushes every pending sheet through the fetch -> check -> stage -> commit pipeline.
+    Sheets flow through the stages one at a time; the commit stage waits for all of them.
+    returns: list of the sheet IDs merged
+    """
+    if not pendingSheets:
+        print("No new sheets to process.")
+        return []
+
+    with metrics.timer("stage.journals"):
+        ALL_JOURNAL_ISSN = getJournalReference(handler)   # dc.JournalReference
+    # gitHub repo, every file of the run goes in a single commit
+    repoCommit = RepoCommit(handler.getRepo(REPO_DIR), "main")
+
+    sheets = fetchSheets(handler, pendingSheets, versions, failureLog)
+    checkedSheets = checkSheets(sheets, ALL_JOURNAL_ISSN, store, versions, failureLog)
+    stagedSheets = stageSheets(checkedSheets, repoCommit, store, failureLog)
+
+    return commitSheets(stagedSheets, repoCommit, store, versions, failureLog)
+
+def newHandler():
+    # authenticating Drive, Sheets and GitHub API keys (on first use)
+    sheetsDriveJson = "creds.json"
+    driveServiceJson = "client_secrets_GDrive-oauth2.json"
+    gitToken = os.environ.get("TEST_SECRET")
+
+    return gds.Handler(sheetsDriveJson, driveServiceJson, gitToken)
+
+def finishRun(handler, store, failureLog):
+    """
+    Syncs the merged sheets to the SheetsUpdatedToRepo sheet, closes store and logs failures, cache stats and run metrics
+    """
+    # updating SheetsUpdatedToRepo file in GDrive (also retries sheets that could not be synced on previous runs)
+    try:
+        syncedSheetIDs = updateSheetsOnDrive(handler, store)
+        print(f"{len(syncedSheetIDs)} sheet IDs and names updated to SheetsUpdatedToRepo sheet on the Drive\n")
+    except Exception as e:
+        errorMsg = "Merged sheets could not be updated to SheetsUpdatedToRepo sheet in Google Drive. Will retry on the next run."
+        print(errorMsg)
+        print("Error:", e, end='\n')
+        failureLog["SheetsUpdatedToRepo"] = [e, errorMsg]
+    store.close()
 
     # logging
+    if handler.sheetCache is not None:
+        print("Sheet cache:", handler.sheetCache.getStats())
+        metrics.record("sheetCache", **handler.sheetCache.getStats())
     for key in failureLog.keys():
         print(key, failureLog[key], sep='\n', end='\n')
+        metrics.record("failure", sheetID=key, detail=[str(item) for item in failureLog[key]])
+    metrics.writeReport(RUN_REPORT_PATH)
+    print(f"Run metrics written to {RUN_REPORT_PATH}")
+
+
+def main():
+
+    print(os.getcwd())
+    handler = newHandler()
+
+    # google drive sheets (IDs only)
+    with metrics.timer("stage.list"):
+        CLEANED_SHEETS_IDs, FILES_IN_RAW_IDs, FILE_VERSIONS = getAllFileIDs(handler)
+
+    store = ss.StateStore(STATE_DB_PATH)
+    seedStateStore(handler, store)
+    failureLog = {}
+
+    pendingSheets = getPendingSheets(store, CLEANED_SHEETS_IDs, FILE_VERSIONS)
+    processPendingSheets(handler, store, pendingSheets, FILE_VERSIONS, failureLog)
+
+    finishRun(handler, store, failureLog)
 
 
-main()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+# the pipeline modules live at the top of the repo
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import FakeBackends as fb
+import testMainDebug as tm
+from MainDB import MAIN_DB_COLS
+
+N_JOURNALS = 50
+
+
+@pytest.fixture
+def pipelineFiles(tmp_path, monkeypatch):
+    """
+    Points the state store, journal reference and run report of testMainDebug to tmp_path
+    """
+    monkeypatch.setattr(tm, "STATE_DB_PATH", str(tmp_path / "sheetState.db"))
+    monkeypatch.setattr(tm, "JOURNAL_REFERENCE_PATH", str(tmp_path / "journalReference.json"))
+    monkeypatch.setattr(tm, "RUN_REPORT_PATH", str(tmp_path / "runMetrics.jsonl"))
+    return tmp_path
+
+@pytest.fixture
+def journals():
+    return fb.makeJournals(n=N_JOURNALS, seed=0)
+
+@pytest.fixture
+def handler(journals, pipelineFiles):
+    """
+    FakeHandler with the master journal list, an empty SheetsUpdatedToRepo sheet and a repo with an empty mainDB.csv
+    """
+    handler = fb.FakeHandler(cacheDir=str(pipelineFiles / "sheetCache"))
+    handler.addSheet(tm.ALL_JOURNALS_FILE_ID, "journals", "masterFolder", journals)
+    handler.sheets[tm.SHEETS_IN_REPO_FILE_ID] = fb.FakeWorksheet([["sheetID", "name"]])
+    handler.driveService.addFile(tm.SHEETS_IN_REPO_FILE_ID, "SheetsUpdatedToRepo", "masterFolder")
+    handler.repo.files[tm.MAIN_DB_PATH] = ("," + ",".join(MAIN_DB_COLS) + "\n").encode("utf-8")
+    return handler
+
+
+def makeSheet(journals, seed=0, defect=None):
+    return fb.makeUniversitySheet(journals, np.random.default_rng(seed), defect)
+
+def editSheet(handler, sheetID, records):
+    """
+    Replaces the records of sheetID, as an edit on Google Sheets would (its Drive version changes)
+    """
+    header = list(records[0].keys())
+    handler.sheets[sheetID] = fb.FakeWorksheet([header] + [[record[col] for col in header] for record in records])
+    handler.driveService.modifyFile(sheetID)
+
+def readMainDB(handler):
+    import pandas as pd
+    from io import StringIO
+
+    return pd.read_csv(StringIO(handler.repo.files[tm.MAIN_DB_PATH].decode("utf-8")), index_col=0,
+                       dtype=str, keep_default_na=False)
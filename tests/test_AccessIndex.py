@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import testMainDebug as tm
+import Watch
+from AccessIndex import AccessIndex
+from MainDB import MainDB
+from conftest import makeSheet, editSheet
+
+
+def indexInRepo(handler):
+    return AccessIndex.fromBytes(handler.repo.files[tm.ACCESS_INDEX_PATH])
+
+def assertMatchesMainDB(handler):
+    index = indexInRepo(handler)
+    expected = AccessIndex.fromMainDB(MainDB.fromBytes(handler.repo.files[tm.MAIN_DB_PATH]))
+    assert sorted(index.universities) == sorted(expected.universities)
+    for university in expected.universities:
+        assert index.journalsWithAccess(university) == expected.journalsWithAccess(university)
+
+
+def test_bytesRoundTrip():
+    index = AccessIndex(["J1", "J2", "J3"])
+    index.addUniversity("U", pd.DataFrame({"journal": ["J1", "J3"], "access": [1, 1]}))
+    loaded = AccessIndex.fromBytes(index.toBytes())
+    loaded.addUniversity("V", pd.DataFrame({"journal": ["J2"], "access": ["1"]}))
+
+    assert loaded.journalsWithAccess("U") == ["J1", "J3"]
+    assert loaded.universitiesWithAccess("J2") == ["V"]
+
+def test_indexIsUpdatedWithEveryMerge(handler, journals):
+    handler.addSheet("s1", "Uni 1", tm.FOLDER_CLEANED_ID, makeSheet(journals, 1))
+    Watch.runOnce(handler)
+    assertMatchesMainDB(handler)
+
+    handler.addSheet("s2", "Uni 2", tm.FOLDER_CLEANED_ID, makeSheet(journals, 2))
+    records = makeSheet(journals, 1)
+    records[0]["access"] = 1 - records[0]["access"]
+    editSheet(handler, "s1", records)
+    Watch.runOnce(handler)
+
+    assertMatchesMainDB(handler)
+    assert indexInRepo(handler).hasAccess("Uni 1", journals[0]["journal"]) == bool(records[0]["access"])
+    assert np.array_equal(indexInRepo(handler).accessCounts().sort_index().values,
+                          [sum(int(r["access"]) for r in records), sum(int(r["access"]) for r in makeSheet(journals, 2))])
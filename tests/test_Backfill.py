@@ -0,0 +1,27 @@
+import pandas as pd
+import pytest
+import Backfill
+from conftest import makeSheet
+
+
+@pytest.fixture
+def csvDir(tmp_path, journals):
+    pd.DataFrame(makeSheet(journals, 1)).to_csv(tmp_path / "Uni 1.csv")
+    pd.DataFrame(makeSheet(journals, 2, "badChecksum")).to_csv(tmp_path / "Uni 2.csv")
+    # "issn " is read as a second issn column
+    padded = pd.DataFrame(makeSheet(journals, 3))
+    padded.insert(4, "issn ", padded["issn"])
+    padded.to_csv(tmp_path / "Uni 3.csv")
+    (tmp_path / "mainDB.csv").write_text(",university,journal,issn,access,notes\n")
+    return tmp_path
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_revalidateDirectory(csvDir, journals, workers):
+    report = Backfill.revalidateDirectory(str(csvDir), pd.DataFrame(journals), workers)
+
+    assert [path.split("/")[-1] for path in report.getPassed()] == ["Uni 1.csv"]
+    assert [path.split("/")[-1] for path in report.getFailed()] == ["Uni 2.csv", "Uni 3.csv"]
+    assert report.errors == {}
+    assert report.getFailureCounts() == {"validateISSNColumn": 1, "journalsMatchISSN": 1, "noDuplicateColumns": 1}
+    assert [record["passed"] for record in report.toRecords()] == [True, False, False]
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+import DataChecks as dc
+import FakeBackends as fb
+
+
+@pytest.fixture(scope="module")
+def journals():
+    return fb.makeJournals(n=200, seed=0)
+
+@pytest.fixture(scope="module")
+def reference(journals):
+    return dc.JournalReference.fromDataFrame(pd.DataFrame(journals))
+
+def makeSheet(journals, defect=None, seed=0):
+    return pd.DataFrame(fb.makeUniversitySheet(journals, np.random.default_rng(seed), defect)).astype("string")
+
+
+def test_cleanSheetPasses(journals, reference):
+    assert dc.validateSheet(makeSheet(journals), reference, "s").passed()
+
+@pytest.mark.parametrize("defect", fb.DEFECTS)
+def test_everyDefectIsCaught(journals, reference, defect):
+    assert not dc.validateSheet(makeSheet(journals, defect), reference, "s").passed()
+
+def test_whitespaceInColumnNamesIsIgnored(journals, reference):
+    df = makeSheet(journals).rename(columns={"issn": "issn ", "journal": " journal"})
+    assert dc.validateSheet(df, reference, "s").passed()
+
+def test_validateISSNColumn():
+    valid, invalidRows = dc.validateISSNColumn(["0317-8471", "0317-8472", "2434-561X", None, 3178471, "03178471", "Ø317-8471"])
+    assert list(valid) == [True, False, True, False, False, False, False]
+    assert invalidRows == [1, 3, 4, 5, 6]
+
+def test_checkSheetsFailsASheetWhoseChecksRaise(journals, reference, tmp_path, monkeypatch):
+    import StateStore as ss
+    import testMainDebug as tm
+
+    validateSheet = dc.validateSheet
+    def raiseForBad(df, gtruth, sheetID=""):
+        if sheetID == "bad":
+            raise KeyError("issn")
+        return validateSheet(df, gtruth, sheetID)
+    monkeypatch.setattr(dc, "validateSheet", raiseForBad)
+
+    store = ss.StateStore(str(tmp_path / "state.db"))
+    failureLog = {}
+    sheets = [("bad", "Bad University", makeSheet(journals, seed=1)), ("good", "Good University", makeSheet(journals, seed=2))]
+    passed = [sheetID for sheetID, _, _, _ in tm.checkSheets(sheets, reference, store, {}, failureLog)]
+
+    assert passed == ["good"]
+    assert isinstance(failureLog["bad"][1], KeyError)
+    assert store.get("bad")["outcome"] == ss.FAILED
+    store.close()
+
+def test_validateSheetIsTimedOncePerSheet(journals, reference):
+    from Metrics import metrics
+
+    metrics.reset()
+    dc.validateSheet(makeSheet(journals, "badChecksum").rename(columns={"issn": "issn "}), reference, "s")
+    events = [event for event in metrics.events if event["event"] == "dataChecks.validateSheet"]
+
+    assert len(events) == 1
+    assert (events[0]["sheetID"], events[0]["rows"]) == ("s", len(journals))
+    assert events[0]["failures"] > 0
+
+def test_columnsRepeatedOnceStrippedAreReported(journals, reference):
+    df = makeSheet(journals)
+    df.insert(2, "issn ", df["issn"])
+    report = dc.validateSheet(df, reference, "s")
+
+    assert [failure.ref for failure in report.getFailures()] == ["noDuplicateColumns"]
+    assert "['issn']" in report.getFailures()[0].getDetail()
+
+def test_validateAccessColumn():
+    valid, invalidRows = dc.validateAccessColumn(["0", "1", 1, "Yes", "2", "1.0", None, "N/A"])
+    assert list(valid) == [True, True, True, False, False, False, True, True]
+    assert invalidRows == [3, 4, 5]
@@ -0,0 +1,106 @@
+import pandas as pd
+import pytest
+import DataChecks as dc
+import JournalResolver as jr
+
+JOURNALS = [{"journal": "JOURNAL OF APPLIED PHYSICS", "issn": "0021-8979"},
+            {"journal": "NATURE", "issn": "0028-0836"},
+            {"journal": "PHYSICAL REVIEW LETTERS", "issn": "0031-9007"},
+            {"journal": "JOURNAL OF APPLIED POLYMER SCIENCE", "issn": "0021-8995"},
+            {"journal": "SCIENCE & SOCIETY", "issn": "0036-8237"}]
+
+
+@pytest.fixture(scope="module")
+def resolver():
+    return jr.JournalResolver(dc.JournalReference.fromDataFrame(pd.DataFrame(JOURNALS)))
+
+
+@pytest.mark.parametrize("name, expected", [("Journal of Applied Physics", "JOURNAL OF APPLIED PHYSICS"),
+                                            (" journal  of applied-physics.", "JOURNAL OF APPLIED PHYSICS"),
+                                            ("Science and Society", "SCIENCE & SOCIETY")])
+def test_matchByName(resolver, name, expected):
+    # the name wins over an issn of another journal
+    assert resolver.resolve(name, "0031-9007") == (expected, 1.0, jr.BY_NAME)
+
+@pytest.mark.parametrize("issn", ["0028-0836", "00280836", " 0028 0836 "])
+def test_matchByISSN(resolver, issn):
+    assert resolver.resolve("Whatever", issn) == ("NATURE", jr.ISSN_CONFIDENCE, jr.BY_ISSN)
+    # a name close to the journal's raises the confidence of an issn match
+    journal, confidence, method = resolver.resolve("Natur", issn)
+    assert (journal, method) == ("NATURE", jr.BY_ISSN) and jr.ISSN_CONFIDENCE < confidence < 1
+
+def test_matchByTrigram(resolver):
+    journal, confidence, method = resolver.resolve("Physical Review Letter")
+    assert (journal, method) == ("PHYSICAL REVIEW LETTERS", jr.BY_TRIGRAM)
+    assert jr.MIN_CONFIDENCE <= confidence < 1
+    assert resolver.resolve("Journal of Applied Polymer Sci")[0] == "JOURNAL OF APPLIED POLYMER SCIENCE"
+
+def test_belowThresholdIsUnmatched(resolver):
+    journal, confidence, method = resolver.resolve("Nat")
+    assert (journal, method) == (None, None) and 0 < confidence < jr.MIN_CONFIDENCE
+    assert resolver.resolve("Totally Unknown", "1234-5678") == (None, 0.0, None)
+    assert resolver.resolve(None) == (None, 0.0, None)
+
+    strict = jr.JournalResolver(resolver.reference, minConfidence=0.95)
+    assert strict.resolve("Physical Review Letter")[0] is None
+
+def test_issnOfSeveralJournalsIsNotUsed():
+    reference = dc.JournalReference(["NATURE", "NATURE REVIEWS"], ["0028-0836", "0028-0836"])
+    assert jr.JournalResolver(reference).resolve("Unrelated", "0028-0836") == (None, 0.0, None)
+
+def test_similaritiesMatchABruteForceDiceCoefficient(resolver):
+    name = "Journal of Applied Physic"
+    trigrams = jr.getTrigrams(dc.normalizeJournalName(name))
+    expected = [2 * len(trigrams & jr.getTrigrams(dc.normalizeJournalName(journal))) /
+                (len(trigrams) + len(jr.getTrigrams(dc.normalizeJournalName(journal)))) for journal in resolver.journals]
+    assert list(resolver.similarities(name)) == pytest.approx(expected)
+
+def test_duplicatesKeepTheBestMatch(resolver):
+    matches = resolver.resolveRows(["Physical Review Letter", "Physical Review Letters", "Nature", "nature", "Nat"],
+                                   [None, None, None, None, None])
+
+    assert list(matches.columns) == jr.MATCH_COLS
+    assert list(matches["method"].fillna("unmatched")) == [jr.DUPLICATE, jr.BY_NAME, jr.BY_NAME, jr.DUPLICATE, "unmatched"]
+    assert list(matches["journal"].iloc[:4]) == ["PHYSICAL REVIEW LETTERS"] * 2 + ["NATURE"] * 2
+
+@pytest.mark.parametrize("columns, expected", [
+    (["Journal Title", "Print ISSN", "Has Access", "Comments", "Publisher"],
+     {"journal": "Journal Title", "issn": "Print ISSN", "access": "Has Access", "notes": "Comments"}),
+    # an exact alias wins over an earlier header containing one, and aliases are tried in order
+    (["Journal Title", "journal", "eISSN", "ISSN", "Access?"],
+     {"journal": "journal", "issn": "ISSN", "access": "Access?", "notes": None}),
+    (["Title of the journal", "Online ISSN", "Current access status"],
+     {"journal": "Title of the journal", "issn": "Online ISSN", "access": "Current access status", "notes": None}),
+])
+def test_findRawColumns(columns, expected):
+    assert jr.findRawColumns(columns) == expected
+
+def test_normalizeISSN():
+    assert [jr.normalizeISSN(issn) for issn in ["0028-0836", "0028 083x", "00280836", "0028-083", None, float("nan")]] == \
+           ["0028-0836", "0028-083X", "0028-0836", None, None, None]
+
+def test_cleanSheet(resolver):
+    raw = pd.DataFrame({"Journal Title": ["Nature", "Physical Review Letter", "Whatever", "Science and Society",
+                                          "Journal of Applied Polymer Science", "Unknown Title"],
+                        "ISSN": ["", "", "0021-8979", "", "", ""],
+                        "Subscribed": ["Yes", "n", "TRUE", "1.0", "maybe", "1"],
+                        "Notes": ["a", None, "", "", "", "x"]})
+    cleaned, matches = resolver.cleanSheet(raw)
+
+    assert list(cleaned.columns) == dc.COLS
+    assert list(cleaned["journal"]) == resolver.journals
+    assert list(cleaned["issn"]) == [journal["issn"] for journal in JOURNALS]
+    assert list(cleaned["access"].fillna("missing")) == ["1", "1", "0", "missing", "1"]
+    assert list(cleaned["notes"]) == ["", "a", "", "", ""]
+    assert list(matches["method"].fillna("unmatched")) == [jr.BY_NAME, jr.BY_TRIGRAM, jr.BY_ISSN, jr.BY_NAME, jr.BY_NAME,
+                                                           "unmatched"]
+    # the unreadable access value is left missing so the sheet fails the data checks
+    report = dc.validateSheet(cleaned, resolver.reference, "raw")
+    assert [failure.ref for failure in report.getFailures()] == ["hasNaN"]
+
+    cleaned, _ = resolver.cleanSheet(raw.assign(Subscribed=["Yes", "n", "TRUE", "1.0", "No", "1"]))
+    assert dc.validateSheet(cleaned, resolver.reference, "raw").passed()
+
+def test_cleanSheetWithoutJournalColumn(resolver):
+    with pytest.raises(AssertionError):
+        resolver.cleanSheet(pd.DataFrame({"ISSN": ["0028-0836"]}))
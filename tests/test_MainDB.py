@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+import pytest
+import FakeBackends as fb
+from MainDB import MainDB, MainDBSnapshot, buildSnapshot, snapshotMatchesCSV, MAIN_DB_COLS
+
+CHUNKSIZE = 7   # small enough for every university and journal to span several chunks
+
+
+def makeMainDBCSV(nUniversities=5, nJournals=12, seed=0) -> bytes:
+    """
+    returns: mainDB.csv contents with a block of nJournals rows per university and a few missing journals, issns and notes
+    """
+    rng = np.random.default_rng(seed)
+    journals = fb.makeJournals(n=nJournals, seed=seed)
+    rows = []
+    for u in range(nUniversities):
+        for journal in journals:
+            rows.append({"university": f"Uni {u}", "journal": journal["journal"], "issn": journal["issn"],
+                         "access": int(rng.integers(0, 2)), "notes": "note" if rng.random() < 0.2 else ""})
+    df = pd.DataFrame(rows, columns=MAIN_DB_COLS)
+    df.loc[[3, 20], "issn"] = ""
+    df.loc[[5], "journal"] = ""
+    return df.to_csv().encode("utf-8")
+
+def readWithPandas(content:bytes) -> pd.DataFrame:
+    from io import BytesIO
+    return pd.read_csv(BytesIO(content), index_col=0)
+
+def readBytes(path:str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@pytest.fixture
+def content():
+    return makeMainDBCSV()
+
+@pytest.fixture
+def snapshotPath(tmp_path, content):
+    path = tmp_path / "mainDB.snapshot"
+    path.write_bytes(buildSnapshot(MainDB.fromBytes(content, CHUNKSIZE)))
+    return str(path)
+
+
+@pytest.mark.parametrize("reader", ["memmap", "fromBytes"])
+def test_snapshotRoundTrip(content, snapshotPath, reader):
+    snapshot = MainDBSnapshot(snapshotPath) if reader == "memmap" else MainDBSnapshot.fromBytes(readBytes(snapshotPath))
+    if reader == "memmap":
+        assert isinstance(snapshot.getCodes("journal"), np.memmap)
+    expected = readWithPandas(content)
+    df = snapshot.toDataFrame()
+
+    assert snapshot.rows == len(expected)
+    for col in ["university", "journal", "issn"]:
+        assert list(df[col].astype(object).where(df[col].notnull(), None)) == \
+               list(expected[col].astype(object).where(expected[col].notnull(), None))
+    assert list(df["access"]) == list(expected["access"])
+    # missing values are stored as code -1, not as a dictionary entry
+    assert snapshot.getCodes("issn")[3] == -1 and snapshot.getCodes("journal")[5] == -1
+    assert "" not in snapshot.dictionaries["issn"]
+    assert snapshotMatchesCSV(MainDB.fromBytes(content, CHUNKSIZE), snapshot) == (True, [])
+
+def test_arraysAreAligned(snapshotPath):
+    from MainDB import SNAPSHOT_ALIGNMENT
+
+    snapshot = MainDBSnapshot(snapshotPath)
+    assert all(spec["offset"] % SNAPSHOT_ALIGNMENT == 0 for spec in snapshot.header["arrays"].values())
+
+@pytest.mark.parametrize("reader", ["memmap", "fromBytes"])
+def test_emptySnapshot(tmp_path, reader):
+    content = ("," + ",".join(MAIN_DB_COLS) + "\n").encode("utf-8")
+    snapshotBytes = buildSnapshot(MainDB.fromBytes(content))
+    path = tmp_path / "empty.snapshot"
+    path.write_bytes(snapshotBytes)
+    snapshot = MainDBSnapshot(str(path)) if reader == "memmap" else MainDBSnapshot.fromBytes(snapshotBytes)
+
+    assert snapshot.rows == 0
+    assert len(snapshot.toDataFrame()) == 0 and len(snapshot.getAccess()) == 0
+    assert snapshotMatchesCSV(MainDB.fromBytes(content), snapshot) == (True, [])
+
+def test_mismatchIsDetected(content, snapshotPath):
+    snapshot = MainDBSnapshot(snapshotPath)
+    df = readWithPandas(content)
+
+    changed = df.copy()
+    changed.loc[9, "access"] = 1 - changed.loc[9, "access"]
+    changed.loc[15, "journal"] = "ANOTHER JOURNAL"
+    isConsistent, problems = snapshotMatchesCSV(MainDB.fromBytes(changed.to_csv().encode("utf-8"), CHUNKSIZE), snapshot)
+    assert not isConsistent
+    assert problems == ["access differs at rows [9]", "journal differs at rows [15]"]
+
+    isConsistent, problems = snapshotMatchesCSV(MainDB.fromBytes(df.iloc[:-1].to_csv().encode("utf-8"), CHUNKSIZE), snapshot)
+    assert not isConsistent and "rows" in problems[-1]
+    isConsistent, problems = snapshotMatchesCSV(MainDB.fromBytes(content + content.split(b"\n", 1)[1], CHUNKSIZE), snapshot)
+    assert not isConsistent and "more rows" in problems[-1]
+
+def test_badMagicIsRejected(snapshotPath):
+    with pytest.raises(ValueError):
+        MainDBSnapshot.fromBytes(b"NOTADB00" + readBytes(snapshotPath)[8:])
+
+
+@pytest.mark.parametrize("by", ["university", "journal", "issn"])
+def test_countAccessMatchesPandas(content, by):
+    df = readWithPandas(content)
+    grouped = df.groupby(by)["access"]
+    expected = pd.DataFrame({"listed": grouped.size(), "withAccess": grouped.sum()}).astype("int64")
+    counts = MainDB.fromBytes(content, CHUNKSIZE).countAccess(by)
+
+    assert counts.index.name == by
+    pd.testing.assert_frame_equal(counts.sort_index(), expected.sort_index(), check_names=False, check_index_type=False)
+
+def test_accessRates(content):
+    df = readWithPandas(content)
+    mainDB = MainDB.fromBytes(content, CHUNKSIZE)
+
+    assert mainDB.accessRateByUniversity().to_dict() == pytest.approx(df.groupby("university")["access"].mean().to_dict())
+    assert mainDB.coverageByISSN().to_dict() == pytest.approx(df.groupby("issn")["access"].mean().to_dict())
+
+def test_universitiesWithAccess(content):
+    df = readWithPandas(content)
+    mainDB = MainDB.fromBytes(content, CHUNKSIZE)
+
+    for journal in df["journal"].dropna().unique():
+        expected = list(df[(df["journal"] == journal) & (df["access"] == 1)]["university"].unique())
+        assert mainDB.universitiesWithAccess(journal) == expected
+    assert mainDB.universitiesWithAccess("NOT A JOURNAL") == []
+    assert mainDB.getUniversities() == list(df["university"].unique())
+
+def test_readMergesCategoriesAcrossChunks(content):
+    expected = readWithPandas(content)
+    df = MainDB.fromBytes(content, CHUNKSIZE).read()
+
+    assert [str(df[col].dtype) for col in MAIN_DB_COLS] == ["category", "category", "category", "int8", "string"]
+    for col in MAIN_DB_COLS:
+        assert list(df[col].astype(object).where(df[col].notnull(), None)) == \
+               list(expected[col].astype(object).where(expected[col].notnull(), None))
+    assert list(MainDB.fromBytes(content, CHUNKSIZE).read(["journal"]).columns) == ["journal"]
+
+def test_readEmptyDB():
+    df = MainDB.fromBytes(("," + ",".join(MAIN_DB_COLS) + "\n").encode("utf-8"), CHUNKSIZE).read()
+    assert len(df) == 0 and [str(df[col].dtype) for col in MAIN_DB_COLS] == ["category", "category", "category", "int8", "string"]
@@ -0,0 +1,44 @@
+import GoogleDriveSheets as gds
+from Metrics import RunMetrics, metrics
+
+
+class FakeResponse:
+
+    def __init__(self, body):
+        self.body = body
+
+    def json(self):
+        return self.body
+
+class FakeSheetsClient:
+
+    def __init__(self, valueRanges):
+        self.valueRanges = valueRanges
+
+    def request(self, method, url, params=None):
+        return FakeResponse({"valueRanges": [{"values": values} for values in self.valueRanges]})
+
+
+def test_timerRecordsFieldsAndErrors():
+    runMetrics = RunMetrics()
+    with runMetrics.timer("stage", rows=3) as event:
+        event["bytes"] = 10
+    try:
+        with runMetrics.timer("stage"):
+            raise ValueError()
+    except ValueError:
+        pass
+
+    summary = runMetrics.summary()["stage"]
+    assert (summary["calls"], summary["errors"], summary["rows"], summary["bytes"]) == (2, 1, 3, 10)
+
+def test_batchGetValuesRecordsBytes():
+    metrics.reset()
+    client = FakeSheetsClient([[["journal", "JOURNAL A", "JOURNAL B"], ["access", 1, 0]]])
+    handler = gds.Handler("creds.json", "client_secrets.json", None)
+    values = handler.batchGetValues(client, "sheet1", ["A:ZZ"])
+
+    assert values == [[["journal", "JOURNAL A", "JOURNAL B"], ["access", 1, 0]]]
+    event = [event for event in metrics.events if event["event"] == "sheets.batchGetValues"][-1]
+    assert event["bytes"] == len("journalJOURNAL AJOURNAL Baccess10")
+    assert event["sheetID"] == "sheet1"
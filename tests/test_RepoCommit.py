@@ -0,0 +1,69 @@
+import FakeBackends as fb
+from RepoCommit import RepoCommit, gitBlobSHA
+
+
+def makeRepo():
+    return fb.FakeRepo({"data/a.csv": b"a\n", "data/b.csv": b"b\n"})
+
+
+def test_pushCommitsEveryStagedFileAtOnce():
+    repo = makeRepo()
+    repoCommit = RepoCommit(repo, "main")
+    commits = len(repo.gitCommits)
+    repoCommit.add("data/a.csv", "a\n1\n")
+    repoCommit.add("data/c.csv", b"\xff\x00binary")
+    sha = repoCommit.push("two files")
+
+    assert len(repo.gitCommits) == commits + 1
+    assert repo.get_git_ref("heads/main").object.sha == sha
+    assert repo.files["data/a.csv"] == b"a\n1\n"
+    assert repo.files["data/c.csv"] == b"\xff\x00binary"
+    assert repo.files["data/b.csv"] == b"b\n"
+
+def test_unchangedFilesAreNotUploaded():
+    repo = makeRepo()
+    repoCommit = RepoCommit(repo, "main")
+    head = repoCommit.parent.sha
+    repoCommit.add("data/a.csv", "a\n")
+
+    assert repoCommit.getChanged() == {}
+    assert repoCommit.push("nothing") == head
+
+def test_removeDeletesTheFileInTheSameCommit():
+    repo = makeRepo()
+    repoCommit = RepoCommit(repo, "main")
+    repoCommit.add("data/a.csv", "a\n2\n")
+    repoCommit.remove("data/b.csv")
+    repoCommit.remove("data/missing.csv")
+    repoCommit.push("update a, remove b")
+
+    assert "data/b.csv" not in repo.files
+    assert repo.files["data/a.csv"] == b"a\n2\n"
+    assert not repoCommit.exists("data/b.csv")
+
+def test_readReturnsStagedContent():
+    repo = makeRepo()
+    repoCommit = RepoCommit(repo, "main")
+    assert repoCommit.read("data/a.csv") == b"a\n"
+    repoCommit.add("data/a.csv", "new\n")
+    assert repoCommit.read("data/a.csv") == b"new\n"
+
+def test_gitBlobSHA():
+    assert gitBlobSHA(b"") == "e69de29bb2d1d6434b8b29ae775ad8c2e48c5391"
+
+def test_existsCountsStagedFiles():
+    repoCommit = RepoCommit(makeRepo(), "main")
+    assert not repoCommit.exists("data/c.csv")
+    repoCommit.add("data/c.csv", "c\n")
+    assert repoCommit.exists("data/c.csv")
+    repoCommit.remove("data/a.csv")
+    assert not repoCommit.exists("data/a.csv")
+
+def test_addNewUniToRepoRefusesAPathStagedInTheSameRun():
+    import pandas as pd
+    import testMainDebug as tm
+
+    repoCommit = RepoCommit(makeRepo(), "main")
+    df = pd.DataFrame({"journal": ["J"], "issn": ["0317-8471"], "access": ["1"], "notes": [""]})
+    assert tm.addNewUniToRepo(repoCommit, df, "data/from-GDrive/U.csv")
+    assert not tm.addNewUniToRepo(repoCommit, df, "data/from-GDrive/U.csv")
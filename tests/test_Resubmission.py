@@ -0,0 +1,161 @@
+import json
+import pandas as pd
+import pytest
+import StateStore as ss
+import testMainDebug as tm
+import Watch
+from AccessIndex import AccessIndex
+from RepoCommit import RepoCommit
+from conftest import makeSheet, editSheet, readMainDB
+
+
+def flipAccess(records, rows):
+    records = [dict(record) for record in records]
+    for row in rows:
+        records[row]["access"] = 1 - int(records[row]["access"])
+    return records
+
+
+def test_upsertRowsInCSV():
+    csv = ",university,journal,issn,access,notes\n0,U,J1,1,1,\n1,U,J2,2,0,\n2,V,J1,1,1,\n3,U,J1,1,1,\n"
+    df = tm.addUniCol("U", pd.DataFrame({"journal": ["J1", "J3"], "issn": ["1", "3"], "access": ["0", "1"],
+                                          "notes": ["", "n"]}).astype("string"))
+    updated, changes = tm.upsertRowsInCSV(csv, {"U": df})
+
+    assert updated == ",university,journal,issn,access,notes\n0,U,J1,1,0,\n2,V,J1,1,1,\n4,U,J3,3,1,n\n"
+    assert changes == [{"university": "U", "updated": {"J1": {"access": ["1", "0"]}}, "added": ["J3"],
+                        "removed": ["J2"], "repeatedRowsRemoved": 1}]
+    assert tm.upsertRowsInCSV(updated, {"U": df}) == (updated, [])
+
+def test_resubmittedSheetOnlyChangesItsRows(handler, journals):
+    handler.addSheet("sA", "Uni A", tm.FOLDER_CLEANED_ID, makeSheet(journals, 1))
+    handler.addSheet("sB", "Uni B", tm.FOLDER_CLEANED_ID, makeSheet(journals, 2))
+    assert sorted(Watch.runOnce(handler)) == ["sA", "sB"]
+    before = readMainDB(handler)
+
+    editSheet(handler, "sA", flipAccess(makeSheet(journals, 1), [0, 7]))
+    assert Watch.runOnce(handler) == ["sA"]
+    after = readMainDB(handler)
+
+    assert list(after.index) == list(before.index)
+    assert (after != before).any(axis=1).sum() == 2
+    changes = [json.loads(line) for line in handler.repo.files[tm.MAIN_DB_CHANGELOG_PATH].decode().splitlines()]
+    assert [(change["sheetID"], len(change["updated"])) for change in changes] == [("sA", 2)]
+    # already in SheetsUpdatedToRepo, not appended again
+    assert sorted(row[0] for row in handler.sheets[tm.SHEETS_IN_REPO_FILE_ID].get_all_values()[1:]) == ["sA", "sB"]
+
+def test_unchangedResubmissionIsNotCommitted(handler, journals):
+    handler.addSheet("sA", "Uni A", tm.FOLDER_CLEANED_ID, makeSheet(journals, 1))
+    Watch.runOnce(handler)
+    commits = len(handler.repo.gitCommits)
+
+    editSheet(handler, "sA", makeSheet(journals, 1))
+    assert Watch.runOnce(handler) == []
+    assert len(handler.repo.gitCommits) == commits
+
+def test_resubmissionWhoseCommitFailsIsRetried(handler, journals, monkeypatch):
+    handler.addSheet("sA", "Uni A", tm.FOLDER_CLEANED_ID, makeSheet(journals, 1))
+    Watch.runOnce(handler)
+
+    editSheet(handler, "sA", flipAccess(makeSheet(journals, 1), [3]))
+    push = RepoCommit.push
+    def failingPush(self, message):
+        raise RuntimeError("GitHub unavailable")
+    monkeypatch.setattr(RepoCommit, "push", failingPush)
+    assert Watch.runOnce(handler) == []
+
+    monkeypatch.setattr(RepoCommit, "push", push)
+    assert Watch.runOnce(handler) == ["sA"]   # no new change on Drive
+    assert readMainDB(handler)["access"].iloc[3] == str(1 - int(makeSheet(journals, 1)[3]["access"]))
+
+@pytest.mark.parametrize("edited", [True, False])
+def test_renamedResubmissionMovesItsRows(handler, journals, edited):
+    handler.addSheet("s1", "Uni 1", tm.FOLDER_CLEANED_ID, makeSheet(journals, 1))
+    handler.addSheet("s2", "Uni 2", tm.FOLDER_CLEANED_ID, makeSheet(journals, 2))
+    Watch.runOnce(handler)
+
+    if edited:
+        editSheet(handler, "s1", flipAccess(makeSheet(journals, 1), [4]))
+    handler.driveService.modifyFile("s1", name="Uni One")
+    assert Watch.runOnce(handler) == ["s1"]
+
+    mainDB = readMainDB(handler)
+    assert mainDB["university"].value_counts().to_dict() == {"Uni One": len(journals), "Uni 2": len(journals)}
+    assert "data/from-GDrive/Uni 1.csv" not in handler.repo.files
+    assert "data/from-GDrive/Uni One.csv" in handler.repo.files
+    assert tm.getUpdatedSheets(handler)["s1"] == "Uni One"
+    store = ss.StateStore(tm.STATE_DB_PATH)
+    assert store.getMergedByName("Uni One") == ["s1"] and store.getMergedByName("Uni 1") == []
+    store.close()
+    index = AccessIndex.fromBytes(handler.repo.files[tm.ACCESS_INDEX_PATH])
+    assert sorted(index.universities) == ["Uni 2", "Uni One"]
+
+def test_resubmissionRenamedLikeAnotherUniversityIsRefused(handler, journals):
+    handler.addSheet("s1", "Uni 1", tm.FOLDER_CLEANED_ID, makeSheet(journals, 1))
+    handler.addSheet("s2", "Uni 2", tm.FOLDER_CLEANED_ID, makeSheet(journals, 2))
+    Watch.runOnce(handler)
+    before = handler.repo.files[tm.MAIN_DB_PATH]
+
+    handler.driveService.modifyFile("s1", name="Uni 2")
+    assert Watch.runOnce(handler) == []
+    assert handler.repo.files[tm.MAIN_DB_PATH] == before
+    assert "data/from-GDrive/Uni 1.csv" in handler.repo.files
+
+def test_twoNewSheetsWithTheSameNameInOneRun(handler, journals):
+    handler.addSheet("s1", "Uni A", tm.FOLDER_CLEANED_ID, makeSheet(journals, 1))
+    handler.addSheet("s2", "Uni A", tm.FOLDER_BYHAND_ID, makeSheet(journals, 2))
+    merged = Watch.runOnce(handler)
+
+    assert len(merged) == 1
+    assert (readMainDB(handler)["university"] == "Uni A").sum() == len(journals)
+
+def test_newSheetNamedLikeASeededUniversityIsRefused(handler, journals, pipelineFiles):
+    handler.addSheet("old", "Uni A", tm.FOLDER_CLEANED_ID, makeSheet(journals, 1))
+    Watch.runOnce(handler)
+    before = handler.repo.files[tm.MAIN_DB_PATH]
+    # the state store is lost, the university is only known from SheetsUpdatedToRepo
+    (pipelineFiles / "sheetState.db").unlink()
+    handler.addSheet("new", "Uni A", tm.FOLDER_CLEANED_ID, makeSheet(journals, 2))
+
+    assert Watch.runOnce(handler) == []
+    assert handler.repo.files[tm.MAIN_DB_PATH] == before
+    store = ss.StateStore(tm.STATE_DB_PATH)
+    assert store.get("old")["name"] == "Uni A"
+    assert store.get("new")["outcome"] == ss.FAILED
+    store.close()
+
+def test_newSheetWhoseCsvExistsIsRefused(handler, journals):
+    handler.repo.files["data/from-GDrive/Uni A.csv"] = b",journal,issn,access,notes\n"
+    handler.addSheet("s1", "Uni A", tm.FOLDER_CLEANED_ID, makeSheet(journals, 1))
+
+    assert Watch.runOnce(handler) == []
+    assert len(readMainDB(handler)) == 0
+
+@pytest.mark.parametrize("names", [{"s1": "Uni A"}, ["s1"]])
+def test_seedFromTrackingSheet(tmp_path, names):
+    store = ss.StateStore(str(tmp_path / "state.db"))
+    store.seedFromTrackingSheet(names)
+    assert store.isProcessed("s1")
+    assert store.getMergedByName("Uni A") == (["s1"] if isinstance(names, dict) else [])
+    store.seedFromTrackingSheet({"s1": "Uni A"})
+    assert store.getMergedByName("Uni A") == ["s1"]
+    store.close()
+
+def test_blankNamesInTheTrackingSheetAreReadOnce(handler, tmp_path):
+    handler.sheets[tm.SHEETS_IN_REPO_FILE_ID].append_rows([["s1", "Uni A"], ["s2", ""]])
+    store = ss.StateStore(str(tmp_path / "state.db"))
+
+    reads = []
+    for _ in range(3):
+        before = handler.sheetReads
+        tm.seedStateStore(handler, store)
+        reads.append(handler.sheetReads - before)
+    assert reads == [1, 0, 0]
+    assert store.getMergedByName("Uni A") == ["s1"] and store.isProcessed("s2")
+
+    # once the tracking sheet changes it is read again
+    handler.driveService.modifyFile(tm.SHEETS_IN_REPO_FILE_ID)
+    before = handler.sheetReads
+    tm.seedStateStore(handler, store)
+    assert handler.sheetReads - before == 1
+    store.close()
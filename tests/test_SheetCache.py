@@ -0,0 +1,56 @@
+import os
+import numpy as np
+import pandas as pd
+import testMainDebug as tm
+from SheetCache import SheetCache
+from conftest import makeSheet, editSheet
+
+COLUMNS = {"journal": ["J1", "J2"], "issn": ["0317-8471", "2434-561X"], "access": [1, 0], "notes": ["", "n"]}
+
+
+def test_putThenGet(tmp_path):
+    cache = SheetCache(str(tmp_path))
+    assert cache.get("f1", "v1") is None
+    cache.put("f1", "v1", COLUMNS)
+    columns = cache.get("f1", "v1")
+
+    assert list(columns) == list(COLUMNS)
+    assert list(columns["issn"]) == COLUMNS["issn"]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_newVersionReplacesTheOldOne(tmp_path):
+    cache = SheetCache(str(tmp_path))
+    cache.put("f1", "v1", COLUMNS)
+    cache.put("f1", "v2", COLUMNS)
+
+    assert cache.get("f1", "v1") is None
+    assert cache.get("f1", "v2") is not None
+    assert cache.getStats()["entries"] == 1
+
+def test_leastRecentlyUsedEntriesAreEvicted(tmp_path):
+    cache = SheetCache(str(tmp_path))
+    for i, fileID in enumerate(["f1", "f2", "f3"]):
+        cache.put(fileID, "v1", COLUMNS)
+        os.utime(cache.getEntryPath(fileID, "v1"), (i, i))
+    cache.maxBytes = cache.getStats()["bytes"] - 1
+    cache.evict()
+
+    assert cache.evictions == 1
+    assert cache.get("f1", "v1") is None
+    assert cache.get("f2", "v1") is not None and cache.get("f3", "v1") is not None
+
+def test_handlerReadsASheetOncePerVersion(handler, journals):
+    handler.addSheet("s1", "Uni 1", tm.FOLDER_CLEANED_ID, makeSheet(journals, 1))
+    first = pd.DataFrame(handler.getSheetsDataCached("s1"))
+    second = pd.DataFrame(handler.getSheetsDataCached("s1"))
+
+    assert handler.sheetReads == 1
+    assert first.equals(second)
+    assert len(first) == len(journals)
+
+    editSheet(handler, "s1", makeSheet(journals, 2))
+    third = pd.DataFrame(handler.getSheetsDataCached("s1"))
+    assert handler.sheetReads == 2
+    assert np.array_equal(third["access"].astype(int), [record["access"] for record in makeSheet(journals, 2)])
+    # the cache lives in the directory the handler was given
+    assert handler.getSheetCache().cacheDir == handler.cacheDir and os.listdir(handler.cacheDir)
@@ -0,0 +1,93 @@
+import json
+import pytest
+import StateStore as ss
+import testMainDebug as tm
+import Watch
+from conftest import makeSheet, readMainDB
+
+
+def failReadsOf(handler, monkeypatch, sheetID, times=1):
+    """
+    Makes the next times Sheets reads of sheetID raise, as a network error would
+    """
+    batchGetValues = handler.batchGetValues
+    failures = {"left": times}
+    def flakyBatchGetValues(client, readID, ranges, majorDimension="COLUMNS"):
+        if readID == sheetID and failures["left"] > 0:
+            failures["left"] -= 1
+            raise ConnectionError("connection reset")
+        return batchGetValues(client, readID, ranges, majorDimension)
+    monkeypatch.setattr(handler, "batchGetValues", flakyBatchGetValues)
+
+
+def test_firstRunListsEveryFolderThenFollowsTheFeed(handler, journals):
+    handler.addSheet("s1", "Uni 1", tm.FOLDER_CLEANED_ID, makeSheet(journals, 1))
+    assert Watch.runOnce(handler) == ["s1"]
+
+    reads = handler.sheetReads
+    assert Watch.runOnce(handler) == []
+    assert handler.sheetReads == reads   # nothing changed, nothing read
+
+    handler.addSheet("s2", "Uni 2", tm.FOLDER_BYHAND_ID, makeSheet(journals, 2))
+    handler.addSheet("raw", "raw file", tm.FOLDER_RAW_ID, makeSheet(journals, 3))
+    assert Watch.runOnce(handler) == ["s2"]
+    assert set(readMainDB(handler)["university"]) == {"Uni 1", "Uni 2"}
+
+def test_unreadableSheetIsRetriedOnTheNextRun(handler, journals, monkeypatch):
+    Watch.runOnce(handler)
+    handler.addSheet("s1", "Uni 1", tm.FOLDER_CLEANED_ID, makeSheet(journals, 1))
+    failReadsOf(handler, monkeypatch, "s1")
+
+    assert Watch.runOnce(handler) == []
+    store = ss.StateStore(tm.STATE_DB_PATH)
+    assert list(json.loads(store.getMeta(Watch.RETRY_SHEETS_KEY))) == ["s1"]
+    store.close()
+
+    assert Watch.runOnce(handler) == ["s1"]   # the page token moved past the change, s1 comes from the retry list
+    store = ss.StateStore(tm.STATE_DB_PATH)
+    assert json.loads(store.getMeta(Watch.RETRY_SHEETS_KEY)) == {}
+    store.close()
+
+def test_failedSheetIsRetriedOnceFixed(handler, journals):
+    Watch.runOnce(handler)
+    handler.addSheet("s1", "Uni 1", tm.FOLDER_CLEANED_ID, makeSheet(journals, 1, "badChecksum"))
+    assert Watch.runOnce(handler) == []
+
+    from conftest import editSheet
+    editSheet(handler, "s1", makeSheet(journals, 1))
+    assert Watch.runOnce(handler) == ["s1"]
+
+def test_watchKeepsGoingAfterAFailedRun(handler, journals, monkeypatch):
+    handler.addSheet("s1", "Uni 1", tm.FOLDER_CLEANED_ID, makeSheet(journals, 1))
+    listChanges = handler.listChanges
+    calls = {"n": 0}
+    def failingOnce(*args, **kwargs):
+        calls["n"] += 1
+        if calls["n"] == 1:
+            raise ConnectionError("Drive unavailable")
+        return listChanges(*args, **kwargs)
+    monkeypatch.setattr(handler, "listChanges", failingOnce)
+    Watch.runOnce(handler)   # full scan, saves the page token
+
+    handler.addSheet("s2", "Uni 2", tm.FOLDER_CLEANED_ID, makeSheet(journals, 2))
+    sleeps = {"n": 0}
+    def stopAfterTwoRuns(seconds):
+        sleeps["n"] += 1
+        if sleeps["n"] == 2:
+            raise KeyboardInterrupt()
+    monkeypatch.setattr(Watch.time, "sleep", stopAfterTwoRuns)
+    with pytest.raises(KeyboardInterrupt):
+        Watch.watch(handler, interval=0)
+
+    assert calls["n"] == 2
+    assert set(readMainDB(handler)["university"]) == {"Uni 1", "Uni 2"}
+
+def test_scheduledRunFailsWhenTheRunFails(handler, monkeypatch):
+    def failing(*args, **kwargs):
+        raise ConnectionError("Drive unavailable")
+    monkeypatch.setattr(Watch, "runOnce", failing)
+
+    with pytest.raises(ConnectionError):
+        Watch.watch(handler, interval=0, runs=1)
+    report = [json.loads(line) for line in open(tm.RUN_REPORT_PATH)]
+    assert [event["detail"] for event in report if event["event"] == "failure"] == [["ConnectionError", "Drive unavailable"]]